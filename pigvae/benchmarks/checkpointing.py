@@ -0,0 +1,85 @@
+import time
+from argparse import ArgumentParser
+import torch
+from pigvae.graph_transformer import Transformer
+from pigvae.benchmarks.harness import zero_grads, peak_rss_bytes, run_isolated
+
+
+def measure(config, batch_size, num_nodes, checkpoint_every, device="cpu", repeats=3):
+    """
+    Peak memory and speed of a forward and backward pass of a Transformer. On CUDA the peak is taken from
+    the allocator, on CPU from the peak resident set size, so every measurement has to run in a fresh
+    process (see run).
+    """
+    torch.manual_seed(0)
+    model = Transformer(checkpoint_every=checkpoint_every, **config).to(device).train()
+    x = torch.randn(batch_size, num_nodes, num_nodes, config["hidden_dim"], device=device)
+    mask = torch.ones(batch_size, num_nodes, num_nodes, dtype=torch.bool, device=device)
+    zero_grads(model)
+    if device == "cuda":
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        start_bytes = torch.cuda.memory_allocated()
+    else:
+        start_bytes = peak_rss_bytes()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model(x, mask).sum().backward()
+        if device == "cuda":
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - start)
+    if device == "cuda":
+        peak_bytes = torch.cuda.max_memory_allocated() - start_bytes
+    else:
+        peak_bytes = peak_rss_bytes() - start_bytes
+    return {
+        "batch_size": batch_size,
+        "num_nodes": num_nodes,
+        "checkpoint_every": checkpoint_every,
+        "peak_mb": peak_bytes / 2 ** 20,
+        "graphs_per_s": batch_size / min(times),
+    }
+
+
+def run(config, batch_size, num_nodes, checkpoint_everys=(0, 1, 2, 4), device="cpu", repeats=3):
+    return list(run_isolated(measure, [
+        dict(config=config, batch_size=batch_size, num_nodes=num_nodes, checkpoint_every=checkpoint_every,
+             device=device, repeats=repeats)
+        for checkpoint_every in checkpoint_everys]))
+
+
+def main():
+    parser = ArgumentParser(description="Activation memory and throughput of Transformer checkpointing")
+    parser.add_argument("--hidden_dim", default=256, type=int)
+    parser.add_argument("--k_dim", default=64, type=int)
+    parser.add_argument("--num_heads", default=16, type=int)
+    parser.add_argument("--ppf_hidden_dim", default=1024, type=int)
+    parser.add_argument("--num_layers", default=16, type=int)
+    parser.add_argument("--batch_size", default=4, type=int)
+    parser.add_argument("--num_nodes", default=32, type=int)
+    parser.add_argument("--checkpoint_every", nargs="+", default=[0, 1, 2, 4], type=int)
+    parser.add_argument("--memory_budget_gb", default=16, type=float)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu", type=str)
+    parser.add_argument("--repeats", default=3, type=int)
+    args = parser.parse_args()
+    config = {
+        "hidden_dim": args.hidden_dim,
+        "k_dim": args.k_dim,
+        "v_dim": args.k_dim,
+        "num_heads": args.num_heads,
+        "ppf_hidden_dim": args.ppf_hidden_dim,
+        "num_layers": args.num_layers
+    }
+    results = run(config, args.batch_size, args.num_nodes, args.checkpoint_every, args.device, args.repeats)
+    print("{:>6} {:>10} {:>10} {:>8} {:>10}".format("every", "peak MB", "graphs/s", "memory", "max batch"))
+    for r in results:
+        # activation memory grows linearly with the batch size
+        max_batch_size = int(args.memory_budget_gb * 2 ** 10 / r["peak_mb"] * r["batch_size"])
+        print("{:>6} {:>10.0f} {:>10.1f} {:>7.2f}x {:>10}".format(
+            r["checkpoint_every"], r["peak_mb"], r["graphs_per_s"], r["peak_mb"] / results[0]["peak_mb"],
+            max_batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+from argparse import ArgumentParser
+import numpy as np
+import torch
+from networkx.algorithms.shortest_paths.dense import floyd_warshall_numpy
+from pigvae.synthetic_graphs.data import DenseGraphBatch, GraphGenerator
+from pigvae.benchmarks.harness import timeit
+
+
+def networkx_edge_features(graphs, max_distance=5):
+    """Reference edge features: per-graph networkx Floyd-Warshall, clamped and one-hot encoded."""
+    max_num_nodes = max([graph.number_of_nodes() for graph in graphs])
+    edge_features = []
+    for graph in graphs:
+        graph = graph.copy()
+        graph.add_nodes_from([i for i in range(graph.number_of_nodes(), max_num_nodes)])
+        dm = floyd_warshall_numpy(graph)
+        dm[np.isinf(dm)] = 0
+        dm = torch.from_numpy(dm).long().clamp(0, max_distance).unsqueeze(-1)
+        dm = torch.zeros((max_num_nodes, max_num_nodes, max_distance + 1)).scatter_(2, dm, 1)
+        edge_features.append(dm)
+    return torch.stack(edge_features, dim=0)
+
+
+def check_parity(graphs):
+    batch = DenseGraphBatch.from_sparse_graph_list(graphs)
+    if not torch.equal(batch.edge_features, networkx_edge_features(graphs)):
+        raise AssertionError("batched shortest paths differ from networkx Floyd-Warshall")
+
+
+def run(batch_sizes=(16, 32, 64, 128), n_maxs=(12, 20, 32, 48), repeats=5, seed=0):
+    np.random.seed(seed)
+    generator = GraphGenerator()
+    results = []
+    for n_max in n_maxs:
+        for batch_size in batch_sizes:
+            graphs = [generator(int(n)) for n in np.random.randint(n_max // 2, n_max + 1, size=batch_size)]
+            check_parity(graphs)
+            _, t_networkx = timeit(lambda: networkx_edge_features(graphs), repeats, warmup=1)
+            _, t_batched = timeit(lambda: DenseGraphBatch.from_sparse_graph_list(graphs), repeats, warmup=1)
+            results.append({
+                "n_max": n_max,
+                "batch_size": batch_size,
+                "networkx_graphs_per_s": batch_size / t_networkx,
+                "batched_graphs_per_s": batch_size / t_batched,
+                "speedup": t_networkx / t_batched,
+            })
+    return results
+
+
+def main():
+    parser = ArgumentParser(description="Collate throughput of DenseGraphBatch.from_sparse_graph_list")
+    parser.add_argument("--batch_sizes", nargs="+", default=[16, 32, 64, 128], type=int)
+    parser.add_argument("--n_maxs", nargs="+", default=[12, 20, 32, 48], type=int)
+    parser.add_argument("--repeats", default=5, type=int)
+    args = parser.parse_args()
+    torch.set_num_threads(1)  # like a single DataLoader worker
+    print("{:>6} {:>6} {:>14} {:>14} {:>8}".format("n_max", "batch", "networkx g/s", "batched g/s", "speedup"))
+    for r in run(args.batch_sizes, args.n_maxs, args.repeats):
+        print("{n_max:>6} {batch_size:>6} {networkx_graphs_per_s:>14.0f} {batched_graphs_per_s:>14.0f} "
+              "{speedup:>7.1f}x".format(**r))
+
+
+if __name__ == "__main__":
+    main()
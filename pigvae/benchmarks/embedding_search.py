@@ -0,0 +1,58 @@
+import tempfile
+from argparse import ArgumentParser
+import numpy as np
+from pigvae.embedding_store import EmbeddingStore, IVFIndex
+from pigvae.benchmarks.harness import timeit
+
+
+def clustered_embeddings(num_vectors, dim, num_clusters=256, seed=0):
+    """Gaussian mixture standing in for graph embeddings (which cluster by graph family and size)."""
+    rng = np.random.RandomState(seed)
+    centers = rng.randn(num_clusters, dim).astype(np.float32)
+    labels = rng.randint(0, num_clusters, num_vectors)
+    return centers[labels] + 0.5 * rng.randn(num_vectors, dim).astype(np.float32)
+
+
+def recall(idx, idx_exact):
+    """Fraction of the exact top-k that is found."""
+    return np.mean([len(np.intersect1d(a, b)) / len(b) for a, b in zip(idx, idx_exact)])
+
+
+def run(num_vectors=1000000, dim=64, num_queries=1000, k=10, num_lists=1024, nprobes=(1, 4, 16, 64),
+        metric="cosine", path=None):
+    path = path or tempfile.mkdtemp()
+    embeddings = clustered_embeddings(num_vectors + num_queries, dim)
+    queries, embeddings = embeddings[:num_queries], embeddings[num_queries:]
+    store = EmbeddingStore.create(path, dim, metric=metric)
+    for start in range(0, num_vectors, 1 << 16):
+        store.append(embeddings[start:start + (1 << 16)])
+    (idx_exact, _), t_exact = timeit(lambda: store.search(queries, k))
+    results = [{"method": "exact", "nprobe": None, "qps": num_queries / t_exact, "recall": 1.0}]
+    index, t_build = timeit(lambda: IVFIndex.build(store, num_lists=num_lists))
+    for nprobe in nprobes:
+        (idx, _), t = timeit(lambda: index.search(queries, k, nprobe=nprobe))
+        results.append({"method": "ivf", "nprobe": nprobe, "qps": num_queries / t, "recall": recall(idx, idx_exact)})
+    return results, t_build
+
+
+def main():
+    parser = ArgumentParser(description="Queries/s and recall@k of EmbeddingStore exact and IVF search")
+    parser.add_argument("--num_vectors", default=1000000, type=int)
+    parser.add_argument("--dim", default=64, type=int)
+    parser.add_argument("--num_queries", default=1000, type=int)
+    parser.add_argument("-k", default=10, type=int)
+    parser.add_argument("--num_lists", default=1024, type=int)
+    parser.add_argument("--nprobes", nargs="+", default=[1, 4, 16, 64], type=int)
+    parser.add_argument("--metric", default="cosine", type=str)
+    parser.add_argument("--path", default=None, type=str)
+    args = parser.parse_args()
+    results, t_build = run(args.num_vectors, args.dim, args.num_queries, args.k, args.num_lists, args.nprobes,
+                           args.metric, args.path)
+    print("IVF build {:.1f} s".format(t_build))
+    print("{:>6} {:>6} {:>10} {:>10}".format("method", "nprobe", "queries/s", "recall@{}".format(args.k)))
+    for r in results:
+        print("{:>6} {:>6} {:>10.0f} {:>10.3f}".format(r["method"], str(r["nprobe"] or "-"), r["qps"], r["recall"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import time
+from argparse import ArgumentParser
+import numpy as np
+import torch
+from pigvae.modules import GraphEncoder
+from pigvae.synthetic_graphs.data import DenseGraphBatch
+from pigvae.synthetic_graphs.hyperparameter import add_arguments
+from pigvae.benchmarks.harness import zero_grads, peak_rss_bytes, run_isolated
+
+
+def concatenated_message_matrix(encoder, node_features, edge_features, mask):
+    """Reference: fc_in applied to the concatenated pair features."""
+    node_features, edge_features, mask = encoder.add_emb_node_and_feature(node_features, edge_features, mask)
+    edge_mask = mask.unsqueeze(1) * mask.unsqueeze(2)
+    num_nodes = node_features.size(1)
+    node_features_combined = torch.cat(
+        (node_features.unsqueeze(2).repeat(1, 1, num_nodes, 1),
+         node_features.unsqueeze(1).repeat_interleave(num_nodes, dim=1)),
+        dim=-1)
+    x = torch.cat((edge_features, node_features_combined), dim=-1)
+    x = encoder.layer_norm(encoder.dropout(encoder.fc_in(x)))
+    return x, edge_mask
+
+
+def make_batch(batch_size, num_nodes, num_node_features, num_edge_features, seed=0):
+    rng = np.random.RandomState(seed)
+    dm = rng.randint(0, num_edge_features, size=(batch_size, num_nodes, num_nodes)).astype(np.uint8)
+    sizes = rng.randint(num_nodes // 2, num_nodes + 1, batch_size)
+    graph = DenseGraphBatch.from_distances(
+        torch.from_numpy(dm), torch.from_numpy(sizes), max_distance=num_edge_features - 1)
+    graph.node_features = torch.from_numpy(rng.randn(batch_size, num_nodes, num_node_features)).float()
+    return graph
+
+
+def check_parity(encoder, graph):
+    encoder.eval()
+    x, edge_mask = encoder.init_message_matrix(graph.node_features, graph.edge_features, graph.mask)
+    x_ref, edge_mask_ref = concatenated_message_matrix(encoder, graph.node_features, graph.edge_features, graph.mask)
+    if not torch.equal(edge_mask, edge_mask_ref) or not torch.allclose(x, x_ref, atol=1e-5):
+        raise AssertionError("factorized message matrix differs from the concatenated one")
+    return (x - x_ref).abs().max().item()
+
+
+def measure(hparams, batch_size, num_nodes, factorized, repeats=3):
+    """Extra peak memory (resident set size) and time of building the message matrix, forward and backward."""
+    torch.manual_seed(0)
+    encoder = GraphEncoder(hparams)
+    graph = make_batch(batch_size, num_nodes, hparams["num_node_features"], hparams["num_edge_features"])
+    fn = encoder.init_message_matrix if factorized else lambda *args: concatenated_message_matrix(encoder, *args)
+    zero_grads(encoder)
+    start_bytes = peak_rss_bytes()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        x, _ = fn(graph.node_features, graph.edge_features, graph.mask)
+        x.sum().backward()
+        times.append(time.perf_counter() - start)
+        del x
+    peak_bytes = peak_rss_bytes() - start_bytes
+    return {"factorized": factorized, "peak_mb": peak_bytes / 2 ** 20, "time_ms": 1000 * min(times)}
+
+
+def main():
+    parser = ArgumentParser(description="Parity and peak memory of the factorized GraphEncoder input projection")
+    parser = add_arguments(parser)
+    parser.add_argument("--num_nodes", default=64, type=int)
+    parser.add_argument("--repeats", default=3, type=int)
+    hparams = parser.parse_args().__dict__
+    torch.manual_seed(0)
+    for num_node_features in sorted({1, hparams["num_node_features"], 8}):
+        graph = make_batch(4, 13, num_node_features, hparams["num_edge_features"])
+        encoder = GraphEncoder({**hparams, "num_node_features": num_node_features})
+        print("num_node_features={} max abs diff {:.2e}".format(num_node_features, check_parity(encoder, graph)))
+    results = run_isolated(measure, [
+        dict(hparams=hparams, batch_size=hparams["batch_size"], num_nodes=hparams["num_nodes"],
+             factorized=factorized, repeats=hparams["repeats"])
+        for factorized in (False, True)])
+    for r in results:
+        print("{:>12} peak {:8.0f} MB {:8.1f} ms".format(
+            "factorized" if r["factorized"] else "concatenated", r["peak_mb"], r["time_ms"]))
+
+
+if __name__ == "__main__":
+    main()
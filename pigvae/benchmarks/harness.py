@@ -0,0 +1,41 @@
+import time
+import resource
+import multiprocessing
+import torch
+
+
+def zero_grads(module):
+    # gradients are allocated up front, so that only activations are measured
+    for p in module.parameters():
+        p.grad = torch.zeros_like(p)
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process. It never goes down, measure the difference to a start value."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _call(args):
+    fn, kwargs = args
+    return fn(**kwargs)
+
+
+def run_isolated(fn, kwargs_list):
+    """
+    Yields fn(**kwargs) for every kwargs of kwargs_list, each computed in a fresh spawned process, so that the
+    peak resident set size (see peak_rss_bytes) of one measurement does not include the previous ones.
+    fn has to be a module level function.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1, maxtasksperchild=1) as pool:
+        yield from pool.imap(_call, [(fn, kwargs) for kwargs in kwargs_list])
+
+
+def timeit(fn, repeats=1, warmup=0):
+    """Output of the last call of fn and its mean wall time in seconds over repeats calls after warmup calls."""
+    for _ in range(warmup):
+        fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        out = fn()
+    return out, (time.perf_counter() - start) / repeats
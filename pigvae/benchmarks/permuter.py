@@ -0,0 +1,94 @@
+import time
+from argparse import ArgumentParser
+import torch
+from pigvae.modules import Permuter, Permutation
+
+
+class TopkPermuter(Permuter):
+    """
+    Reference: reads the fill value of padded nodes back to the host (.item()), always builds the soft
+    permutation and takes the hard one from its row-wise topk.
+    """
+    def score(self, x, mask):
+        scores = self.scoring_fc(x).squeeze(-1).float()
+        fill_value = scores.min().item() - 1
+        return scores.masked_fill(~mask, fill_value)
+
+    def forward(self, node_features, mask, hard=False, tau=1.0):
+        mask = mask.bool()
+        node_features = node_features + torch.randn_like(node_features) * 0.05
+        scores = self.score(node_features, mask)
+        scores_sorted = scores.sort(dim=1, descending=True)[0]
+        pairwise_diff = (scores.unsqueeze(1) - scores_sorted.unsqueeze(2)).abs().neg() / tau
+        perm = pairwise_diff.softmax(-1)
+        if hard:
+            perm_ = torch.zeros_like(perm)
+            perm_.scatter_(-1, perm.topk(1, -1)[1], value=1)
+            perm = (perm_ - perm).detach() + perm
+        return Permutation(matrix=self.mask_perm(perm.transpose(2, 1), mask))
+
+
+def make_inputs(batch_size, num_nodes, hidden_dim, device, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    node_features = torch.randn(batch_size, num_nodes, hidden_dim, generator=generator)
+    sizes = torch.randint(num_nodes // 2, num_nodes + 1, (batch_size,), generator=generator)
+    mask = torch.arange(num_nodes).unsqueeze(0) < sizes.unsqueeze(1)
+    return node_features.to(device), mask.to(device)
+
+
+def check_parity(permuter, reference, node_features, mask):
+    for hard in (False, True):
+        for grad in (True, False):
+            with torch.set_grad_enabled(grad):
+                torch.manual_seed(0)
+                perm = permuter(node_features, mask, hard=hard)
+                torch.manual_seed(0)
+                perm_ref = reference(node_features, mask, hard=hard)
+            if not torch.allclose(perm.matrix, perm_ref.matrix, atol=1e-6):
+                raise AssertionError("permutation differs from the reference (hard={}, grad={})".format(hard, grad))
+
+
+def latency(permuter, node_features, mask, hard, grad, device, repeats):
+    """Mean seconds per call, forward only or forward and backward."""
+    def step():
+        with torch.set_grad_enabled(grad):
+            perm = permuter(node_features, mask, hard=hard)
+            if grad:
+                perm.matrix.sum().backward()
+
+    step()
+    if device == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        step()
+    if device == "cuda":
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = ArgumentParser(description="Permuter latency versus number of nodes, sync-free vs topk reference")
+    parser.add_argument("--batch_size", default=32, type=int)
+    parser.add_argument("--hidden_dim", default=256, type=int)
+    parser.add_argument("--num_nodes", default=[16, 32, 64, 128, 256], nargs="+", type=int)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu", type=str)
+    parser.add_argument("--repeats", default=20, type=int)
+    args = parser.parse_args()
+    torch.manual_seed(0)
+    permuter = Permuter({"graph_decoder_hidden_dim": args.hidden_dim}).to(args.device)
+    reference = TopkPermuter({"graph_decoder_hidden_dim": args.hidden_dim}).to(args.device)
+    reference.load_state_dict(permuter.state_dict())
+    check_parity(permuter, reference, *make_inputs(4, 13, args.hidden_dim, args.device))
+    print("{:>6} {:>16} {:>12} {:>12} {:>8}".format("N", "mode", "topk ms", "sorted ms", "speedup"))
+    for num_nodes in args.num_nodes:
+        node_features, mask = make_inputs(args.batch_size, num_nodes, args.hidden_dim, args.device)
+        for name, hard, grad in (("soft train", False, True), ("hard train", True, True),
+                                 ("hard inference", True, False)):
+            t_ref, t = [1000 * latency(p, node_features, mask, hard, grad, args.device, args.repeats)
+                        for p in (reference, permuter)]
+            print("{:>6} {:>16} {:12.3f} {:12.3f} {:7.2f}x".format(num_nodes, name, t_ref, t, t_ref / t))
+
+
+if __name__ == "__main__":
+    main()
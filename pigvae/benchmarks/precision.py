@@ -0,0 +1,79 @@
+import time
+from argparse import ArgumentParser
+import numpy as np
+import torch
+from pigvae.modules import GraphAE
+from pigvae.synthetic_graphs.data import DenseGraphBatch, GraphGenerator
+from pigvae.synthetic_graphs.hyperparameter import add_arguments
+from pigvae.synthetic_graphs.metrics import Critic
+
+DTYPES = {"bf16": torch.bfloat16, "16": torch.float16}
+
+
+def make_batch(batch_size, n_min, n_max, seed=0):
+    np.random.seed(seed)
+    generator = GraphGenerator()
+    graphs = [generator(int(n)) for n in np.random.randint(n_min, n_max + 1, size=batch_size)]
+    return DenseGraphBatch.from_sparse_graph_list(graphs)
+
+
+def step(graph_ae, critic, graph, dtype=None, device="cpu", seed=0):
+    """Loss and gradients of one training step, under autocast if dtype is given."""
+    graph_ae.zero_grad()
+    # same dropout masks and permuter noise in every precision
+    torch.manual_seed(seed)
+    with torch.autocast(device_type=device, dtype=dtype, enabled=dtype is not None):
+        graph_pred, perm, mu, logvar = graph_ae(graph, training=True, tau=1.0)
+        loss = critic(graph_true=graph, graph_pred=graph_pred, perm=perm, mu=mu, logvar=logvar)
+    loss["loss"].backward()
+    grads = torch.cat([p.grad.flatten() for p in graph_ae.parameters() if p.grad is not None])
+    return {key: value.item() for key, value in loss.items()}, grads
+
+
+def check_parity(graph_ae, critic, graph, dtype, device="cpu"):
+    """Relative difference of every loss term and cosine similarity of the gradients to fp32."""
+    loss_ref, grads_ref = step(graph_ae, critic, graph, None, device)
+    loss, grads = step(graph_ae, critic, graph, dtype, device)
+    parity = {key: abs(loss[key] - loss_ref[key]) / max(abs(loss_ref[key]), 1e-8) for key in loss_ref}
+    parity["grad_cosine"] = torch.nn.functional.cosine_similarity(grads, grads_ref, dim=0).item()
+    return parity
+
+
+def throughput(graph_ae, critic, graph, dtype=None, device="cpu", repeats=5):
+    step(graph_ae, critic, graph, dtype, device)
+    if device == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        step(graph_ae, critic, graph, dtype, device)
+    if device == "cuda":
+        torch.cuda.synchronize()
+    return graph.mask.size(0) * repeats / (time.perf_counter() - start)
+
+
+def main():
+    parser = ArgumentParser(description="Loss parity and throughput of reduced precision training steps")
+    parser = add_arguments(parser)
+    parser.add_argument("--dtype", default="bf16", type=str)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu", type=str)
+    parser.add_argument("--repeats", default=5, type=int)
+    parser.add_argument("--tolerance", default=0.05, type=float)
+    hparams = parser.parse_args()
+    dtype = DTYPES[hparams.dtype]
+    graph_ae = GraphAE(hparams.__dict__).to(hparams.device).train()
+    critic = Critic(hparams.__dict__)
+    graph = make_batch(hparams.batch_size, hparams.n_min, hparams.n_max).to(hparams.device)
+
+    parity = check_parity(graph_ae, critic, graph, dtype, hparams.device)
+    for key, value in parity.items():
+        print("{:>16} {:.4f}".format(key, value))
+    fp32 = throughput(graph_ae, critic, graph, None, hparams.device, hparams.repeats)
+    reduced = throughput(graph_ae, critic, graph, dtype, hparams.device, hparams.repeats)
+    print("fp32 {:.1f} graphs/s, {} {:.1f} graphs/s ({:.2f}x)".format(
+        fp32, hparams.dtype, reduced, reduced / fp32))
+    if parity["loss"] > hparams.tolerance or parity["grad_cosine"] < 1 - hparams.tolerance:
+        raise AssertionError("{} loss differs from fp32 by more than {}".format(hparams.dtype, hparams.tolerance))
+
+
+if __name__ == "__main__":
+    main()
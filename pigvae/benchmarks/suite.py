@@ -0,0 +1,273 @@
+import sys
+import json
+import time
+import platform
+from argparse import ArgumentParser
+import numpy as np
+import torch
+from pigvae.graph_transformer import Transformer
+from pigvae.modules import GraphEncoder, GraphDecoder, Permuter
+from pigvae.synthetic_graphs.data import DenseGraphBatch, GraphGenerator
+from pigvae.synthetic_graphs.generators import BatchedGraphGenerator
+from pigvae.synthetic_graphs.hyperparameter import add_arguments
+from pigvae.synthetic_graphs.metrics import Critic
+from pigvae.benchmarks.encoder_input import make_batch
+from pigvae.benchmarks.harness import zero_grads, peak_rss_bytes, run_isolated
+
+
+def model_hparams(hidden_dim, num_heads, num_layers):
+    """Default hyperparameters with the width, heads and depth of encoder and decoder replaced."""
+    hparams = add_arguments(ArgumentParser()).parse_args([]).__dict__
+    for prefix in ("graph_encoder", "graph_decoder"):
+        hparams.update({
+            prefix + "_hidden_dim": hidden_dim,
+            prefix + "_k_dim": hidden_dim // num_heads,
+            prefix + "_v_dim": hidden_dim // num_heads,
+            prefix + "_num_heads": num_heads,
+            prefix + "_ppf_hidden_dim": 4 * hidden_dim,
+            prefix + "_num_layers": num_layers,
+        })
+    hparams["vae"] = True
+    return hparams
+
+
+def transformer_step(batch_size, num_nodes, num_heads, num_layers, hidden_dim):
+    model = Transformer(hidden_dim, hidden_dim // num_heads, hidden_dim // num_heads, num_heads, 4 * hidden_dim,
+                        num_layers).train()
+    x = torch.randn(batch_size, num_nodes, num_nodes, hidden_dim)
+    mask = torch.ones(batch_size, num_nodes, num_nodes, dtype=torch.bool)
+    zero_grads(model)
+    return lambda: model(x, mask).sum().backward()
+
+
+def encoder_step(batch_size, num_nodes, num_heads, num_layers, hidden_dim):
+    hparams = model_hparams(hidden_dim, num_heads, num_layers)
+    model = GraphEncoder(hparams).train()
+    graph = make_batch(batch_size, num_nodes, hparams["num_node_features"], hparams["num_edge_features"])
+    zero_grads(model)
+
+    def step():
+        graph_emb, node_features = model(graph.node_features, graph.edge_features, graph.mask)
+        (graph_emb.sum() + node_features.sum()).backward()
+    return step
+
+
+def decoder_step(batch_size, num_nodes, num_heads, num_layers, hidden_dim):
+    hparams = model_hparams(hidden_dim, num_heads, num_layers)
+    model = GraphDecoder(hparams).train()
+    graph_emb = torch.randn(batch_size, hidden_dim)
+    mask = make_batch(batch_size, num_nodes, 1, hparams["num_edge_features"]).mask
+    perm = Permuter(hparams)(torch.randn(batch_size, num_nodes, hidden_dim), mask).matrix.detach()
+    zero_grads(model)
+
+    def step():
+        node_logits, edge_logits = model(graph_emb, perm, mask)
+        (node_logits.sum() + edge_logits.sum()).backward()
+    return step
+
+
+def permuter_step(batch_size, num_nodes, hidden_dim):
+    model = Permuter({"graph_decoder_hidden_dim": hidden_dim}).train()
+    node_features = torch.randn(batch_size, num_nodes, hidden_dim, requires_grad=True)
+    mask = make_batch(batch_size, num_nodes, 1, 2).mask
+    zero_grads(model)
+    return lambda: model(node_features, mask, hard=True).matrix.sum().backward()
+
+
+def critic_step(batch_size, num_nodes, hidden_dim):
+    hparams = model_hparams(hidden_dim, 4, 1)
+    critic = Critic(hparams)
+    graph = make_batch(batch_size, num_nodes, hparams["num_node_features"], hparams["num_edge_features"])
+    edge_logits = torch.randn(graph.edge_features.shape, requires_grad=True)
+    props = torch.randn(batch_size, requires_grad=True)
+    mu = torch.randn(batch_size, hparams["emb_dim"], requires_grad=True)
+    logvar = torch.randn(batch_size, hparams["emb_dim"], requires_grad=True)
+    perm = Permuter(hparams)(torch.randn(batch_size, num_nodes, hidden_dim), graph.mask).matrix
+    perm = perm.detach().requires_grad_()
+
+    def step():
+        graph_pred = DenseGraphBatch(node_features=None, edge_features=edge_logits, mask=graph.mask,
+                                     properties=props)
+        critic(graph_true=graph, graph_pred=graph_pred, perm=perm, mu=mu, logvar=logvar)["loss"].backward()
+    return step
+
+
+def collate_step(batch_size, n_max):
+    np.random.seed(0)
+    generator = GraphGenerator()
+    graphs = [generator(int(n)) for n in np.random.randint(n_max // 2, n_max + 1, size=batch_size)]
+    return lambda: DenseGraphBatch.from_sparse_graph_list(graphs)
+
+
+def generation_step(graph_type, batch_size, num_nodes):
+    np.random.seed(0)
+    generator = GraphGenerator()
+    return lambda: [generator(num_nodes, graph_type) for _ in range(batch_size)]
+
+
+def batched_generation_step(graph_type, batch_size, num_nodes):
+    generator = BatchedGraphGenerator()
+    rng = torch.Generator().manual_seed(0)
+    num_nodes = torch.full((batch_size,), num_nodes, dtype=torch.long)
+    return lambda: generator(num_nodes, graph_type, rng)
+
+
+STEPS = {
+    "transformer": transformer_step,
+    "encoder": encoder_step,
+    "decoder": decoder_step,
+    "permuter": permuter_step,
+    "critic": critic_step,
+    "collate": collate_step,
+    "generation": generation_step,
+    "batched_generation": batched_generation_step,
+}
+
+
+def sweep(base, axes):
+    """base plus every value of every axis, one axis varied at a time."""
+    configs = [base]
+    for key, values in axes.items():
+        configs += [{**base, key: value} for value in values if value != base[key]]
+    return configs
+
+
+def cases(hidden_dim=64, quick=False):
+    """(benchmark, kwargs, graphs per step) of every case of the suite."""
+    model_base = {"batch_size": 16, "num_nodes": 32, "num_heads": 4, "num_layers": 2, "hidden_dim": hidden_dim}
+    model_axes = {"num_nodes": (16, 64), "batch_size": (8, 32), "num_heads": (2, 8), "num_layers": (1, 4)}
+    if quick:
+        model_axes = {"num_nodes": (16,)}
+    for name in ("transformer", "encoder", "decoder"):
+        for kwargs in sweep(model_base, model_axes):
+            yield name, kwargs, kwargs["batch_size"]
+    for num_nodes in (16, 64) if quick else (16, 32, 64, 128):
+        for name in ("permuter", "critic"):
+            yield name, {"batch_size": 32, "num_nodes": num_nodes, "hidden_dim": hidden_dim}, 32
+    for n_max in (12, 32) if quick else (12, 20, 32, 48):
+        for batch_size in (32,) if quick else (32, 128):
+            yield "collate", {"batch_size": batch_size, "n_max": n_max}, batch_size
+    for graph_type in GraphGenerator().graph_types:
+        yield "generation", {"graph_type": graph_type, "batch_size": 32, "num_nodes": 20}, 32
+    for graph_type in BatchedGraphGenerator().graph_types:
+        yield "batched_generation", {"graph_type": graph_type, "batch_size": 256, "num_nodes": 20}, 256
+
+
+def case_name(name, kwargs):
+    return "{}/{}".format(name, ",".join("{}={}".format(key, kwargs[key]) for key in sorted(kwargs)))
+
+
+def measure(name, kwargs, num_graphs, repeats=5, num_threads=1):
+    """
+    Best time of repeats steps and extra peak resident set size over the setup. The peak resident set size
+    never goes down, so run every case in a fresh process (see run).
+    """
+    torch.set_num_threads(num_threads)
+    torch.manual_seed(0)
+    step = STEPS[name](**kwargs)
+    # the peak is taken over the warm up step too, it would already have raised it otherwise
+    start_bytes = peak_rss_bytes()
+    step()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        step()
+        times.append(time.perf_counter() - start)
+    peak_bytes = peak_rss_bytes() - start_bytes
+    return {
+        "benchmark": name,
+        "params": kwargs,
+        "time_ms": 1000 * min(times),
+        "graphs_per_s": num_graphs / min(times),
+        "peak_mb": peak_bytes / 2 ** 20,
+    }
+
+
+def run(hidden_dim=64, quick=False, filter=None, repeats=5, num_threads=1):
+    selected = [(name, kwargs, num_graphs) for name, kwargs, num_graphs in cases(hidden_dim, quick)
+                if filter is None or filter in case_name(name, kwargs)]
+    results = {}
+    measurements = run_isolated(measure, [
+        dict(name=name, kwargs=kwargs, num_graphs=num_graphs, repeats=repeats, num_threads=num_threads)
+        for name, kwargs, num_graphs in selected])
+    for (name, kwargs, _), result in zip(selected, measurements):
+        results[case_name(name, kwargs)] = result
+        print("{:<80} {:10.2f} ms {:8.1f} MB".format(case_name(name, kwargs), result["time_ms"],
+                                                       result["peak_mb"]), flush=True)
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "torch": torch.__version__,
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "processor": platform.processor(),
+            "num_threads": num_threads,
+            "repeats": repeats,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, time_tolerance=0.1, memory_tolerance=0.1, min_memory_mb=1.0):
+    """Cases whose time or peak memory grew by more than the tolerance (relative) from baseline to current."""
+    rows, regressions = [], []
+    for key in sorted(set(baseline["results"]) & set(current["results"])):
+        old, new = baseline["results"][key], current["results"][key]
+        time_ratio = new["time_ms"] / old["time_ms"]
+        memory_delta = new["peak_mb"] - old["peak_mb"]
+        slower = time_ratio > 1 + time_tolerance
+        # small peaks are dominated by allocator noise
+        larger = memory_delta > max(memory_tolerance * old["peak_mb"], min_memory_mb)
+        rows.append((key, old, new, time_ratio, slower, larger))
+        if slower or larger:
+            regressions.append(key)
+    return rows, regressions
+
+
+def print_comparison(rows, baseline, current):
+    print("{:<80} {:>10} {:>10} {:>7} {:>9} {:>9}".format("case", "base ms", "ms", "ratio", "base MB", "MB"))
+    for key, old, new, time_ratio, slower, larger in rows:
+        flags = " ".join(flag for flag, on in (("SLOWER", slower), ("MEMORY", larger)) if on)
+        print("{:<80} {:10.2f} {:10.2f} {:6.2f}x {:9.1f} {:9.1f} {}".format(
+            key, old["time_ms"], new["time_ms"], time_ratio, old["peak_mb"], new["peak_mb"], flags))
+    for key in sorted(set(baseline["results"]) ^ set(current["results"])):
+        print("{:<80} only in {}".format(key, "baseline" if key in baseline["results"] else "current"))
+
+
+def main():
+    parser = ArgumentParser(description="CPU benchmark suite of the model, loss, collate and generation hot paths")
+    subparsers = parser.add_subparsers(dest="command")
+    run_parser = subparsers.add_parser("run", help="run the suite and write the results as JSON")
+    run_parser.add_argument("--output", default="benchmark.json", type=str)
+    run_parser.add_argument("--hidden_dim", default=64, type=int)
+    run_parser.add_argument("--filter", default=None, type=str, help="only cases whose name contains this")
+    run_parser.add_argument("--quick", dest="quick", action="store_true")
+    run_parser.set_defaults(quick=False)
+    run_parser.add_argument("--repeats", default=5, type=int)
+    run_parser.add_argument("--num_threads", default=1, type=int)
+    compare_parser = subparsers.add_parser("compare", help="flag regressions between two result files")
+    compare_parser.add_argument("baseline", type=str)
+    compare_parser.add_argument("current", type=str)
+    compare_parser.add_argument("--time_tolerance", default=0.1, type=float)
+    compare_parser.add_argument("--memory_tolerance", default=0.1, type=float)
+    args = parser.parse_args()
+    if args.command == "run":
+        results = run(args.hidden_dim, args.quick, args.filter, args.repeats, args.num_threads)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    elif args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        rows, regressions = compare(baseline, current, args.time_tolerance, args.memory_tolerance)
+        print_comparison(rows, baseline, current)
+        if regressions:
+            print("{} regression(s)".format(len(regressions)))
+            sys.exit(1)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
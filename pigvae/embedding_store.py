@@ -0,0 +1,224 @@
+import os
+import json
+import numpy as np
+
+
+def top_k(scores, k):
+    """Indices and scores of the k largest scores per row, sorted descending."""
+    k = min(k, scores.shape[1])
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-part, axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+
+def merge_top_k(idx_a, scores_a, idx_b, scores_b, k):
+    idx = np.concatenate((idx_a, idx_b), axis=1)
+    scores = np.concatenate((scores_a, scores_b), axis=1)
+    best, scores = top_k(scores, k)
+    return np.take_along_axis(idx, best, axis=1), scores
+
+
+class EmbeddingStore(object):
+    """
+    Persistent store of graph embeddings: a memory-mapped float32 array (embeddings.npy) with one JSON
+    metadata record per row (metadata.jsonl) and meta.json holding dim, count and metric.
+    With metric="cosine" rows are normalized on insert and search uses inner products, with metric="l2"
+    scores are negative squared distances. Either way a larger score is closer.
+
+    Usage:
+        store = EmbeddingStore.create(path, dim=64)
+        store.append(mu.numpy(), [{"smiles": ...}, ...])
+        idx, scores = store.search(queries, k=10)
+        index = IVFIndex.build(store, num_lists=1024)
+        idx, scores = index.search(queries, k=10, nprobe=16)
+    """
+    def __init__(self, path, mode="r"):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.count = meta["count"]
+        self.metric = meta["metric"]
+        self.mode = mode
+        self._vectors = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r+" if mode == "a" else "r")
+        self._metadata = None
+
+    @classmethod
+    def create(cls, path, dim, metric="cosine", capacity=1 << 16):
+        if metric not in ("cosine", "l2"):
+            raise NotImplementedError
+        os.makedirs(path, exist_ok=True)
+        np.lib.format.open_memmap(os.path.join(path, "embeddings.npy"), mode="w+", dtype=np.float32,
+                                  shape=(capacity, dim)).flush()
+        open(os.path.join(path, "metadata.jsonl"), "w").close()
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"dim": dim, "count": 0, "metric": metric}, f)
+        return cls(path, mode="a")
+
+    @property
+    def vectors(self):
+        return self._vectors[:self.count]
+
+    def __len__(self):
+        return self.count
+
+    def metadata(self, idx):
+        if self._metadata is None:
+            with open(os.path.join(self.path, "metadata.jsonl")) as f:
+                self._metadata = [json.loads(line) for line in f]
+        return self._metadata[idx]
+
+    def append(self, embeddings, metadata=None):
+        if self.mode != "a":
+            raise IOError("EmbeddingStore is opened read-only")
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        if self.metric == "cosine":
+            embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        if metadata is None:
+            metadata = [{} for _ in range(len(embeddings))]
+        if len(metadata) != len(embeddings):
+            raise ValueError("one metadata record per embedding is required")
+        if self.count + len(embeddings) > len(self._vectors):
+            self.grow(self.count + len(embeddings))
+        self._vectors[self.count:self.count + len(embeddings)] = embeddings
+        with open(os.path.join(self.path, "metadata.jsonl"), "a") as f:
+            for record in metadata:
+                f.write(json.dumps(record) + "\n")
+        self._metadata = None
+        self.count += len(embeddings)
+        self.flush()
+
+    def grow(self, min_capacity):
+        capacity = len(self._vectors)
+        while capacity < min_capacity:
+            capacity *= 2
+        tmp_file = os.path.join(self.path, "embeddings.tmp.npy")
+        vectors = np.lib.format.open_memmap(tmp_file, mode="w+", dtype=np.float32, shape=(capacity, self.dim))
+        vectors[:self.count] = self._vectors[:self.count]
+        vectors.flush()
+        del vectors
+        self._vectors = None
+        os.replace(tmp_file, os.path.join(self.path, "embeddings.npy"))
+        self._vectors = np.load(os.path.join(self.path, "embeddings.npy"), mmap_mode="r+")
+
+    def flush(self):
+        self._vectors.flush()
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({"dim": self.dim, "count": self.count, "metric": self.metric}, f)
+
+    def prepare_queries(self, queries):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        if self.metric == "cosine":
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        return queries
+
+    def scores(self, queries, vectors):
+        scores = queries @ vectors.T
+        if self.metric == "l2":
+            scores = 2 * scores - (vectors ** 2).sum(1)[None] - (queries ** 2).sum(1)[:, None]
+        return scores
+
+    def search(self, queries, k=10, block_size=1 << 16):
+        """Exact top-k, scanning the memory map in blocks of block_size rows."""
+        queries = self.prepare_queries(queries)
+        idx = np.zeros((len(queries), 0), dtype=np.int64)
+        scores = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, self.count, block_size):
+            block = np.asarray(self._vectors[start:min(start + block_size, self.count)])
+            block_idx, block_scores = top_k(self.scores(queries, block), k)
+            idx, scores = merge_top_k(idx, scores, block_idx + start, block_scores, k)
+        return idx, scores
+
+
+def kmeans(x, num_clusters, num_iters=20, seed=0):
+    """Lloyd's k-means, empty clusters are re-seeded with random points."""
+    rng = np.random.RandomState(seed)
+    centroids = x[rng.choice(len(x), num_clusters, replace=False)].copy()
+    for _ in range(num_iters):
+        assignment = np.argmax(2 * x @ centroids.T - (centroids ** 2).sum(1)[None], axis=1)
+        counts = np.bincount(assignment, minlength=num_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, x)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        centroids[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+    return centroids
+
+
+class IVFIndex(object):
+    """
+    Inverted file index over an EmbeddingStore. The vectors are clustered with k-means into num_lists lists
+    and stored reordered by list, so every list is one contiguous block. A query only scans the nprobe lists
+    with the closest centroids; nprobe trades recall for speed (nprobe=num_lists is exact).
+    The index is saved next to the store (ivf_*.npy) and valid as long as the store is not appended to.
+    """
+    def __init__(self, store, centroids, order, offsets, vectors):
+        self.store = store
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.vectors = vectors
+
+    @classmethod
+    def build(cls, store, num_lists=1024, num_train=1 << 16, num_iters=20, seed=0, block_size=1 << 16):
+        """
+        Trains the centroids on num_train sampled vectors, then assigns and reorders the store block_size rows
+        at a time, so the memory-mapped store is never loaded as a whole.
+        """
+        vectors = store.vectors
+        rng = np.random.RandomState(seed)
+        # sorted sample indices, the sample is read front to back from the memory map
+        sample_idx = np.sort(rng.choice(len(vectors), min(num_train, len(vectors)), replace=False))
+        sample = np.asarray(vectors[sample_idx])
+        centroids = kmeans(sample, min(num_lists, len(sample)), num_iters, seed)
+        centroid_norms = (centroids ** 2).sum(1)[None]
+        assignment = np.zeros(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), block_size):
+            block = np.asarray(vectors[start:start + block_size])
+            assignment[start:start + len(block)] = np.argmax(2 * block @ centroids.T - centroid_norms, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignment, minlength=len(centroids)))
+        for name, array in (("centroids", centroids), ("order", order), ("offsets", offsets)):
+            np.save(os.path.join(store.path, "ivf_{}.npy".format(name)), array)
+        ivf_vectors = np.lib.format.open_memmap(os.path.join(store.path, "ivf_vectors.npy"), mode="w+",
+                                                dtype=np.float32, shape=vectors.shape)
+        for start in range(0, len(vectors), block_size):
+            # sorted reads within the block, written back in list order
+            rows = order[start:start + block_size]
+            rows_sorted = np.argsort(rows, kind="stable")
+            block = np.empty((len(rows), vectors.shape[1]), dtype=np.float32)
+            block[rows_sorted] = vectors[rows[rows_sorted]]
+            ivf_vectors[start:start + len(rows)] = block
+        ivf_vectors.flush()
+        return cls.load(store)
+
+    @classmethod
+    def load(cls, store):
+        arrays = [np.load(os.path.join(store.path, "ivf_{}.npy".format(name)))
+                  for name in ("centroids", "order", "offsets")]
+        vectors = np.load(os.path.join(store.path, "ivf_vectors.npy"), mmap_mode="r")
+        return cls(store, *arrays, vectors=vectors)
+
+    def search(self, queries, k=10, nprobe=8):
+        queries = self.store.prepare_queries(queries)
+        num_queries, nprobe = len(queries), min(nprobe, len(self.centroids))
+        probes, _ = top_k(2 * queries @ self.centroids.T - (self.centroids ** 2).sum(1)[None], nprobe)
+        # group the (query, probe) pairs by list, every list is scanned once for all its queries
+        pairs = np.argsort(probes.ravel(), kind="stable")
+        lists, starts = np.unique(probes.ravel()[pairs], return_index=True)
+        stops = np.append(starts[1:], len(pairs))
+        idx = np.full((num_queries, nprobe, k), -1, dtype=np.int64)
+        scores = np.full((num_queries, nprobe, k), -np.inf, dtype=np.float32)
+        for l, start, stop in zip(lists, starts, stops):
+            list_start, list_stop = self.offsets[l], self.offsets[l + 1]
+            if list_start == list_stop:
+                continue
+            query_idx, probe_idx = np.divmod(pairs[start:stop], nprobe)
+            list_idx, list_scores = top_k(
+                self.store.scores(queries[query_idx], self.vectors[list_start:list_stop]), k)
+            idx[query_idx, probe_idx, :list_idx.shape[1]] = self.order[list_start + list_idx]
+            scores[query_idx, probe_idx, :list_idx.shape[1]] = list_scores
+        best, scores = top_k(scores.reshape(num_queries, -1), k)
+        return np.take_along_axis(idx.reshape(num_queries, -1), best, axis=1), scores
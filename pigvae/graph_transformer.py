@@ -1,7 +1,7 @@
-import numpy as np
 import torch
 from torch.nn import Linear, Dropout, LayerNorm
 from torch.nn.functional import softmax, relu
+from torch.utils.checkpoint import checkpoint
 
 """
 adapted from https://github.com/jadore801120/attention-is-all-you-need-pytorch
@@ -9,23 +9,81 @@ adapted from https://github.com/jadore801120/attention-is-all-you-need-pytorch
 
 
 class Transformer(torch.nn.Module):
-    def __init__(self, hidden_dim, k_dim, v_dim, num_heads, ppf_hidden_dim, num_layers):
+    """
+    With checkpoint_every=k > 0, the layers are run in segments of k layers whose activations are not kept
+    for backward but recomputed from the segment input, so training stores one N^2 x hidden_dim tensor per
+    segment instead of all activations and attention maps of every layer.
+    skip_padded_rows: see BlockAttentionMask.
+    """
+    def __init__(self, hidden_dim, k_dim, v_dim, num_heads, ppf_hidden_dim, num_layers, attn_chunk_size=None,
+                 online_softmax=False, checkpoint_every=0, skip_padded_rows=True):
         super().__init__()
         self.num_layers = num_layers
+        self.checkpoint_every = checkpoint_every
+        self.skip_padded_rows = skip_padded_rows
         self.self_attn_layers = torch.nn.ModuleList([
-            SelfAttention(num_heads, hidden_dim, k_dim, v_dim)
+            SelfAttention(num_heads, hidden_dim, k_dim, v_dim, chunk_size=attn_chunk_size,
+                          online_softmax=online_softmax)
             for _ in range(num_layers)])
         self.pff_layers = torch.nn.ModuleList([
             PositionwiseFeedForward(hidden_dim, ppf_hidden_dim)
             for _ in range(num_layers)])
 
     def forward(self, x, mask):
-        for i in range(self.num_layers):
+        # the block attention mask is the same in every layer
+        mask = BlockAttentionMask(mask, skip_padded_rows=self.skip_padded_rows)
+        if not self.checkpoint_every or not torch.is_grad_enabled():
+            return self.run_layers(x, mask, 0, self.num_layers)
+        for start in range(0, self.num_layers, self.checkpoint_every):
+            stop = min(start + self.checkpoint_every, self.num_layers)
+            x = checkpoint(self.run_layers, x, mask, start, stop, use_reentrant=False)
+        return x
+
+    def run_layers(self, x, mask, start, stop):
+        for i in range(start, stop):
             x = self.self_attn_layers[i](x, mask)
             x = self.pff_layers[i](x)
         return x
 
 
+class BlockAttentionMask(object):
+    """
+    Attention mask of the block attention, built once from an edge mask (b x nn x nn) and shared by all layers.
+    Query (a, i) attends the keys (j, a) with mask[i, j], j != i and j != a. Query rows of a padded node a
+    (mask[a, a] == 0) are not needed and skipped: rows (b x nn) marks the rows that are computed and keys
+    (num_rows x 1 x nn x nn) holds their key masks.
+    Skipping costs a device to host sync (whether any row is padded) and gives data dependent shapes, once per
+    Transformer forward. With skip_padded_rows=False all rows are computed, there is no sync and the shapes only
+    depend on the batch shape. Rows of real nodes only attend rows of real nodes and are the same, except for
+    queries without any key (the edge of a two node graph), which average over all keys.
+    """
+    def __init__(self, mask, skip_padded_rows=True):
+        mask = mask.bool()
+        num_nodes = mask.size(1)
+        not_eye = ~torch.eye(num_nodes, num_nodes, dtype=torch.bool, device=mask.device)
+        self.rows = torch.diagonal(mask, dim1=1, dim2=2)
+        self.all_rows = not skip_padded_rows or bool(self.rows.all())
+        keys = (mask & not_eye).unsqueeze(1) & not_eye.unsqueeze(1)  # b x nn(a) x nn(i) x nn(j)
+        if not self.all_rows:
+            keys = keys[self.rows]
+        self.keys = keys.reshape(-1, 1, num_nodes, num_nodes)  # unsqueeze for head axis broadcasting
+
+    def select(self, x):
+        """Selects the computed rows of x (b x nn x ...) and flattens them to num_rows x ..."""
+        if self.all_rows:
+            return x.flatten(0, 1)
+        return x[self.rows]
+
+    def scatter(self, x):
+        """Inverse of select, skipped rows are zero."""
+        batch_size, num_nodes = self.rows.shape
+        if self.all_rows:
+            return x.view(batch_size, num_nodes, *x.shape[1:])
+        output = x.new_zeros(batch_size, num_nodes, *x.shape[1:])
+        output[self.rows] = x
+        return output
+
+
 class PositionwiseFeedForward(torch.nn.Module):
 
     def __init__(self, d_in, d_hid, dropout=0.1):
@@ -49,37 +107,85 @@ class PositionwiseFeedForward(torch.nn.Module):
 
 
 class ScaledDotProductWithEdgeAttention(torch.nn.Module):
-    def __init__(self, k_dim, temperature, dropout=0.1):
+    """
+    With chunk_size set, the query rows (a) are processed chunk_size at a time and every chunk is
+    recomputed in backward, so peak memory scales with chunk_size instead of nn. online_softmax additionally
+    splits the keys into chunks of chunk_size (key_chunk_size if chunk_size is not set) and combines them
+    with a running max and normalizer.
+    """
+    key_chunk_size = 32
+
+    def __init__(self, k_dim, temperature, dropout=0.1, chunk_size=None, online_softmax=False):
         super().__init__()
         self.k_dim = k_dim
         self.temperature = temperature
         self.dropout = torch.nn.Dropout(dropout)
-
+        self.chunk_size = chunk_size
+        self.online_softmax = online_softmax
 
     def forward(self, q, k, v, mask=None):
-        # q:  b x nh x nn x nn x dv
-        # k:  b x nh x nn x nn x dv
-
-        # k.T:  b x nh x nn x dv x nn
-        # q x k.T --> b x nh x nn x nn x nn
-
-        attn = torch.matmul(q, k.transpose(3, 4))
+        # q:  rows x nh x nn x dv
+        # k:  rows x nh x nn x dv
+        if self.chunk_size is None or (self.chunk_size >= q.size(0) and not self.online_softmax):
+            return self.attend(q, k, v, mask)
+        output = []
+        for start in range(0, q.size(0), self.chunk_size):
+            rows = slice(start, start + self.chunk_size)
+            args = (q[rows], k[rows], v[rows], None if mask is None else mask[rows])
+            if torch.is_grad_enabled():
+                output.append(checkpoint(self.attend, *args, use_reentrant=False))
+            else:
+                output.append(self.attend(*args))
+        return torch.cat(output, dim=0)
+
+    def attend(self, q, k, v, mask=None):
+        if self.online_softmax:
+            return self.attend_online(q, k, v, mask)
+
+        # k.T:  rows x nh x dv x nn
+        # q x k.T --> rows x nh x nn x nn
+
+        attn = torch.matmul(q, k.transpose(2, 3))
         attn = attn / self.temperature
 
-        # attn: b x nh x nn x nn
+        # attn: rows x nh x nn x nn
         if mask is not None:
-            attn = attn.masked_fill(mask == 0, -2**15)
+            attn = attn.masked_fill(mask == 0, torch.finfo(attn.dtype).min)
 
-        attn = softmax(attn, dim=-1)
+        # softmax in fp32 also under reduced precision
+        attn = softmax(attn, dim=-1, dtype=torch.float32).to(v.dtype)
         attn = self.dropout(attn)
-        output = torch.matmul(attn, v)  # output: b x nh x nn x nn x dv
+        output = torch.matmul(attn, v)  # output: rows x nh x nn x dv
 
         return output
 
+    def attend_online(self, q, k, v, mask=None):
+        max_score, normalizer, output = None, None, None
+        chunk_size = self.chunk_size or self.key_chunk_size
+        for start in range(0, k.size(2), chunk_size):
+            keys = slice(start, start + chunk_size)
+            # running max, normalizer and output are kept in fp32
+            attn = torch.matmul(q, k[:, :, keys].transpose(2, 3)).float() / self.temperature
+            if mask is not None:
+                attn = attn.masked_fill(mask[..., keys] == 0, torch.finfo(attn.dtype).min)
+            chunk_max = attn.amax(dim=-1, keepdim=True)
+            new_max = chunk_max if max_score is None else torch.maximum(max_score, chunk_max)
+            attn = torch.exp(attn - new_max)
+            chunk_output = torch.matmul(self.dropout(attn).to(v.dtype), v[:, :, keys]).float()
+            if max_score is None:
+                normalizer = attn.sum(dim=-1, keepdim=True)
+                output = chunk_output
+            else:
+                scale = torch.exp(max_score - new_max)
+                normalizer = normalizer * scale + attn.sum(dim=-1, keepdim=True)
+                output = output * scale + chunk_output
+            max_score = new_max
+        return (output / normalizer).to(v.dtype)
+
 
 # TODO: add layer norm before attenion?
 class SelfAttention(torch.nn.Module):
-    def __init__(self, n_head, hidden_dim, k_dim, v_dim, dropout=0.1):
+    def __init__(self, n_head, hidden_dim, k_dim, v_dim, dropout=0.1, chunk_size=None, online_softmax=False):
         super().__init__()
 
         self.n_head = n_head
@@ -94,7 +200,9 @@ class SelfAttention(torch.nn.Module):
         self.fc = Linear(n_head * v_dim, hidden_dim, bias=False)
         self.attention = ScaledDotProductWithEdgeAttention(
             k_dim=k_dim,
-            temperature=k_dim ** 0.5
+            temperature=k_dim ** 0.5,
+            chunk_size=chunk_size,
+            online_softmax=online_softmax
         )
         self.dropout = Dropout(dropout)
         self.layer_norm = LayerNorm(hidden_dim)
@@ -103,7 +211,6 @@ class SelfAttention(torch.nn.Module):
         # x: b x nn x nn x dv
 
         batch_size, num_nodes = x.size(0), x.size(1)
-        device = x.device
 
         residual = x
 
@@ -113,16 +220,15 @@ class SelfAttention(torch.nn.Module):
         k = self.w_ks(x).view(batch_size, num_nodes, num_nodes, self.n_head, self.k_dim)
         v = self.w_vs(x).view(batch_size, num_nodes, num_nodes, self.n_head, self.v_dim)
 
-        # Transpose for attention dot product: b x nh x nn x nn x dv ; k and v edge features flip for block attention
-        q, k, v = q.permute(0, 3, 1, 2, 4), k.permute(0, 3, 2, 1, 4), v.permute(0, 3, 2, 1, 4)
-        # [bz, nh, nn1, nn2, dq]
+        # Transpose for attention dot product: b x nn(a) x nh x nn x dv ; k and v edge features flip for block attention
+        q, k, v = q.permute(0, 1, 3, 2, 4), k.permute(0, 2, 3, 1, 4), v.permute(0, 2, 3, 1, 4)
 
-        attn_mask = mask.masked_fill(torch.eye(num_nodes, num_nodes, device=device).bool(), 0)
-        attn_mask = attn_mask.unsqueeze(1).expand(-1, num_nodes, -1, -1)
-        attn_mask = attn_mask * (torch.eye(
-            num_nodes, num_nodes, device=device) == 0).bool().unsqueeze(0).unsqueeze(-2).expand(-1, -1, num_nodes, -1)
-        x = self.attention(q, k, v, mask=attn_mask.unsqueeze(1))  # unsqueeze For head axs broadcasting
-        x = x.permute(0, 2, 3, 1, 4).contiguous()  # [bz, nn1, nn2, nh, dq]
+        if not isinstance(mask, BlockAttentionMask):
+            mask = BlockAttentionMask(mask)
+        # only the query rows of real nodes: rows x nh x nn x dv
+        q, k, v = mask.select(q), mask.select(k), mask.select(v)
+        x = mask.scatter(self.attention(q, k, v, mask=mask.keys))  # [bz, nn1, nh, nn2, dq]
+        x = x.transpose(2, 3).contiguous()  # [bz, nn1, nn2, nh, dq]
         x = x.view(batch_size, num_nodes, num_nodes, self.n_head * self.q_dim)
         x = self.dropout(self.fc(x))
         x += residual
@@ -141,16 +247,14 @@ class PositionalEncoding(torch.nn.Module):
 
     def _get_sinusoid_encoding_table(self, n_position, d_hid):
         ''' Sinusoid position encoding table '''
-        # TODO: make it with torch instead of numpy
-
-        def get_position_angle_vec(position):
-            return [position / np.power(10000, 2 * (hid_j // 2) / d_hid) for hid_j in range(d_hid)]
-
-        sinusoid_table = np.array([get_position_angle_vec(pos_i) for pos_i in range(n_position)])
-        sinusoid_table[:, 0::2] = np.sin(sinusoid_table[:, 0::2])  # dim 2i
-        sinusoid_table[:, 1::2] = np.cos(sinusoid_table[:, 1::2])  # dim 2i+1
-
-        return torch.FloatTensor(sinusoid_table).unsqueeze(0)
+        # angles in float64 like the original numpy table, stored in float32
+        position = torch.arange(n_position, dtype=torch.float64).unsqueeze(1)
+        exponent = 2 * (torch.arange(d_hid) // 2).double() / d_hid
+        sinusoid_table = position / torch.pow(10000, exponent).unsqueeze(0)
+        sinusoid_table[:, 0::2] = torch.sin(sinusoid_table[:, 0::2])  # dim 2i
+        sinusoid_table[:, 1::2] = torch.cos(sinusoid_table[:, 1::2])  # dim 2i+1
+
+        return sinusoid_table.float().unsqueeze(0)
 
     def forward(self, batch_size, num_nodes):
         x = self.pos_table[:, :num_nodes].clone().detach()
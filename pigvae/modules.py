@@ -1,14 +1,26 @@
 import torch
 from torch.nn import Linear, LayerNorm, Dropout
-from torch.nn.functional import relu, pad
-from ..pigvae.graph_transformer import Transformer, PositionalEncoding
-from ..pigvae.synthetic_graphs.data import DenseGraphBatch
+from torch.nn.functional import relu, pad, linear
+from pigvae.graph_transformer import Transformer, PositionalEncoding
+from pigvae.synthetic_graphs.data import DenseGraphBatch, pack_edge_features
+
+
+def autocast_dtype(device_type):
+    """dtype of the autocast region on device_type ("cuda" or "cpu"), None outside of autocast."""
+    if hasattr(torch, "get_autocast_dtype"):
+        return torch.get_autocast_dtype(device_type) if torch.is_autocast_enabled(device_type) else None
+    if device_type == "cuda":
+        return torch.get_autocast_gpu_dtype() if torch.is_autocast_enabled() else None
+    return torch.get_autocast_cpu_dtype() if torch.is_autocast_cpu_enabled() else None
 
 
 class GraphAE(torch.nn.Module):
     def __init__(self, hparams):
         super().__init__()
         self.vae = hparams["vae"]
+        # normalization of the node count property, used to infer node counts when decoding without mask
+        self.num_nodes_mean = hparams.get("num_nodes_mean", 0.0)
+        self.num_nodes_std = hparams.get("num_nodes_std", 1.0)
         self.encoder = GraphEncoder(hparams)
         self.bottle_neck_encoder = BottleNeckEncoder(hparams)
         self.bottle_neck_decoder = BottleNeckDecoder(hparams)
@@ -29,30 +41,65 @@ class GraphAE(torch.nn.Module):
         graph_emb, mu, logvar = self.bottle_neck_encoder(graph_emb)
         return graph_emb, node_features, mu, logvar
 
-    def decode(self, graph_emb, perm, mask=None):
-        props = self.property_predictor(graph_emb).squeeze()
+    def decode(self, graph_emb, perm, mask=None, props=None):
+        # props can be passed if they were already predicted (e.g. for the node counts, see GraphSampler)
+        if props is None:
+            props = self.property_predictor(graph_emb).squeeze(-1)
         if mask is None:
-            num_nodes = torch.round(props * STD_NUM_NODES + MEAN_NUM_NODES).long()
-            mask = torch.arange(max(num_nodes)).type_as(num_nodes).unsqueeze(0) < num_nodes.unsqueeze(1)
+            num_nodes = self.predict_num_nodes(props)
+            mask = torch.arange(int(num_nodes.max()), device=num_nodes.device).unsqueeze(0) < num_nodes.unsqueeze(1)
         graph_emb = self.bottle_neck_decoder(graph_emb)
         node_logits, edge_logits = self.decoder(
             graph_emb=graph_emb,
             perm=perm,
             mask=mask
         )
-        graph_pred = DenseGraphBatch(
-            node_features=node_logits,
-            edge_features=edge_logits,
-            mask=mask,
-            properties=props
-        )
+        if self.decoder.packed_edges:
+            # edge logits of the upper triangle only, see GraphDecoder
+            graph_pred = DenseGraphBatch(
+                node_features=node_logits,
+                edge_features=None,
+                mask=mask,
+                properties=props,
+                packed_edge_features=edge_logits
+            )
+        else:
+            graph_pred = DenseGraphBatch(
+                node_features=node_logits,
+                edge_features=edge_logits,
+                mask=mask,
+                properties=props
+            )
         return graph_pred
 
+    def predict_num_nodes(self, props):
+        """
+        Node counts from the predicted properties, the first property is the (normalized) node count. Clamped
+        to the length of the decoder's positional encoding, the largest graph the decoder can generate.
+        """
+        num_nodes = props.view(props.size(0), -1)[:, 0] * self.num_nodes_std + self.num_nodes_mean
+        max_num_nodes = self.decoder.posiotional_embedding.pos_table.size(1)
+        return torch.round(num_nodes).long().clamp(min=1, max=max_num_nodes)
+
     def forward(self, graph, training, tau):
         graph_emb, node_features, mu, logvar = self.encode(graph=graph)
         perm = self.permuter(node_features, mask=graph.mask, hard=not training, tau=tau)
         graph_pred = self.decode(graph_emb, perm, graph.mask)
-        return graph_pred, perm, mu, logvar
+        return graph_pred, perm.matrix, mu, logvar
+
+    def forward_soft_and_hard(self, graph, tau):
+        """
+        Encodes once and decodes with a soft and with a hard permutation (validation), the two results are
+        the outputs of forward with training=True and training=False for the same graph embedding. Like
+        forward, the permutations are returned as matrices.
+        """
+        graph_emb, node_features, mu, logvar = self.encode(graph=graph)
+        outputs = []
+        for hard in (False, True):
+            perm = self.permuter(node_features, mask=graph.mask, hard=hard, tau=tau)
+            graph_pred = self.decode(graph_emb, perm, graph.mask)
+            outputs.append((graph_pred, perm.matrix, mu, logvar))
+        return outputs
 
 
 class GraphEncoder(torch.nn.Module):
@@ -66,6 +113,10 @@ class GraphEncoder(torch.nn.Module):
             num_heads=hparams["graph_encoder_num_heads"],
             ppf_hidden_dim=hparams["graph_encoder_ppf_hidden_dim"],
             num_layers=hparams["graph_encoder_num_layers"],
+            attn_chunk_size=hparams.get("attention_chunk_size") or None,
+            online_softmax=hparams.get("attention_online_softmax", False),
+            checkpoint_every=hparams.get("graph_encoder_checkpoint_every", 0),
+            skip_padded_rows=hparams.get("attention_skip_padded_rows", True),
         )
         message_input_dim = 2 * (hparams["num_node_features"] + 1) + hparams["num_edge_features"] + 1
         self.fc_in = Linear(message_input_dim, hparams["graph_encoder_hidden_dim"])
@@ -82,15 +133,20 @@ class GraphEncoder(torch.nn.Module):
         return node_features, edge_features, mask
 
     def init_message_matrix(self, node_features, edge_features, mask):
+        """
+        Same as fc_in applied to the concatenated features of every pair (edge, node i, node j), but fc_in is
+        split into an edge projection and two node projections that are added by broadcasting, so the
+        concatenated b x nn x nn x (2F+E+3) input and the repeated node features are never built.
+        """
         node_features, edge_features, mask = self.add_emb_node_and_feature(node_features, edge_features, mask)
         edge_mask = mask.unsqueeze(1) * mask.unsqueeze(2)
-        batch_size, num_nodes = node_features.size(0), node_features.size(1)
-        node_features_combined = torch.cat(
-            (node_features.unsqueeze(2).repeat(1, 1, num_nodes, 1),
-             node_features.unsqueeze(1).repeat_interleave(num_nodes, dim=1)),
-            dim=-1)
-        x = torch.cat((edge_features, node_features_combined), dim=-1)
-        x = self.layer_norm(self.dropout(self.fc_in(x)))
+        node_dim, edge_dim = node_features.size(-1), edge_features.size(-1)
+        weight_edge, weight_node_i, weight_node_j = self.fc_in.weight.split([edge_dim, node_dim, node_dim], dim=1)
+        x = linear(edge_features, weight_edge, self.fc_in.bias)
+        # not in-place on the linear output, which is a view and would be copied again in backward
+        x = torch.add(x, linear(node_features, weight_node_i).unsqueeze(2))
+        x += linear(node_features, weight_node_j).unsqueeze(1)
+        x = self.layer_norm(self.dropout(x))
         return x, edge_mask
 
     def read_out_message_matrix(self, x):
@@ -117,6 +173,10 @@ class GraphDecoder(torch.nn.Module):
             num_heads=hparams["graph_decoder_num_heads"],
             ppf_hidden_dim=hparams["graph_decoder_ppf_hidden_dim"],
             num_layers=hparams["graph_decoder_num_layers"],
+            attn_chunk_size=hparams.get("attention_chunk_size") or None,
+            online_softmax=hparams.get("attention_online_softmax", False),
+            checkpoint_every=hparams.get("graph_decoder_checkpoint_every", 0),
+            skip_padded_rows=hparams.get("attention_skip_padded_rows", True),
         )
         message_input_dim = hparams["graph_decoder_hidden_dim"] + 2 * hparams["graph_decoder_pos_emb_dim"]
         self.fc_in = Linear(message_input_dim, hparams["graph_decoder_hidden_dim"])
@@ -124,27 +184,59 @@ class GraphDecoder(torch.nn.Module):
         self.edge_fc_out = Linear(hparams["graph_decoder_hidden_dim"], hparams["num_edge_features"])
         self.dropout = Dropout(0.1)
         self.layer_norm = LayerNorm(hparams["graph_decoder_hidden_dim"])
+        self.packed_edges = hparams.get("graph_decoder_packed_edges", False)
+        self.positional_projection_cache = {}
 
     def init_message_matrix(self, graph_emb, perm, num_nodes):
-        batch_size= graph_emb.size(0)
-
-        pos_emb = self.posiotional_embedding(batch_size, num_nodes)
+        """
+        Same as fc_in applied to the concatenation of graph_emb and the (permuted) positional embeddings of
+        both nodes of every pair, but fc_in is split into a graph embedding and two positional projections that
+        are added by broadcasting. perm is applied after the positional projections, which then only depend on
+        num_nodes.
+        """
+        weight_graph = self.fc_in.weight[:, :graph_emb.size(-1)]
+        pos_i, pos_j = self.positional_projection(num_nodes)  # nn x hidden_dim
         if perm is not None:
-            pos_emb = torch.matmul(perm, pos_emb)
-        pos_emb_combined = torch.cat(
-            (pos_emb.unsqueeze(2).repeat(1, 1, num_nodes, 1),
-             pos_emb.unsqueeze(1).repeat_interleave(num_nodes, dim=1)),
-            dim=-1)
-
-        x = graph_emb.unsqueeze(1).unsqueeze(1).expand(-1, num_nodes, num_nodes, -1)
-        x = torch.cat((x, pos_emb_combined), dim=-1)
-        x = self.layer_norm(self.dropout(self.fc_in(x)))
+            pos_i, pos_j = Permuter.permute_node_features(pos_i, perm), Permuter.permute_node_features(pos_j, perm)
+        x = linear(graph_emb, weight_graph, self.fc_in.bias).unsqueeze(-2)
+        # b x 1 x 1 x hidden_dim + b x nn x 1 x hidden_dim + b x 1 x nn x hidden_dim
+        x = (x + pos_i.to(x.dtype)).unsqueeze(-2) + pos_j.unsqueeze(-3).to(x.dtype)
+        x = self.layer_norm(self.dropout(x))
         return x
 
+    def positional_projection(self, num_nodes):
+        """
+        Positional embeddings projected by the node i and node j parts of fc_in. Without gradients they are
+        cached per num_nodes and dtype (bf16/fp16 under autocast) as long as fc_in is not changed (its version
+        counter goes up with every in-place update, e.g. by the optimizer or load_state_dict).
+        """
+        weight = self.fc_in.weight
+        dtype = autocast_dtype(weight.device.type) or weight.dtype
+        cache_key = (num_nodes, weight.device, weight._version, dtype)
+        if not torch.is_grad_enabled() and cache_key in self.positional_projection_cache:
+            return self.positional_projection_cache[cache_key]
+        pos_emb_dim = self.posiotional_embedding.pos_table.size(-1)
+        weight_pos_i, weight_pos_j = self.fc_in.weight[:, -2 * pos_emb_dim:].split(pos_emb_dim, dim=1)
+        pos_emb = self.posiotional_embedding(1, num_nodes)[0]
+        pos_i, pos_j = linear(pos_emb, weight_pos_i), linear(pos_emb, weight_pos_j)
+        if not torch.is_grad_enabled():
+            if any(key[1:3] != cache_key[1:3] for key in self.positional_projection_cache):
+                self.positional_projection_cache.clear()
+            self.positional_projection_cache[cache_key] = pos_i, pos_j
+        return pos_i, pos_j
+
+    def train(self, mode=True):
+        self.positional_projection_cache.clear()
+        return super().train(mode)
+
     def read_out_message_matrix(self, x):
         num_nodes = x.size(1)
         node_features = torch.diagonal(x, dim1=1, dim2=2).transpose(1, 2)
         node_features = self.node_fc_out(node_features)
+        if self.packed_edges:
+            edge_features = self.edge_fc_out(x)
+            edge_features = (pack_edge_features(edge_features) + pack_edge_features(edge_features.transpose(1, 2))) / 2
+            return node_features, edge_features
         edge_features = self.edge_fc_out(x)
         self_edge_mask = torch.eye(num_nodes, num_nodes, device=node_features.device).bool().unsqueeze(-1)
         edge_features.masked_fill_(self_edge_mask, 0)
@@ -165,46 +257,81 @@ class Permuter(torch.nn.Module):
         self.scoring_fc = Linear(hparams["graph_decoder_hidden_dim"], 1)
 
     def score(self, x, mask):
-        scores = self.scoring_fc(x)
-        fill_value = scores.min().item() - 1
-        scores = scores.masked_fill(mask.unsqueeze(-1) == 0, fill_value)
+        # sorting in fp32, reduced precision can not resolve close scores
+        scores = self.scoring_fc(x).squeeze(-1).float()
+        # padded nodes are sorted last. The fill value stays on the device (no .item() sync)
+        scores = torch.where(mask, scores, scores.detach().min() - 1)
         return scores
 
-    def soft_sort(self, scores, hard, tau):
-        scores_sorted = scores.sort(descending=True, dim=1)[0]
-        pairwise_diff = (scores.transpose(1, 2) - scores_sorted).abs().neg() / tau
-        perm = pairwise_diff.softmax(-1)
-        if hard:
-            perm_ = torch.zeros_like(perm, device=perm.device)
-            perm_.scatter_(-1, perm.topk(1, -1)[1], value=1)
-            perm = (perm_ - perm).detach() + perm
+    @staticmethod
+    def ranks(order, mask):
+        """
+        Index representation of the hard permutation: node i is moved to position ranks[:, i].
+        order is the descending argsort of the scores, padded nodes keep their position.
+        """
+        positions = torch.arange(order.size(1), device=order.device).expand_as(order)
+        ranks = torch.empty_like(order).scatter_(1, order, positions)
+        return torch.where(mask, ranks, positions)
+
+    @staticmethod
+    def one_hot(ranks, dtype=torch.float32):
+        perm = torch.zeros(*ranks.shape, ranks.size(1), dtype=dtype, device=ranks.device)
+        return perm.scatter_(-1, ranks.unsqueeze(-1), 1)
+
+    def soft_sort(self, scores, scores_sorted, tau):
+        # perm[:, i, r]: softmax over the nodes i of -|scores_i - scores_sorted_r| / tau
+        pairwise_diff = (scores.unsqueeze(1) - scores_sorted.unsqueeze(2)).abs().div_(-tau)
+        perm = pairwise_diff.softmax(-1).transpose(2, 1)
         return perm
 
     def mask_perm(self, perm, mask):
-        batch_size, num_nodes = mask.size(0), mask.size(1)
-        eye = torch.eye(num_nodes, num_nodes).unsqueeze(0).expand(batch_size, -1, -1).type_as(perm)
-        mask = mask.unsqueeze(-1).expand(-1, -1, num_nodes)
-        perm = torch.where(mask, perm, eye)
+        eye = torch.eye(mask.size(1), dtype=perm.dtype, device=perm.device)
+        perm = torch.where(mask.unsqueeze(-1), perm, eye)
         return perm
 
     def forward(self, node_features, mask, hard=False, tau=1.0):
+        """
+        Soft (hard=False) or hard Permutation of the nodes, padded nodes keep their position.
+        The hard permutation comes from a single sort and is kept as indices. Without gradients no soft
+        permutation is built, with gradients the matrix is the straight-through estimator of the soft one.
+        GraphAE decodes with the Permutation and returns its matrix, so callers of GraphAE get a tensor.
+        """
+        mask = mask.bool()
         # add noise to break symmetry
         node_features = node_features + torch.randn_like(node_features) * 0.05
         scores = self.score(node_features, mask)
-        perm = self.soft_sort(scores, hard, tau)
-        perm = perm.transpose(2, 1)
-        perm = self.mask_perm(perm, mask)
-        return perm
+        if hard and not torch.is_grad_enabled():
+            return Permutation(ranks=self.ranks(scores.argsort(dim=1, descending=True), mask))
+        scores_sorted, order = scores.sort(dim=1, descending=True)
+        perm = self.soft_sort(scores, scores_sorted, tau)
+        if not hard:
+            return Permutation(matrix=self.mask_perm(perm, mask))
+        # straight-through: value of the hard permutation, gradient of the soft one (zero for padded rows)
+        ranks = self.ranks(order, mask)
+        perm = perm.masked_fill(~mask.unsqueeze(-1), 0)
+        return Permutation(matrix=self.one_hot(ranks).sub_(perm.detach()).add_(perm), ranks=ranks)
 
     @staticmethod
     def permute_node_features(node_features, perm):
-        node_features = torch.matmul(perm, node_features)
+        if not isinstance(perm, Permutation):
+            perm = Permutation(matrix=perm)
+        if perm.is_index:
+            if node_features.dim() == 2:
+                return node_features[perm.ranks]
+            batch = torch.arange(perm.ranks.size(0), device=perm.ranks.device).unsqueeze(1)
+            return node_features[batch, perm.ranks]
+        node_features = torch.matmul(perm.matrix, node_features)
         return node_features
 
     @staticmethod
     def permute_edge_features(edge_features, perm):
-        edge_features = torch.matmul(perm.unsqueeze(1), edge_features)
-        edge_features = torch.matmul(perm.unsqueeze(1), edge_features.permute(0, 2, 1, 3))
+        if not isinstance(perm, Permutation):
+            perm = Permutation(matrix=perm)
+        if perm.is_index:
+            batch = torch.arange(perm.ranks.size(0), device=perm.ranks.device).view(-1, 1, 1)
+            return edge_features[batch, perm.ranks.unsqueeze(2), perm.ranks.unsqueeze(1)]
+        edge_features = torch.matmul(perm.matrix.unsqueeze(1), edge_features)
+        edge_features = torch.matmul(perm.matrix.unsqueeze(1), edge_features.permute(0, 2, 1, 3))
         edge_features = edge_features.permute(0, 2, 1, 3)
         return edge_features
 
@@ -215,6 +342,29 @@ class Permuter(torch.nn.Module):
         return graph
 
 
+class Permutation(object):
+    """
+    Node permutation of a batch, as permutation matrix [batch_size, num_nodes, num_nodes] (matrix[:, i, r] is
+    the weight of position r for node i) and, for hard permutations, as indices: node i takes position
+    ranks[:, i], permuted features are x[ranks]. The matrix of a hard permutation is built on first access.
+    As long as the matrix does not need a gradient (straight-through estimator) Permuter.permute_* gather with
+    the indices instead of multiplying with the matrix.
+    """
+    def __init__(self, matrix=None, ranks=None):
+        self._matrix = matrix
+        self.ranks = ranks
+
+    @property
+    def matrix(self):
+        if self._matrix is None:
+            self._matrix = Permuter.one_hot(self.ranks)
+        return self._matrix
+
+    @property
+    def is_index(self):
+        return self.ranks is not None and (self._matrix is None or not self._matrix.requires_grad)
+
+
 class BottleNeckEncoder(torch.nn.Module):
     def __init__(self, hparams):
         super().__init__()
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+from collections import defaultdict
+import torch
+from pigvae.graph_transformer import SelfAttention, PositionwiseFeedForward
+from pigvae.modules import Permuter
+from pigvae.synthetic_graphs.metrics import Critic
+
+PROFILED_MODULES = (SelfAttention, PositionwiseFeedForward, Permuter, Critic)
+
+
+class ModuleProfiler(object):
+    """
+    Forward wall time and memory of every SelfAttention, PositionwiseFeedForward, Permuter and Critic of a
+    model, recorded with forward hooks on every every_n_steps-th step only. On other steps the hooks return
+    right away. On CUDA times come from CUDA events resolved once at the end of the step (no sync per module),
+    memory is the allocator delta of the module and by how much it raised the allocator peak
+    (max_memory_allocated), on CPU only times are recorded. The peak counters are never reset, they are process
+    wide and also read by others (e.g. Lightning's GPU stats), so a module that stays below an earlier peak
+    reports a peak increase of 0.
+    Modules recomputed by activation checkpointing are recorded once more during backward.
+
+    Usage:
+        profiler = ModuleProfiler(every_n_steps=50).attach(model)
+        profiler.start_step(step)
+        ...  # forward and backward
+        stats = profiler.end_step()  # {"encoder.graph_transformer.self_attn_layers.0/time_ms": ..., ...}
+        profiler.export_chrome_trace("trace.json")
+    """
+    def __init__(self, every_n_steps=50, max_trace_events=1000000):
+        self.every_n_steps = every_n_steps
+        self.max_trace_events = max_trace_events
+        self.active = False
+        self.cuda = False
+        self.model = None
+        self.step = None
+        self.records = []
+        self.open_records = {}
+        self.trace_events = []
+        self.handles = []
+        self.start_time = time.perf_counter()
+
+    def attach(self, model, module_types=PROFILED_MODULES):
+        self.model = model
+        for name, module in model.named_modules():
+            if isinstance(module, module_types):
+                self.handles.append(module.register_forward_pre_hook(self.pre_hook(name or type(module).__name__)))
+                self.handles.append(module.register_forward_hook(self.post_hook(name or type(module).__name__)))
+        return self
+
+    def detach(self):
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+
+    def pre_hook(self, name):
+        def hook(module, inputs):
+            if not self.active:
+                return
+            record = {"name": name, "ts": time.perf_counter()}
+            if self.cuda:
+                record["start_event"] = torch.cuda.Event(enable_timing=True)
+                record["start_event"].record()
+                record["start_bytes"] = torch.cuda.memory_allocated()
+                record["start_peak_bytes"] = torch.cuda.max_memory_allocated()
+            self.open_records[id(module)] = record
+        return hook
+
+    def post_hook(self, name):
+        def hook(module, inputs, outputs):
+            record = self.open_records.pop(id(module), None)
+            if record is None:
+                return
+            record["end_ts"] = time.perf_counter()
+            if "start_event" in record:
+                record["end_event"] = torch.cuda.Event(enable_timing=True)
+                record["end_event"].record()
+                record["allocated_mb"] = (torch.cuda.memory_allocated() - record["start_bytes"]) / 2 ** 20
+                record["peak_increase_mb"] = (torch.cuda.max_memory_allocated() - record["start_peak_bytes"]) / 2 ** 20
+            self.records.append(record)
+        return hook
+
+    def start_step(self, step):
+        self.step = step
+        self.active = self.every_n_steps > 0 and step % self.every_n_steps == 0
+        # the model may have been moved after attach
+        param = next(self.model.parameters(), None) if self.model is not None else None
+        self.cuda = param is not None and param.is_cuda
+        self.records = []
+        self.open_records = {}
+
+    def end_step(self):
+        """Per module sums over the calls of the step (time_ms, allocated_mb, peak_increase_mb), None if not sampled."""
+        if not self.active:
+            return None
+        self.active = False
+        if self.cuda:
+            torch.cuda.synchronize()
+        stats = defaultdict(float)
+        for record in self.records:
+            if "start_event" in record:
+                duration_ms = record["start_event"].elapsed_time(record["end_event"])
+                stats[record["name"] + "/allocated_mb"] += record["allocated_mb"]
+                stats[record["name"] + "/peak_increase_mb"] += record["peak_increase_mb"]
+            else:
+                duration_ms = 1000 * (record["end_ts"] - record["ts"])
+            stats[record["name"] + "/time_ms"] += duration_ms
+            stats[record["name"] + "/calls"] += 1
+            if len(self.trace_events) < self.max_trace_events:
+                self.trace_events.append({
+                    "name": record["name"],
+                    "cat": "module",
+                    "ph": "X",
+                    "ts": 1e6 * (record["ts"] - self.start_time),
+                    "dur": 1000 * duration_ms,
+                    "pid": os.getpid(),
+                    "tid": 0,
+                    "args": {key: record[key] for key in ("allocated_mb", "peak_increase_mb") if key in record},
+                })
+        self.records = []
+        return dict(stats)
+
+    def export_chrome_trace(self, path):
+        """Writes the recorded module calls of all sampled steps in Chrome trace format (chrome://tracing)."""
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.trace_events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,76 @@
+import numpy as np
+import networkx as nx
+import torch
+from pigvae.synthetic_graphs.data import unpack_edge_features
+
+
+class GraphSampler(object):
+    """
+    Generates graphs from the latent space of a GraphAE. Latents are drawn from the prior (or given),
+    node counts are predicted by the property predictor (GraphAE.predict_num_nodes) and the latents of
+    a chunk are sorted by node count and decoded in batches of batch_size, so batches are barely padded.
+    Edges are the pairs whose edge probability (distance 1 channel) is above edge_threshold.
+    Graphs are yielded as they are decoded, sorted by size within every chunk.
+
+    Usage:
+        sampler = GraphSampler(graph_ae, batch_size=512)
+        for graph in sampler.sample(10000):
+            ...
+    """
+    def __init__(self, graph_ae, batch_size=256, chunk_size=8192, edge_threshold=0.5, output="networkx",
+                 device="cpu"):
+        if output not in ("networkx", "adjacency"):
+            raise NotImplementedError
+        self.graph_ae = graph_ae.to(device).eval()
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.edge_logit_threshold = float(np.log(edge_threshold / (1 - edge_threshold)))
+        self.output = output
+        self.device = device
+        self.emb_dim = graph_ae.bottle_neck_decoder.d_in
+
+    def sample_latents(self, num_samples, generator=None):
+        return torch.randn(num_samples, self.emb_dim, generator=generator).to(self.device)
+
+    def sample(self, num_samples, generator=None):
+        for start in range(0, num_samples, self.chunk_size):
+            z = self.sample_latents(min(self.chunk_size, num_samples - start), generator)
+            yield from self.decode(z)
+
+    def decode(self, z):
+        """
+        Decodes latents [num_samples, emb_dim] and yields one graph per latent. Every batch is decoded in
+        inference mode, but graphs are yielded outside of it, so the caller's loop body runs with its own
+        grad mode.
+        """
+        z, num_nodes, props = self.predict_num_nodes(z)
+        order = torch.argsort(num_nodes)
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            yield from self.decode_batch(z[idx], num_nodes[idx], props[idx])
+
+    @torch.inference_mode()
+    def predict_num_nodes(self, z):
+        z = z.to(self.device)
+        # properties are predicted once, for the node counts and the decoded graphs
+        props = self.graph_ae.property_predictor(z).squeeze(-1)
+        return z, self.graph_ae.predict_num_nodes(props), props
+
+    @torch.inference_mode()
+    def decode_batch(self, z, num_nodes, props=None):
+        """List of the graphs of a batch of latents with the given node counts."""
+        max_num_nodes = int(num_nodes.max())
+        mask = torch.arange(max_num_nodes, device=z.device).unsqueeze(0) < num_nodes.unsqueeze(1)
+        graph_pred = self.graph_ae.decode(z, None, mask, props=props)
+        if getattr(graph_pred, "packed_edge_features", None) is not None:
+            edge_logits = unpack_edge_features(graph_pred.packed_edge_features[..., 1], max_num_nodes)
+        else:
+            edge_logits = graph_pred.edge_features[..., 1]
+        no_self_loops = ~torch.eye(max_num_nodes, dtype=torch.bool, device=z.device)
+        adj = (edge_logits > self.edge_logit_threshold) & mask.unsqueeze(1) & mask.unsqueeze(2) & no_self_loops
+        adj = adj.cpu().numpy()
+        graphs = []
+        for a, n in zip(adj, num_nodes.tolist()):
+            a = a[:n, :n]
+            graphs.append(nx.from_numpy_array(a.astype(np.uint8)) if self.output == "networkx" else a)
+        return graphs
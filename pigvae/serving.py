@@ -0,0 +1,233 @@
+import json
+import time
+import asyncio
+import inspect
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from argparse import ArgumentParser
+import numpy as np
+import networkx as nx
+import torch
+from pigvae.modules import GraphAE
+from pigvae.synthetic_graphs.data import DenseGraphBatch
+
+
+def load_graph_ae(ckpt_path, map_location="cpu"):
+    """Loads only the GraphAE of a PLGraphAE Lightning checkpoint (no critic, no trainer)."""
+    # map_location: checkpoints saved on GPU can be served on CPU. Lightning pickles more than tensors (the
+    # hyper_parameters are an AttributeDict, the callback and loop states arbitrary objects), which
+    # weights_only=True (the default since torch 2.6) refuses to load. Only load trusted checkpoints.
+    kwargs = {"weights_only": False} if "weights_only" in inspect.signature(torch.load).parameters else {}
+    ckpt = torch.load(ckpt_path, map_location=map_location, **kwargs)
+    hparams = ckpt["hyper_parameters"]
+    state_dict = {key[len("graph_ae."):]: value for key, value in ckpt["state_dict"].items()
+                  if key.startswith("graph_ae.")}
+    graph_ae = GraphAE(hparams)
+    graph_ae.load_state_dict(state_dict)
+    return graph_ae.eval()
+
+
+def to_networkx(graph):
+    """Accepts a networkx graph, an edge list or a dict with "edges" and optionally "num_nodes"."""
+    if isinstance(graph, nx.Graph):
+        return nx.convert_node_labels_to_integers(graph)
+    num_nodes = None
+    if isinstance(graph, dict):
+        graph, num_nodes = graph["edges"], graph.get("num_nodes")
+    edges = [(int(i), int(j)) for i, j in graph]
+    if num_nodes is None:
+        num_nodes = max([max(edge) for edge in edges], default=0) + 1
+    nx_graph = nx.Graph()
+    nx_graph.add_nodes_from(range(num_nodes))
+    nx_graph.add_edges_from(edges)
+    return nx_graph
+
+
+class LatencyStats(object):
+    """Request latencies of the last window requests and throughput counters."""
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)
+        self.start_time = time.perf_counter()
+        self.num_requests = 0
+        self.num_batches = 0
+
+    def add_batch(self, latencies):
+        self.latencies.extend(latencies)
+        self.num_requests += len(latencies)
+        self.num_batches += 1
+
+    def summary(self):
+        latencies = np.array(self.latencies) if len(self.latencies) > 0 else np.zeros(1)
+        elapsed = time.perf_counter() - self.start_time
+        return {
+            "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+            "p99_ms": 1000 * float(np.percentile(latencies, 99)),
+            "requests": self.num_requests,
+            "batches": self.num_batches,
+            "mean_batch_size": self.num_requests / max(self.num_batches, 1),
+            "graphs_per_s": self.num_requests / elapsed,
+        }
+
+
+class EmbeddingServer(object):
+    """
+    Embeds graphs with GraphAE.encode. Requests are queued in buckets of similar node count
+    (num_nodes // bucket_width) and a bucket is encoded as one DenseGraphBatch once it holds
+    max_batch_size graphs or its oldest request has waited max_delay seconds. The model runs in a single
+    worker thread under torch.inference_mode, so the event loop keeps accepting requests meanwhile.
+    Returns mu for VAEs, the graph embedding otherwise.
+
+    Usage:
+        async with EmbeddingServer(load_graph_ae(ckpt_path)) as server:
+            embedding = await server.embed(graph)
+    """
+    def __init__(self, graph_ae, max_batch_size=64, max_delay=0.005, bucket_width=8, device="cpu"):
+        self.graph_ae = graph_ae.to(device).eval()
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.bucket_width = bucket_width
+        self.device = device
+        self.stats = LatencyStats()
+        self.buckets = defaultdict(list)
+        self.queue = None
+        self.executor = None
+        self.batching_task = None
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batching_task = asyncio.ensure_future(self.batching_loop())
+        return self
+
+    async def close(self):
+        self.batching_task.cancel()
+        try:
+            await self.batching_task
+        except asyncio.CancelledError:
+            pass
+        self.executor.shutdown()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def embed(self, graph):
+        graph = to_networkx(graph)
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((graph, future, time.perf_counter()))
+        return await future
+
+    async def batching_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # wait for a new request until the oldest pending request is due
+            deadlines = [requests[0][2] + self.max_delay for requests in self.buckets.values()]
+            timeout = max(min(deadlines) - time.perf_counter(), 0) if deadlines else None
+            try:
+                requests = [await asyncio.wait_for(self.queue.get(), timeout)]
+            except asyncio.TimeoutError:
+                requests = []
+            # and take everything that queued up while the last batch ran
+            while not self.queue.empty():
+                requests.append(self.queue.get_nowait())
+            for graph, future, arrival in requests:
+                self.buckets[graph.number_of_nodes() // self.bucket_width].append((graph, future, arrival))
+            now = time.perf_counter()
+            for bucket in list(self.buckets):
+                requests = self.buckets[bucket]
+                if len(requests) >= self.max_batch_size or now - requests[0][2] >= self.max_delay:
+                    batch, self.buckets[bucket] = requests[:self.max_batch_size], requests[self.max_batch_size:]
+                    if len(self.buckets[bucket]) == 0:
+                        del self.buckets[bucket]
+                    await self.run_batch(loop, batch)
+
+    async def run_batch(self, loop, batch):
+        graphs, futures, arrivals = zip(*batch)
+        try:
+            embeddings = await loop.run_in_executor(self.executor, self.encode, list(graphs))
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        now = time.perf_counter()
+        for future, embedding in zip(futures, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+        self.stats.add_batch([now - arrival for arrival in arrivals])
+
+    def encode(self, graphs):
+        batch = DenseGraphBatch.from_sparse_graph_list(graphs).to(self.device)
+        with torch.inference_mode():
+            graph_emb, _, mu, _ = self.graph_ae.encode(batch)
+        embeddings = mu if mu is not None else graph_emb
+        return list(embeddings.float().cpu().numpy())
+
+    async def handle_connection(self, reader, writer):
+        """
+        JSON lines protocol, one request per line:
+            {"id": 1, "edges": [[0, 1], [1, 2]], "num_nodes": 3} -> {"id": 1, "embedding": [...]}
+            {"stats": true} -> {"stats": {...}}
+        Requests of one connection are handled concurrently, responses are written as they complete.
+        """
+        tasks = set()
+        lock = asyncio.Lock()
+
+        async def respond(request):
+            try:
+                if request.get("stats"):
+                    response = {"stats": self.stats.summary()}
+                else:
+                    embedding = await self.embed(request)
+                    response = {"id": request.get("id"), "embedding": embedding.tolist()}
+            except Exception as e:
+                response = {"id": request.get("id"), "error": repr(e)}
+            async with lock:
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            task = asyncio.ensure_future(respond(json.loads(line)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765, unix_socket=None):
+        if unix_socket is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_socket)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host=host, port=port)
+        async with server:
+            await server.serve_forever()
+
+
+async def run_server(args):
+    graph_ae = load_graph_ae(args.ckpt, map_location=args.device)
+    async with EmbeddingServer(graph_ae, args.max_batch_size, args.max_delay_ms / 1000, args.bucket_width,
+                               args.device) as server:
+        await server.serve(args.host, args.port, args.unix_socket)
+
+
+def main():
+    parser = ArgumentParser(description="Graph embedding server (JSON lines over TCP or a unix socket)")
+    parser.add_argument("--ckpt", required=True, type=str)
+    parser.add_argument("--host", default="127.0.0.1", type=str)
+    parser.add_argument("--port", default=8765, type=int)
+    parser.add_argument("--unix_socket", default=None, type=str)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu", type=str)
+    parser.add_argument("--max_batch_size", default=64, type=int)
+    parser.add_argument("--max_delay_ms", default=5.0, type=float)
+    parser.add_argument("--bucket_width", default=8, type=int)
+    args = parser.parse_args()
+    asyncio.run(run_server(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+from multiprocessing import Pool
+import numpy as np
+import torch
+
+
+class ShardedGraphCache(object):
+    """
+    Persistent, sharded on-disk store of clamped distance matrices.
+    Every shard holds the flattened uint8 distance matrices of its graphs together with
+    their offsets and node counts (masks and properties are derived from the node counts).
+    Shards are memory-mapped copy-on-write, so reading a graph does not copy it.
+    The cache directory is keyed by the graph family, graph_kwargs, seed and size, so
+    different configurations never collide.
+    """
+    version = 1
+
+    def __init__(self, root, graph_family, graph_kwargs=None, seed=0, num_samples=100000, shard_size=10000,
+                 split="train"):
+        if graph_kwargs is None:
+            graph_kwargs = {}
+        self.root = root
+        self.graph_family = graph_family
+        self.graph_kwargs = graph_kwargs
+        self.seed = seed
+        self.num_samples = num_samples
+        self.shard_size = shard_size
+        self.split = split
+        self.key = self.make_key(
+            version=self.version,
+            graph_family=graph_family,
+            graph_kwargs=graph_kwargs,
+            seed=seed,
+            num_samples=num_samples,
+            shard_size=shard_size,
+            split=split
+        )
+        self.path = os.path.join(root, "{}-{}-{}".format(graph_family, split, self.key))
+        self._shards = None
+
+    @staticmethod
+    def make_key(**config):
+        config = json.dumps(config, sort_keys=True, default=str)
+        return hashlib.sha1(config.encode()).hexdigest()[:16]
+
+    @property
+    def num_shards(self):
+        return (self.num_samples + self.shard_size - 1) // self.shard_size
+
+    def shard_range(self, shard_idx):
+        start = shard_idx * self.shard_size
+        stop = min(start + self.shard_size, self.num_samples)
+        return start, stop
+
+    def exists(self):
+        return os.path.isfile(os.path.join(self.path, "meta.json"))
+
+    def write(self, shard_fn, num_workers=1):
+        """
+        Generates and writes all shards. shard_fn(shard_idx, start, stop) has to return a
+        list of square uint8 arrays. Shards are written to a temporary directory that is
+        renamed once complete, so concurrent writers (e.g. several nodes) can not leave a
+        partial cache behind.
+        """
+        if self.exists():
+            return
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = "{}.tmp-{}".format(self.path, os.getpid())
+        os.makedirs(tmp_path, exist_ok=True)
+        jobs = [(shard_fn, tmp_path, shard_idx) + self.shard_range(shard_idx)
+                for shard_idx in range(self.num_shards)]
+        if num_workers > 1:
+            with Pool(num_workers) as pool:
+                pool.map(_write_shard, jobs)
+        else:
+            for job in jobs:
+                _write_shard(job)
+        meta = {
+            "graph_family": self.graph_family,
+            "graph_kwargs": self.graph_kwargs,
+            "seed": self.seed,
+            "num_samples": self.num_samples,
+            "shard_size": self.shard_size,
+            "split": self.split,
+            "version": self.version
+        }
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump(meta, f, default=str)
+        try:
+            os.rename(tmp_path, self.path)
+        except OSError:
+            # another process finished the same cache first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def open(self):
+        shards = []
+        for shard_idx in range(self.num_shards):
+            prefix = os.path.join(self.path, "shard_{:05d}".format(shard_idx))
+            shards.append((
+                np.load(prefix + ".dist.npy", mmap_mode="c"),
+                np.load(prefix + ".offsets.npy"),
+                np.load(prefix + ".num_nodes.npy"),
+            ))
+        self._shards = shards
+
+    def num_nodes(self, idx):
+        if self._shards is None:
+            self.open()
+        shard_idx, idx = divmod(idx, self.shard_size)
+        return int(self._shards[shard_idx][2][idx])
+
+    def __len__(self):
+        return self.num_samples
+
+    def __getitem__(self, idx):
+        if self._shards is None:
+            self.open()
+        shard_idx, idx = divmod(idx, self.shard_size)
+        dist, offsets, num_nodes = self._shards[shard_idx]
+        n = int(num_nodes[idx])
+        dm = dist[offsets[idx]:offsets[idx] + n * n].reshape(n, n)
+        return torch.from_numpy(dm)
+
+    def __getstate__(self):
+        # memory maps are reopened lazily in every (spawned) worker process
+        state = self.__dict__.copy()
+        state["_shards"] = None
+        return state
+
+
+def _write_shard(job):
+    shard_fn, path, shard_idx, start, stop = job
+    dms = shard_fn(shard_idx, start, stop)
+    num_nodes = np.array([dm.shape[0] for dm in dms], dtype=np.int64)
+    offsets = np.zeros(len(dms) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(num_nodes ** 2)
+    dist = np.concatenate([np.asarray(dm, dtype=np.uint8).ravel() for dm in dms])
+    prefix = os.path.join(path, "shard_{:05d}".format(shard_idx))
+    np.save(prefix + ".dist.npy", dist)
+    np.save(prefix + ".offsets.npy", offsets)
+    np.save(prefix + ".num_nodes.npy", num_nodes)
+
+
+class EdgeListGraphStore(object):
+    """
+    Fixed list of graphs with one label each, stored as edge lists: node counts [G], offsets [G + 1] into the
+    concatenated edges [E, 2] (int32) and labels [G]. With a path the arrays are saved as .npy files and
+    memory-mapped on first access, otherwise they are kept in memory. Like ShardedGraphCache.write, files are
+    written to a temporary directory that is renamed once complete.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self._arrays = None
+
+    def exists(self):
+        if self.path is None:
+            return self._arrays is not None
+        return os.path.isfile(os.path.join(self.path, "meta.json"))
+
+    def write(self, edge_lists, num_nodes, labels):
+        num_nodes = np.asarray(num_nodes, dtype=np.int64)
+        offsets = np.zeros(len(edge_lists) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(edges) for edges in edge_lists])
+        edges = np.concatenate([np.asarray(edges, dtype=np.int32).reshape(-1, 2) for edges in edge_lists])
+        arrays = {"num_nodes": num_nodes, "offsets": offsets, "edges": edges, "labels": np.asarray(labels)}
+        if self.path is None:
+            self._arrays = arrays
+            return
+        tmp_path = "{}.tmp-{}".format(self.path, os.getpid())
+        os.makedirs(tmp_path, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, name + ".npy"), array)
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"num_graphs": len(num_nodes), "num_edges": len(edges)}, f)
+        try:
+            os.rename(tmp_path, self.path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def open(self):
+        self._arrays = {name: np.load(os.path.join(self.path, name + ".npy"), mmap_mode="r")
+                        for name in ("num_nodes", "offsets", "edges", "labels")}
+
+    def __len__(self):
+        if self._arrays is None:
+            self.open()
+        return len(self._arrays["num_nodes"])
+
+    def __getitem__(self, idx):
+        """Edges [E, 2], number of nodes and label of graph idx."""
+        if self._arrays is None:
+            self.open()
+        offsets = self._arrays["offsets"]
+        edges = self._arrays["edges"][offsets[idx]:offsets[idx + 1]]
+        return edges, int(self._arrays["num_nodes"][idx]), self._arrays["labels"][idx].item()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.path is not None:
+            state["_arrays"] = None
+        return state
+
+
+def build_once(path, exists, build, rank=0, poll_interval=1.0, timeout=3600.0):
+    """
+    Runs build() on rank 0 unless exists() already holds, while the other ranks wait until it does. All ranks
+    synchronize on the file lock path + ".lock": rank 0 holds it exclusively while it checks and builds, the
+    other ranks poll for it shared (without blocking) until the result exists. If it does not exist after
+    timeout seconds (e.g. rank 0 crashed while building), they raise a TimeoutError naming path. timeout=None
+    waits forever.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    start = time.time()
+    while True:
+        with open(path + ".lock", "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if rank == 0 else fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # rank 0 is building
+                locked = False
+            else:
+                locked = True
+            try:
+                if locked and exists():
+                    return
+                if rank == 0:
+                    build()
+                    return
+            finally:
+                if locked:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        if timeout is not None and time.time() - start > timeout:
+            raise TimeoutError("{} was not built by rank 0 within {} s, check whether rank 0 failed while building "
+                               "it".format(path, timeout))
+        time.sleep(poll_interval)
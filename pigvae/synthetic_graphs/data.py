@@ -1,23 +1,83 @@
+import os
+import time
+from multiprocessing import Pool
 import numpy as np
 import torch
-from torch.utils.data import Dataset
+import torch.distributed as dist
+from torch.utils.data import Dataset, get_worker_info
 from torch.utils.data.distributed import DistributedSampler
 import random
+from functools import partial
+from argparse import ArgumentParser
 import pytorch_lightning as pl
 from torch_geometric.data import Data
 from torch_geometric.utils import from_networkx
 import networkx as nx
-from networkx.algorithms.shortest_paths.dense import floyd_warshall_numpy
 
 from networkx.generators.random_graphs import *
 from networkx.generators.ego import ego_graph
 from networkx.generators.geometric import random_geometric_graph
+from pigvae.synthetic_graphs.cache import ShardedGraphCache, EdgeListGraphStore, build_once
+from pigvae.synthetic_graphs.sampler import NodeCountBatchSampler
+from pigvae.synthetic_graphs.hyperparameter import add_arguments
+from pigvae.synthetic_graphs.generators import BatchedGraphGenerator, binomial_graphs, barabasi_albert_graphs, \
+    random_regular_graphs, random_geometric_graphs
 
 
+def sample_rng(seed, split, epoch, rank, idx, stream=0):
+    """
+    RandomState of a single sample, drawing from a counter-based Philox stream keyed by
+    (seed, split, epoch, rank, idx, stream). Cheap to create per sample.
+    """
+    return np.random.RandomState(np.random.Philox(np.random.SeedSequence([seed, split, epoch, rank, idx, stream])))
 
-class GeometricGraphDataset(Dataset):
-    def __init__(self, n_min=12, n_max=20, samples_per_epoch=100000, **kwargs):
+
+def nx_seed(rng):
+    """
+    random.Random seeded from rng, for the seed argument of the networkx generators. networkx wraps a
+    RandomState with a paretovariate that is off by one (numpy's pareto is Lomax), with which e.g.
+    random_powerlaw_tree never finds a valid tree.
+    """
+    return random.Random(int(rng.randint(2 ** 63 - 1, dtype=np.int64)))
+
+
+def sample_num_nodes(idx, n_min, n_max, rng=np.random):
+    """Node count of sample idx. Batch samplers that group samples by size pass idx as (idx, num_nodes)."""
+    if isinstance(idx, tuple):
+        return idx[1]
+    if n_min == n_max:
+        return n_min
+    return rng.randint(low=n_min, high=n_max)
+
+
+class SeededDataset(Dataset):
+    """
+    Base class of the synthetic datasets. Sample idx is generated with its own RNG (see sample_rng) instead of
+    the global np.random / random state, which forked DataLoader workers would share. The same index gives the
+    same graph in whichever worker it is generated, so samples are reproducible, no two workers or ranks
+    produce the same graph, and a sample can be regenerated (or cached) from its key. The split (0: train,
+    1: val, 2: the fixed eval datasets) keeps validation graphs apart from training graphs, set_epoch gives
+    fresh graphs every epoch.
+    """
+    def __init__(self, seed=0, split=0, rank=0):
         super().__init__()
+        self.seed = seed
+        self.split = split
+        self.rank = rank
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def rng(self, idx, stream=0):
+        if isinstance(idx, tuple):
+            idx = idx[0]
+        return sample_rng(self.seed, self.split, self.epoch, self.rank, idx, stream)
+
+
+class GeometricGraphDataset(SeededDataset):
+    def __init__(self, n_min=12, n_max=20, samples_per_epoch=100000, seed=0, split=0, rank=0, **kwargs):
+        super().__init__(seed, split, rank)
         self.n_min = n_min
         self.n_max = n_max
         self.samples_per_epoch = samples_per_epoch
@@ -26,14 +86,15 @@ class GeometricGraphDataset(Dataset):
         return self.samples_per_epoch
 
     def __getitem__(self, idx):
-        n = np.random.randint(low=self.n_min, high=self.n_max)
-        g = random_geometric_graph(n=n, radius=0.5)
+        rng = self.rng(idx)
+        n = sample_num_nodes(idx, self.n_min, self.n_max, rng)
+        g = random_geometric_graph(n=n, radius=0.5, seed=nx_seed(rng))
         return g
 
 
-class RegularGraphDataset(Dataset):
-    def __init__(self, n_min=12, n_max=20, samples_per_epoch=100000, **kwargs):
-        super().__init__()
+class RegularGraphDataset(SeededDataset):
+    def __init__(self, n_min=12, n_max=20, samples_per_epoch=100000, seed=0, split=0, rank=0, **kwargs):
+        super().__init__(seed, split, rank)
         self.n_min = n_min
         self.n_max = n_max
         self.samples_per_epoch = samples_per_epoch
@@ -42,15 +103,16 @@ class RegularGraphDataset(Dataset):
         return self.samples_per_epoch
 
     def __getitem__(self, idx):
-        n = np.random.randint(low=self.n_min, high=self.n_max)
-        g = random_regular_graph(n=n, d=4)
+        rng = self.rng(idx)
+        n = sample_num_nodes(idx, self.n_min, self.n_max, rng)
+        g = random_regular_graph(n=n, d=4, seed=nx_seed(rng))
         return g
 
 
-class BarabasiAlbertGraphDataset(Dataset):
+class BarabasiAlbertGraphDataset(SeededDataset):
     def __init__(self, n_min=12, n_max=20, m_min=1, m_max=5,
-                 samples_per_epoch=100000, **kwargs):
-        super().__init__()
+                 samples_per_epoch=100000, seed=0, split=0, rank=0, **kwargs):
+        super().__init__(seed, split, rank)
         self.n_min = n_min
         self.n_max = n_max
         self.m_min = m_min
@@ -61,22 +123,20 @@ class BarabasiAlbertGraphDataset(Dataset):
         return self.samples_per_epoch
 
     def __getitem__(self, idx):
-        if self.n_min == self.n_max:
-            n = self.m_min
-        else:
-            n = np.random.randint(low=self.n_min, high=self.n_max)
+        rng = self.rng(idx)
+        n = sample_num_nodes(idx, self.n_min, self.n_max, rng)
         if self.m_min == self.m_max:
             m = self.m_min
         else:
-            m = np.random.randint(low=self.m_min, high=self.m_max)
-        g = barabasi_albert_graph(n, m)
+            m = rng.randint(low=self.m_min, high=self.m_max)
+        g = barabasi_albert_graph(n, m, seed=nx_seed(rng))
         return g
 
 
-class BinomialGraphDataset(Dataset):
+class BinomialGraphDataset(SeededDataset):
     def __init__(self, n_min=12, n_max=20, p_min=0.4, p_max=0.6,
-                 samples_per_epoch=100000, pyg=False, **kwargs):
-        super().__init__()
+                 samples_per_epoch=100000, pyg=False, seed=0, split=0, rank=0, **kwargs):
+        super().__init__(seed, split, rank)
         self.n_min = n_min
         self.n_max = n_max
         self.p_min = p_min
@@ -93,20 +153,20 @@ class BinomialGraphDataset(Dataset):
         return g
 
     def __getitem__(self, idx):
-        n = np.random.randint(low=self.n_min, high=self.n_max)
+        rng = self.rng(idx)
+        n = sample_num_nodes(idx, self.n_min, self.n_max, rng)
         if self.p_min == self.p_max:
             p = self.p_min
         else:
-            p = np.random.randint(low=self.p_min, high=self.p_max)
-        p = np.random.uniform(low=self.p_min, high=self.p_max)
-        g = binomial_graph(n, p)
+            p = rng.uniform(low=self.p_min, high=self.p_max)
+        g = binomial_graph(n, p, seed=nx_seed(rng))
         if self.pyg:
             g = from_networkx(g)
         return g
 
-class RandomGraphDataset(Dataset):
-    def __init__(self, n_min=12, n_max=20, samples_per_epoch=100000, **kwargs):
-        super().__init__()
+class RandomGraphDataset(SeededDataset):
+    def __init__(self, n_min=12, n_max=20, samples_per_epoch=100000, seed=0, split=0, rank=0, **kwargs):
+        super().__init__(seed, split, rank)
         self.n_min = n_min
         self.n_max = n_max
         self.samples_per_epoch = samples_per_epoch
@@ -116,22 +176,270 @@ class RandomGraphDataset(Dataset):
         return self.samples_per_epoch
 
     def __getitem__(self, idx):
-        n = np.random.randint(low=self.n_min, high=self.n_max)
-        g = self.graph_generator(n)
+        rng = self.rng(idx)
+        n = sample_num_nodes(idx, self.n_min, self.n_max, rng)
+        g = self.graph_generator(n, rng=rng)
         return g
 
 
 class PyGRandomGraphDataset(RandomGraphDataset):
     def __getitem__(self, idx):
-        n = np.random.randint(low=self.n_min, high=self.n_max)
-        g = self.graph_generator(n)
+        rng = self.rng(idx)
+        n = sample_num_nodes(idx, self.n_min, self.n_max, rng)
+        g = self.graph_generator(n, rng=rng)
         g = from_networkx(g)
         if g.pos is not None:
             del g.pos
         return g
 
 
+class CachedGraphDataset(Dataset):
+    """
+    Serves clamped distance matrices from a ShardedGraphCache. A fresh_fraction of the samples
+    is generated anew by the wrapped dataset instead, so training still sees new graphs every epoch.
+    """
+    def __init__(self, cache, dataset, samples_per_epoch=100000, fresh_fraction=0.0):
+        super().__init__()
+        self.cache = cache
+        self.dataset = dataset
+        self.samples_per_epoch = samples_per_epoch
+        self.fresh_fraction = fresh_fraction
+
+    def __len__(self):
+        return self.samples_per_epoch
+
+    def num_nodes(self, idx):
+        return self.cache.num_nodes(idx % len(self.cache))
+
+    def set_epoch(self, epoch):
+        self.dataset.set_epoch(epoch)
+
+    def __getitem__(self, idx):
+        # a separate stream of the sample's RNG, so the choice does not correlate with the fresh graph
+        if self.fresh_fraction > 0 and self.dataset.rng(idx, stream=1).uniform() < self.fresh_fraction:
+            return distance_matrix(self.dataset[idx])
+        if isinstance(idx, tuple):
+            idx = idx[0]
+        return self.cache[idx % len(self.cache)]
+
+
+def generate_cache_shard(dataset, shard_idx, start, stop):
+    # samples are seeded by index (see SeededDataset), shards do not need their own seed
+    graphs = [dataset[idx] for idx in range(start, stop)]
+    adj, num_nodes = adjacency_matrix_batch(graphs)
+    dm = shortest_path_lengths(adj)
+    return [dm[i, :n, :n].numpy() for i, n in enumerate(num_nodes.tolist())]
+
+
+def adjacency_matrix_batch(graphs):
+    """Zero-padded adjacency matrices [B, N, N] and node counts [B] of a list of networkx graphs."""
+    num_nodes = torch.LongTensor([graph.number_of_nodes() for graph in graphs])
+    max_num_nodes = int(num_nodes.max())
+    adj = np.zeros((len(graphs), max_num_nodes, max_num_nodes), dtype=np.float32)
+    for i, graph in enumerate(graphs):
+        n = graph.number_of_nodes()
+        adj[i, :n, :n] = nx.to_numpy_array(graph, dtype=np.float32)
+    return torch.from_numpy(adj), num_nodes
+
+
+def shortest_path_lengths(adj, max_distance=5):
+    """
+    All-pairs shortest path lengths of a batch of (padded) adjacency matrices [B, N, N], clamped to
+    max_distance. Unreachable pairs are 0, like the clamped networkx Floyd-Warshall output used before.
+    Distances up to max_distance - 1 come from BFS frontiers (one batched matmul each), the remaining
+    reachable pairs from a boolean transitive closure by repeated squaring.
+    """
+    adj = (adj > 0).float()
+    num_nodes = adj.size(-1)
+    reached = torch.eye(num_nodes, dtype=torch.bool, device=adj.device).expand_as(adj).clone()
+    frontier = reached.float()
+    dist = torch.zeros(adj.shape, dtype=torch.uint8, device=adj.device)
+    for d in range(1, max_distance):
+        frontier = (torch.matmul(frontier, adj) > 0) & ~reached
+        dist.masked_fill_(frontier, d)
+        reached |= frontier
+        frontier = frontier.float()
+    reachable, hops = reached, max_distance - 1
+    while hops < num_nodes - 1:
+        reachable = torch.matmul(reachable.float(), reachable.float()) > 0
+        hops *= 2
+    dist.masked_fill_(reachable & ~reached, max_distance)
+    return dist
+
+
+def distance_matrix(graph, max_distance=5):
+    """Shortest path lengths [n, n] of a single networkx graph, see shortest_path_lengths."""
+    adj, _ = adjacency_matrix_batch([graph])
+    return shortest_path_lengths(adj, max_distance)[0]
+
+
+class BatchedGraphDataset(SeededDataset):
+    """
+    Every item is a whole DenseGraphBatch whose adjacency matrices are sampled directly as tensors
+    (see generators.py) instead of one networkx graph at a time. Load it with batch_size=None.
+    Batch idx is drawn from a torch.Generator seeded from the RNG of idx (see SeededDataset).
+    """
+    def __init__(self, graph_family, batch_size=32, n_min=12, n_max=20, p_min=0.4, p_max=0.6, m_min=1, m_max=5,
+                 samples_per_epoch=100000, seed=0, split=0, rank=0, **kwargs):
+        super().__init__(seed, split, rank)
+        self.graph_family = graph_family
+        self.batch_size = batch_size
+        self.n_min = n_min
+        self.n_max = n_max
+        self.p_min = p_min
+        self.p_max = p_max
+        self.m_min = m_min
+        self.m_max = m_max
+        self.samples_per_epoch = samples_per_epoch
+        self.batched_graph_generator = BatchedGraphGenerator()
+        self.graph_generator = GraphGenerator()
+
+    def __len__(self):
+        return self.samples_per_epoch // self.batch_size
+
+    def sample_adjacency(self, num_nodes, generator=None, rng=np.random):
+        batch_size = num_nodes.size(0)
+        if self.graph_family == "binomial":
+            p = self.p_min + (self.p_max - self.p_min) * torch.rand(batch_size, generator=generator)
+            adj = binomial_graphs(num_nodes, p, generator=generator)
+        elif self.graph_family == "barabasi_albert":
+            if self.m_min == self.m_max:
+                m = self.m_min
+            else:
+                m = torch.randint(self.m_min, self.m_max, (batch_size,), generator=generator)
+            adj = barabasi_albert_graphs(num_nodes, m, generator=generator)
+        elif self.graph_family == "regular":
+            adj = random_regular_graphs(num_nodes, d=4, generator=generator)
+        elif self.graph_family == "geometric":
+            adj = random_geometric_graphs(num_nodes, radius=0.5, generator=generator)
+        elif self.graph_family == "all":
+            adj, num_nodes = self.sample_mixture(num_nodes, generator, rng)
+        else:
+            raise NotImplementedError
+        return adj, num_nodes
+
+    def sample_mixture(self, num_nodes, generator=None, rng=np.random):
+        graph_types = self.graph_generator.graph_types
+        graph_type_idx = torch.randint(len(graph_types), (num_nodes.size(0),), generator=generator)
+        max_num_nodes = int(num_nodes.max())
+        adj = torch.zeros((num_nodes.size(0), max_num_nodes, max_num_nodes), dtype=torch.bool)
+        num_nodes = num_nodes.clone()
+        for i, graph_type in enumerate(graph_types):
+            idx = (graph_type_idx == i).nonzero().squeeze(1)
+            if len(idx) == 0:
+                continue
+            if graph_type in self.batched_graph_generator.graph_types:
+                sub_adj, sub_num_nodes = self.batched_graph_generator(num_nodes[idx], graph_type, generator)
+            else:
+                # no tensor implementation for this graph type, fall back to networkx
+                graphs = [self.graph_generator(n, graph_type, rng) for n in num_nodes[idx].tolist()]
+                sub_adj, sub_num_nodes = adjacency_matrix_batch(graphs)
+            adj[idx, :sub_adj.size(1), :sub_adj.size(2)] = sub_adj > 0
+            num_nodes[idx] = sub_num_nodes
+        return adj, num_nodes
+
+    def __getitem__(self, idx):
+        rng = self.rng(idx)
+        generator = torch.Generator().manual_seed(int(rng.randint(2 ** 63 - 1, dtype=np.int64)))
+        if self.n_min == self.n_max:
+            num_nodes = torch.full((self.batch_size,), self.n_min, dtype=torch.long)
+        else:
+            num_nodes = torch.randint(self.n_min, self.n_max, (self.batch_size,), generator=generator)
+        adj, num_nodes = self.sample_adjacency(num_nodes, generator, rng)
+        return DenseGraphBatch.from_distances(shortest_path_lengths(adj), num_nodes)
+
+
+class TimedDataset(Dataset):
+    """
+    Wraps a dataset and accumulates the time spent in its __getitem__ (graph generation). Every DataLoader
+    worker has its own copy, which the collate function of the same worker reads (see collate_with_loader_stats).
+    """
+    def __init__(self, dataset):
+        super().__init__()
+        self.dataset = dataset
+        self.generation_time = 0.0
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        start = time.perf_counter()
+        item = self.dataset[idx]
+        self.generation_time += time.perf_counter() - start
+        return item
+
+    def pop_generation_time(self):
+        generation_time, self.generation_time = self.generation_time, 0.0
+        return generation_time
+
+
+def collate_with_loader_stats(data_list, dataset, labels=False, distance_matrices=False, sparse=False):
+    """
+    Same batch as the collate functions of DenseGraphDataLoader, with batch.loader_stats: seconds spent in
+    graph generation, shortest paths and tensor assembly, the padding ratio and the id of the worker.
+    Batches that come from the dataset as a whole count as generation only.
+    """
+    stats = {"generation_s": dataset.pop_generation_time(), "shortest_paths_s": 0.0}
+    start = time.perf_counter()
+    if isinstance(data_list, DenseGraphBatch):
+        batch = data_list
+    elif sparse:
+        batch = SparseGraphBatch.from_graph_list(data_list, labels)
+    elif distance_matrices:
+        batch = DenseGraphBatch.from_distance_matrix_list(data_list, labels)
+    else:
+        y = None
+        if labels:
+            data_list, y = zip(*data_list)
+        adj, num_nodes = adjacency_matrix_batch(data_list)
+        shortest_paths_start = time.perf_counter()
+        dm = shortest_path_lengths(adj)
+        stats["shortest_paths_s"] = time.perf_counter() - shortest_paths_start
+        batch = DenseGraphBatch.from_distances(dm, num_nodes, y=y)
+    stats["assembly_s"] = time.perf_counter() - start - stats["shortest_paths_s"]
+    if isinstance(batch, SparseGraphBatch):
+        num_nodes, max_num_nodes = batch.sizes.float(), batch.max_num_nodes
+    else:
+        num_nodes, max_num_nodes = batch.mask.sum(1).float(), batch.mask.size(1)
+    stats["padding_ratio"] = 1 - float((num_nodes ** 2).sum()) / (num_nodes.size(0) * max_num_nodes ** 2)
+    worker_info = get_worker_info()
+    stats["worker_id"] = worker_info.id if worker_info is not None else -1
+    batch.loader_stats = stats
+    return batch
+
+
+def pack_edge_features(edge_features):
+    """Strict upper triangle of symmetric pair features [B, N, N, ...] as [B, N * (N - 1) / 2, ...]."""
+    num_nodes = edge_features.size(1)
+    i, j = torch.triu_indices(num_nodes, num_nodes, offset=1, device=edge_features.device)
+    return edge_features[:, i, j]
+
+
+def unpack_edge_features(packed_edge_features, num_nodes):
+    """Inverse of pack_edge_features, the diagonal is zero."""
+    batch_size = packed_edge_features.size(0)
+    i, j = torch.triu_indices(num_nodes, num_nodes, offset=1, device=packed_edge_features.device)
+    edge_features = packed_edge_features.new_zeros(
+        (batch_size, num_nodes, num_nodes) + packed_edge_features.shape[2:])
+    edge_features[:, i, j] = packed_edge_features
+    edge_features[:, j, i] = packed_edge_features
+    return edge_features
+
+
+def one_hot_distances(dm, max_distance=5):
+    """One-hot float encoding [B, N, N, max_distance + 1] of clamped distance matrices [B, N, N]."""
+    edge_features = torch.zeros(dm.shape + (max_distance + 1,), device=dm.device)
+    return edge_features.scatter_(3, dm.long().unsqueeze(-1), 1)
+
+
 class DenseGraphBatch(Data):
+    """
+    Padded batch of graphs. Batches of real graphs (from_distances) only hold the clamped distances as uint8
+    [B, N, N], the mask and the properties. edge_features (one-hot distances) and node_features (ones) are
+    expanded the first time they are read, e.g. by GraphEncoder, and kept. As that happens after the batch
+    was moved to its device, worker IPC, pinned memory and the host-to-device copy move 1 byte per node
+    pair instead of 24.
+    """
     def __init__(self, node_features, edge_features, mask, **kwargs):
         self.node_features = node_features
         self.edge_features = edge_features
@@ -139,57 +447,155 @@ class DenseGraphBatch(Data):
         for key, item in kwargs.items():
             setattr(self, key, item)
 
+    @property
+    def edge_features(self):
+        if self._edge_features is None and getattr(self, "distances", None) is not None:
+            self._edge_features = one_hot_distances(self.distances, self.max_distance)
+        return self._edge_features
+
+    @edge_features.setter
+    def edge_features(self, edge_features):
+        self._edge_features = edge_features
+
+    @property
+    def node_features(self):
+        if self._node_features is None and getattr(self, "distances", None) is not None:
+            self._node_features = torch.ones(self.mask.shape + (1,), device=self.mask.device)
+        return self._node_features
+
+    @node_features.setter
+    def node_features(self, node_features):
+        self._node_features = node_features
+
     @classmethod
     def from_sparse_graph_list(cls, data_list, labels=False):
+        y = None
         if labels:
-            max_num_nodes = max([graph.number_of_nodes() for graph, label in data_list])
-        else:
-            max_num_nodes = max([graph.number_of_nodes() for graph in data_list])
-        node_features = []
-        edge_features = []
-        mask = []
-        y = []
-        props = []
-        for data in data_list:
-            if labels:
-                graph, label = data
-                y.append(label)
-            else:
-                graph = data
-            num_nodes = graph.number_of_nodes()
-            props.append(torch.Tensor([num_nodes]))
-            graph.add_nodes_from([i for i in range(num_nodes, max_num_nodes)])
-            nf = torch.ones(max_num_nodes, 1)
-            node_features.append(nf.unsqueeze(0))
-            dm = torch.from_numpy(floyd_warshall_numpy(graph)).long()
-            dm = torch.clamp(dm, 0, 5).unsqueeze(-1)
-            num_nodes = dm.size(1)
-            dm = torch.zeros((num_nodes, num_nodes, 6)).type_as(dm).scatter_(2, dm, 1).float()
-            edge_features.append(dm)
-            mask.append((torch.arange(max_num_nodes) < num_nodes).unsqueeze(0))
-        node_features = torch.cat(node_features, dim=0)
-        edge_features = torch.stack(edge_features, dim=0)
-        mask = torch.cat(mask, dim=0)
-        props = torch.cat(props, dim=0)
-        batch = cls(node_features=node_features, edge_features=edge_features, mask=mask, properties=props)
+            data_list, y = zip(*data_list)
+        adj, num_nodes = adjacency_matrix_batch(data_list)
+        dm = shortest_path_lengths(adj)
+        return cls.from_distances(dm, num_nodes, y=y)
+
+    @classmethod
+    def from_distance_matrix_list(cls, data_list, labels=False):
+        """Batches clamped distance matrices (as returned by distance_matrix) of varying size."""
+        y = None
         if labels:
-            batch.y = torch.Tensor(y)
+            data_list, y = zip(*data_list)
+        num_nodes = torch.LongTensor([dm.size(0) for dm in data_list])
+        max_num_nodes = int(num_nodes.max())
+        dm = torch.zeros((len(data_list), max_num_nodes, max_num_nodes), dtype=torch.uint8)
+        for i, d in enumerate(data_list):
+            dm[i, :d.size(0), :d.size(1)] = d
+        return cls.from_distances(dm, num_nodes, y=y)
+
+    @classmethod
+    def from_distances(cls, dm, num_nodes, y=None, max_distance=5):
+        """
+        Builds a batch from padded, clamped distance matrices [B, N, N] and node counts [B]. The features are
+        expanded lazily, see DenseGraphBatch.
+        """
+        max_num_nodes, device = dm.size(1), dm.device
+        mask = torch.arange(max_num_nodes, device=device).unsqueeze(0) < num_nodes.unsqueeze(1)
+        props = num_nodes.float()
+        batch = cls(node_features=None, edge_features=None, mask=mask, properties=props,
+                    distances=dm.to(torch.uint8), max_distance=max_distance)
+        if y is not None:
+            batch.y = torch.as_tensor(y, dtype=torch.float, device=device)
         return batch
 
     def __repr__(self):
-        repr_list = ["{}={}".format(key, list(value.shape)) for key, value in self.__dict__.items()]
+        # lazily expanded features are stored as _node_features and _edge_features
+        repr_list = ["{}={}".format(key.lstrip("_"), list(value.shape) if torch.is_tensor(value) else value)
+                     for key, value in self.__dict__.items() if value is not None]
         return "DenseGraphBatch({})".format(", ".join(repr_list))
 
 
+class SparseGraphBatch(Data):
+    """
+    Compact batch of graphs that the DataLoader workers ship instead of a DenseGraphBatch: the edges as int32
+    edge_index [2, E] in the node numbering of the padded batch (node u of graph g is g * max_num_nodes + u),
+    the node counts sizes [B] and the labels y. That is 8 bytes per edge instead of 1 per padded node pair
+    (the uint8 distances of a DenseGraphBatch) and no shortest paths in the workers. to_dense() builds the
+    DenseGraphBatch (padded adjacency, clamped shortest paths and mask) without host synchronization on the
+    device the batch was moved to, see PLGraphAE.on_after_batch_transfer.
+    """
+    def __init__(self, edge_index, sizes, max_num_nodes, **kwargs):
+        self.edge_index = edge_index
+        self.sizes = sizes
+        self.max_num_nodes = max_num_nodes
+        for key, item in kwargs.items():
+            setattr(self, key, item)
+
+    @classmethod
+    def from_graph_list(cls, data_list, labels=False):
+        """Batches networkx graphs or torch_geometric Data objects (edge_index and num_nodes)."""
+        y = None
+        if labels:
+            data_list, y = zip(*data_list)
+        sizes, edge_lists = [], []
+        for graph in data_list:
+            if isinstance(graph, Data):
+                sizes.append(graph.num_nodes)
+                edge_lists.append(graph.edge_index.t())
+            else:
+                if not all(u == i for i, u in enumerate(graph.nodes)):
+                    graph = nx.convert_node_labels_to_integers(graph)
+                sizes.append(graph.number_of_nodes())
+                edge_lists.append(torch.tensor(list(graph.edges()), dtype=torch.long).view(-1, 2))
+        max_num_nodes = max(sizes)
+        edge_index = torch.cat([edges + i * max_num_nodes for i, edges in enumerate(edge_lists)])
+        batch = cls(edge_index=edge_index.t().to(torch.int32).contiguous(), sizes=torch.LongTensor(sizes),
+                    max_num_nodes=max_num_nodes)
+        if y is not None:
+            batch.y = torch.Tensor(y)
+        return batch
+
+    def to_dense(self, max_distance=5):
+        batch_size, num_nodes = self.sizes.size(0), self.max_num_nodes
+        row, col = self.edge_index.long()
+        # flat index of pair (u, v) of graph g is (g * num_nodes + u) * num_nodes + v
+        adj = torch.zeros(batch_size * num_nodes * num_nodes, device=self.edge_index.device)
+        adj[row * num_nodes + col % num_nodes] = 1
+        adj[col * num_nodes + row % num_nodes] = 1
+        dm = shortest_path_lengths(adj.view(batch_size, num_nodes, num_nodes), max_distance)
+        batch = DenseGraphBatch.from_distances(dm, self.sizes, y=getattr(self, "y", None), max_distance=max_distance)
+        if getattr(self, "loader_stats", None) is not None:
+            batch.loader_stats = self.loader_stats
+        return batch
+
+    def __repr__(self):
+        repr_list = ["{}={}".format(key, list(value.shape) if torch.is_tensor(value) else value)
+                     for key, value in self.__dict__.items() if value is not None]
+        return "SparseGraphBatch({})".format(", ".join(repr_list))
+
+
 class DenseGraphDataLoader(torch.utils.data.DataLoader):
-    def __init__(self, dataset, batch_size=1, shuffle=False, labels=False, **kwargs):
-        super().__init__(dataset, batch_size, shuffle,
-                         collate_fn=lambda data_list: DenseGraphBatch.from_sparse_graph_list(data_list, labels), **kwargs)
+    def __init__(self, dataset, batch_size=1, shuffle=False, labels=False, distance_matrices=False,
+                 loader_stats=False, sparse=False, **kwargs):
+        if loader_stats:
+            # batches carry their generation and collate times, see collate_with_loader_stats
+            dataset = TimedDataset(dataset)
+            collate_fn = partial(collate_with_loader_stats, dataset=dataset, labels=labels,
+                                 distance_matrices=distance_matrices, sparse=sparse)
+        elif batch_size is None:
+            # the dataset already returns batches
+            collate_fn = lambda batch: batch
+        elif sparse:
+            # densified on the device, see SparseGraphBatch
+            collate_fn = lambda data_list: SparseGraphBatch.from_graph_list(data_list, labels)
+        elif distance_matrices:
+            collate_fn = lambda data_list: DenseGraphBatch.from_distance_matrix_list(data_list, labels)
+        else:
+            collate_fn = lambda data_list: DenseGraphBatch.from_sparse_graph_list(data_list, labels)
+        super().__init__(dataset, batch_size, shuffle, collate_fn=collate_fn, **kwargs)
 
 
 class GraphDataModule(pl.LightningDataModule):
     def __init__(self, graph_family, graph_kwargs=None, samples_per_epoch=100000, batch_size=32,
-                 distributed_sampler=True, num_workers=1):
+                 distributed_sampler=True, num_workers=1, cache_dir=None, cache_size=None, cache_seed=0,
+                 cache_fresh_fraction=0.0, cache_shard_size=10000, generator="networkx", max_batch_cost=None,
+                 batch_cost="padded", loader_stats=False, seed=0, sparse_batches=False):
         super().__init__()
         if graph_kwargs is None:
             graph_kwargs = {}
@@ -199,28 +605,123 @@ class GraphDataModule(pl.LightningDataModule):
         self.num_workers = num_workers
         self.batch_size = batch_size
         self.distributed_sampler = distributed_sampler
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size if cache_size is not None else samples_per_epoch
+        self.cache_seed = cache_seed
+        self.cache_fresh_fraction = cache_fresh_fraction
+        self.cache_shard_size = cache_shard_size
+        self.generator = generator
+        self.max_batch_cost = max_batch_cost
+        self.batch_cost = batch_cost
+        self.loader_stats = loader_stats
+        self.seed = seed
+        self.sparse_batches = sparse_batches
+        self.epoch = 0
         self.train_dataset = None
         self.eval_dataset = None
         self.train_sampler = None
         self.eval_sampler = None
 
-    def make_dataset(self, samples_per_epoch):
-        if self.graph_family == "binomial":
-            ds = BinomialGraphDataset(samples_per_epoch=samples_per_epoch, **self.graph_kwargs)
+    @classmethod
+    def from_hparams(cls, hparams, **kwargs):
+        """
+        GraphDataModule of the command line arguments (see hyperparameter.py), kwargs take precedence. Arguments
+        missing in hparams (e.g. older configs) take the defaults of hyperparameter.py.
+        """
+        hparams = {**add_arguments(ArgumentParser()).parse_args([]).__dict__, **hparams}
+        graph_kwargs = {key: hparams[key] for key in ("n_min", "n_max", "m_min", "m_max", "p_min", "p_max")}
+        kwargs = {
+            "graph_family": hparams["graph_family"],
+            "graph_kwargs": graph_kwargs,
+            "batch_size": hparams["batch_size"],
+            "num_workers": hparams["num_workers"],
+            "generator": hparams["generator"],
+            "max_batch_cost": hparams["max_batch_cost"] if hparams["max_batch_cost"] > 0 else None,
+            "batch_cost": hparams["batch_cost"],
+            "cache_dir": hparams["cache_dir"] if hparams["cache_dir"] != "" else None,
+            "cache_size": hparams["cache_size"],
+            "cache_seed": hparams["cache_seed"],
+            "cache_fresh_fraction": hparams["cache_fresh_fraction"],
+            "loader_stats": hparams["loader_telemetry_every_n_steps"] > 0,
+            "seed": hparams["data_seed"],
+            "sparse_batches": hparams["sparse_batches"],
+            **kwargs
+        }
+        return cls(**kwargs)
+
+    @property
+    def rank(self):
+        if self.distributed_sampler and dist.is_available() and dist.is_initialized():
+            return dist.get_rank()
+        return 0
+
+    def make_dataset(self, samples_per_epoch, generator=None, seed=None, split=0, rank=0):
+        """Dataset of graph_family, samples are seeded by (seed, split, epoch, rank, idx), see SeededDataset."""
+        if generator is None:
+            generator = self.generator
+        seeding = {"seed": self.seed if seed is None else seed, "split": split, "rank": rank}
+        if generator == "tensor":
+            ds = BatchedGraphDataset(
+                graph_family=self.graph_family,
+                batch_size=self.batch_size,
+                samples_per_epoch=samples_per_epoch,
+                **seeding,
+                **self.graph_kwargs
+            )
+        elif generator != "networkx":
+            raise NotImplementedError
+        elif self.graph_family == "binomial":
+            ds = BinomialGraphDataset(samples_per_epoch=samples_per_epoch, **seeding, **self.graph_kwargs)
         elif self.graph_family == "barabasi_albert":
-            ds = BarabasiAlbertGraphDataset(samples_per_epoch=samples_per_epoch, **self.graph_kwargs)
+            ds = BarabasiAlbertGraphDataset(samples_per_epoch=samples_per_epoch, **seeding, **self.graph_kwargs)
         elif self.graph_family == "regular":
-            ds = RegularGraphDataset(samples_per_epoch=samples_per_epoch, **self.graph_kwargs)
+            ds = RegularGraphDataset(samples_per_epoch=samples_per_epoch, **seeding, **self.graph_kwargs)
         elif self.graph_family == "geometric":
-            ds = GeometricGraphDataset(samples_per_epoch=samples_per_epoch)
+            ds = GeometricGraphDataset(samples_per_epoch=samples_per_epoch, **seeding)
         elif self.graph_family == "all":
-            ds = RandomGraphDataset(samples_per_epoch=samples_per_epoch)
+            ds = RandomGraphDataset(samples_per_epoch=samples_per_epoch, **seeding)
         else:
             raise NotImplementedError
         return ds
 
+    def make_cache(self, split, num_samples):
+        cache = ShardedGraphCache(
+            root=self.cache_dir,
+            graph_family=self.graph_family,
+            graph_kwargs=self.graph_kwargs,
+            seed=self.cache_seed,
+            num_samples=num_samples,
+            shard_size=self.cache_shard_size,
+            split=split
+        )
+        if not cache.exists():
+            # the cache key (graph family, kwargs, cache seed, size and split) seeds its samples
+            dataset = self.make_dataset(samples_per_epoch=num_samples, generator="networkx",
+                                        seed=int(cache.key, 16))
+            shard_fn = partial(generate_cache_shard, dataset)
+            cache.write(shard_fn, num_workers=self.num_workers)
+        return cache
+
+    def prepare_data(self):
+        if self.cache_dir is not None:
+            self.make_cache("train", self.cache_size)
+            self.make_cache("val", 4096)
+
     def train_dataloader(self):
-        self.train_dataset = self.make_dataset(samples_per_epoch=self.samples_per_epoch)
+        if self.cache_dir is not None:
+            self.train_dataset = CachedGraphDataset(
+                cache=self.make_cache("train", self.cache_size),
+                dataset=self.make_dataset(samples_per_epoch=self.samples_per_epoch, generator="networkx",
+                                          rank=self.rank),
+                samples_per_epoch=self.samples_per_epoch,
+                fresh_fraction=self.cache_fresh_fraction
+            )
+        else:
+            self.train_dataset = self.make_dataset(samples_per_epoch=self.samples_per_epoch, rank=self.rank)
+        trainer = getattr(self, "trainer", None)
+        self.set_epoch(trainer.current_epoch if trainer is not None else self.epoch)
+        if self.max_batch_cost is not None and not isinstance(self.train_dataset, BatchedGraphDataset):
+            return self.make_size_bucketed_dataloader(self.train_dataset)
         if self.distributed_sampler:
             train_sampler = DistributedSampler(
                 dataset=self.train_dataset,
@@ -230,14 +731,62 @@ class GraphDataModule(pl.LightningDataModule):
             train_sampler = None
         return DenseGraphDataLoader(
             dataset=self.train_dataset,
-            batch_size=self.batch_size,
+            batch_size=None if isinstance(self.train_dataset, BatchedGraphDataset) else self.batch_size,
             num_workers=self.num_workers,
             pin_memory=True,
             sampler=train_sampler,
+            distance_matrices=self.cache_dir is not None,
+            loader_stats=self.loader_stats,
+            sparse=self.sparse(self.train_dataset),
         )
 
+    def make_size_bucketed_dataloader(self, dataset):
+        if self.distributed_sampler:
+            # same rank and world size as the DistributedSampler would use
+            num_replicas, rank = None, None
+        else:
+            num_replicas, rank = 1, 0
+        self.train_sampler = NodeCountBatchSampler(
+            dataset=dataset,
+            max_cost=self.max_batch_cost,
+            cost=self.batch_cost,
+            num_replicas=num_replicas,
+            rank=rank,
+            seed=self.seed,
+        )
+        self.train_sampler.set_epoch(self.epoch)
+        return DenseGraphDataLoader(
+            dataset=dataset,
+            num_workers=self.num_workers,
+            pin_memory=True,
+            batch_sampler=self.train_sampler,
+            distance_matrices=self.cache_dir is not None,
+            loader_stats=self.loader_stats,
+            sparse=self.sparse(dataset),
+        )
+
+    def sparse(self, dataset):
+        """Whether the loader of dataset ships SparseGraphBatches, only graphs that are not yet batched or cached."""
+        return self.sparse_batches and isinstance(dataset, SeededDataset) \
+            and not isinstance(dataset, BatchedGraphDataset)
+
+    def set_epoch(self, epoch):
+        """
+        Epoch hook: the training samples (and the size-bucketed batches) of the next iteration of the train
+        DataLoader are drawn for epoch. Called by train_dataloader and at the start of every training epoch.
+        """
+        self.epoch = epoch
+        if self.train_dataset is not None:
+            self.train_dataset.set_epoch(epoch)
+        if self.train_sampler is not None:
+            self.train_sampler.set_epoch(epoch)
+
     def val_dataloader(self):
-        self.eval_dataset = self.make_dataset(samples_per_epoch=4096)
+        if self.cache_dir is not None:
+            self.eval_dataset = self.make_cache("val", 4096)
+        else:
+            # the same validation graphs every epoch, on any number of ranks
+            self.eval_dataset = self.make_dataset(samples_per_epoch=4096, split=1)
         if self.distributed_sampler:
             eval_sampler = DistributedSampler(
                 dataset=self.eval_dataset,
@@ -247,10 +796,12 @@ class GraphDataModule(pl.LightningDataModule):
             eval_sampler = None
         return DenseGraphDataLoader(
             dataset=self.eval_dataset,
-            batch_size=self.batch_size,
+            batch_size=None if isinstance(self.eval_dataset, BatchedGraphDataset) else self.batch_size,
             num_workers=self.num_workers,
             pin_memory=True,
             sampler=eval_sampler,
+            distance_matrices=self.cache_dir is not None,
+            sparse=self.sparse(self.eval_dataset),
         )
 
 
@@ -269,12 +820,12 @@ class GraphGenerator(object):
                     "p": (0.2, 0.6)
                 }
             },
-            """"binominal_ego": {
-                "func": binomial_ego_graph,
-                "kwargs_float_ranges": {
-                    "p": (0.2, 0.6)
-                }
-            },"""
+            # "binominal_ego": {
+            #     "func": binomial_ego_graph,
+            #     "kwargs_float_ranges": {
+            #         "p": (0.2, 0.6)
+            #     }
+            # },
             "newman_watts_strogatz": {
                 "func": newman_watts_strogatz_graph,
                 "kwargs_int_ranges": {
@@ -354,19 +905,25 @@ class GraphGenerator(object):
         }
         self.graph_types = list(self.graph_params.keys())
 
-    def __call__(self, n, graph_type=None):
+    def __call__(self, n, graph_type=None, rng=None):
+        """Random graph with n nodes, drawn from rng (a np.random.RandomState) or the global RNG if None."""
         if graph_type is None:
-            graph_type = random.choice(self.graph_types)
+            if rng is None:
+                graph_type = random.choice(self.graph_types)
+            else:
+                graph_type = self.graph_types[rng.randint(len(self.graph_types))]
         params = self.graph_params[graph_type]
         kwargs = {}
         if "kwargs" in params:
             kwargs = {**params["kwargs"]}
         if "kwargs_int_ranges" in params:
             for key, arg in params["kwargs_int_ranges"].items():
-                kwargs[key] = np.random.randint(arg[0], arg[1] + 1)
+                kwargs[key] = (np.random if rng is None else rng).randint(arg[0], arg[1] + 1)
         if "kwargs_float_ranges" in params:
             for key, arg in params["kwargs_float_ranges"].items():
-                kwargs[key] = np.random.uniform(arg[0], arg[1])
+                kwargs[key] = (np.random if rng is None else rng).uniform(arg[0], arg[1])
+        if rng is not None:
+            kwargs["seed"] = nx_seed(rng)
 
         # check if d * n even
         if graph_type == "random_regular":
@@ -375,12 +932,106 @@ class GraphGenerator(object):
         try:
             g = params["func"](n=n, **kwargs)
         except nx.exception.NetworkXError:
-            g = self(n)
+            g = self(n, rng=rng)
         return g
 
 
-class EvalRandomGraphDataset(Dataset):
-    def __init__(self, n, pyg=False):
+def eval_graph(func, kwargs, label, rng, max_tries=100):
+    """
+    One graph of a fixed eval setting and its label. Failed attempts (e.g. random_powerlaw_tree) are redrawn,
+    up to max_tries times.
+    """
+    seed = nx_seed(rng)
+    for _ in range(max_tries):
+        try:
+            return func(seed=seed, **kwargs), label
+        except nx.exception.NetworkXError:
+            continue
+    raise nx.NetworkXError("failed to generate {}({}) in {} tries".format(
+        func.__name__, ", ".join("{}={}".format(key, value) for key, value in kwargs.items()), max_tries))
+
+
+def eval_binomial_graph(n_min, n_max, p_min, p_max, rng):
+    n = rng.randint(low=n_min, high=n_max)
+    p = rng.uniform(low=p_min, high=p_max)
+    return binomial_graph(n, p, seed=nx_seed(rng)), p
+
+
+def generate_edge_lists(job):
+    """Edge lists, node counts and labels of the eval graphs start to stop, all drawn by sample_fn(rng)."""
+    sample_fn, seed, start, stop = job
+    edge_lists, num_nodes, labels = [], [], []
+    for idx in range(start, stop):
+        g, label = sample_fn(sample_rng(seed, 2, 0, 0, idx))
+        g = nx.convert_node_labels_to_integers(g)
+        edge_lists.append(np.array(list(g.edges()), dtype=np.int32).reshape(-1, 2))
+        num_nodes.append(g.number_of_nodes())
+        labels.append(label)
+    return edge_lists, num_nodes, labels
+
+
+class EdgeListEvalDataset(Dataset):
+    """
+    Base class of the fixed eval datasets. The graphs are generated once, spread over a pool of num_workers
+    processes, and kept as edge lists (see EdgeListGraphStore). Graph idx is drawn from sample_rng(seed, 2, 0, 0,
+    idx), so the result does not depend on num_workers. With root the store is saved to disk under a key of
+    config(): rank 0 generates it while the other ranks wait on its file lock, later constructions (and all
+    other ranks) memory-map it.
+    Subclasses implement config() and sample_fns(), a list of (sample_fn, num_graphs) with sample_fn(rng)
+    returning a networkx graph and its label.
+    """
+    version = 1
+
+    def __init__(self, root=None, num_workers=1, seed=0, shuffle=False, chunk_size=64):
+        self.seed = seed
+        self.shuffle = shuffle
+        if root is None:
+            self.store = EdgeListGraphStore()
+            self.build(num_workers, chunk_size)
+        else:
+            key = ShardedGraphCache.make_key(
+                version=self.version, seed=seed, shuffle=shuffle, **self.config())
+            self.store = EdgeListGraphStore(os.path.join(root, "{}-{}".format(type(self).__name__, key)))
+            rank = dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+            build_once(self.store.path, self.store.exists, partial(self.build, num_workers, chunk_size), rank)
+
+    def config(self):
+        raise NotImplementedError
+
+    def sample_fns(self):
+        raise NotImplementedError
+
+    def build(self, num_workers=1, chunk_size=64):
+        jobs, start = [], 0
+        for sample_fn, num_graphs in self.sample_fns():
+            for chunk_start in range(start, start + num_graphs, chunk_size):
+                jobs.append((sample_fn, self.seed, chunk_start, min(chunk_start + chunk_size, start + num_graphs)))
+            start += num_graphs
+        if num_workers > 1:
+            with Pool(num_workers) as pool:
+                results = pool.map(generate_edge_lists, jobs)
+        else:
+            results = [generate_edge_lists(job) for job in jobs]
+        edge_lists, num_nodes, labels = [sum((result[i] for result in results), []) for i in range(3)]
+        if self.shuffle:
+            order = np.random.RandomState(self.seed).permutation(len(edge_lists))
+            edge_lists, num_nodes, labels = [[x[i] for i in order] for x in (edge_lists, num_nodes, labels)]
+        self.store.write(edge_lists, num_nodes, labels)
+
+    def graph(self, idx):
+        """Graph idx as networkx graph and its label."""
+        edges, num_nodes, label = self.store[idx]
+        g = nx.Graph()
+        g.add_nodes_from(range(num_nodes))
+        g.add_edges_from(edges.tolist())
+        return g, label
+
+    def __len__(self):
+        return len(self.store)
+
+
+class EvalRandomGraphDataset(EdgeListEvalDataset):
+    def __init__(self, n, pyg=False, root=None, num_workers=1, seed=0):
         self.n = n
         self.pyg = pyg
         self.graph_params = {
@@ -442,6 +1093,13 @@ class EvalRandomGraphDataset(Dataset):
                     "p": 0.5
                 }
             },
+            "random_powerlaw_tree": {
+                "func": random_powerlaw_tree,
+                "kwargs_fix": {
+                    "gamma": 3,
+                    "tries": 1000
+                }
+            },
             "random_geometric": {
                 "func": random_geometric_graph,
                 "kwargs": {
@@ -456,17 +1114,14 @@ class EvalRandomGraphDataset(Dataset):
         self.graph_types = ["binominal", "barabasi_albert", "random_geometric", "random_regular",
                             "random_powerlaw_tree", "watts_strogatz", "extended_barabasi_albert",
                        "newman_watts_strogatz", "dual_barabasi_albert"]
-        graphs, labels = self.generate_dataset()
-        c = list(zip(graphs, labels))
+        super().__init__(root=root, num_workers=num_workers, seed=seed, shuffle=True)
 
-        random.shuffle(c)
+    def config(self):
+        return {"n": self.n, "graph_types": self.graph_types}
 
-        self.graphs, self.labels = zip(*c)
-
-    def generate_dataset(self):
+    def sample_fns(self):
         label = 0
-        graphs = []
-        labels = []
+        sample_fns = []
         for j, graph_type in enumerate(self.graph_types):
             params = self.graph_params[graph_type]
             func = params["func"]
@@ -497,24 +1152,16 @@ class EvalRandomGraphDataset(Dataset):
                     final_kwargs2 = kwargs_fix
                 else:
                     final_kwargs2 = final_kwargs
-                gs = [func(n=self.n, **final_kwargs2) for _ in range(num_graphs)]
-                graphs.extend(gs)
-                labels.extend(len(gs) * [label])
+                sample_fns.append((partial(eval_graph, func, {"n": self.n, **final_kwargs2}, label), num_graphs))
                 label += 1
-        return graphs, labels
-
-    def __len__(self):
-        return len(self.graphs)
+        return sample_fns
 
     def __getitem__(self, idx):
-        graph = self.graphs[idx]
-        label = self.labels[idx]
+        graph, label = self.graph(idx)
         if self.pyg:
             g = from_networkx(graph)
             if g.pos is not None:
                 del g.pos
-            if g.edge_index.dtype != torch.long:
-                print(g)
             g.y = torch.Tensor([label]).long()
             return g
         else:
@@ -522,37 +1169,28 @@ class EvalRandomGraphDataset(Dataset):
 
 
 
-class EvalRandomBinomialGraphDataset(Dataset):
-    def __init__(self, n_min, n_max, p_min, p_max, num_samples, pyg=False):
+class EvalRandomBinomialGraphDataset(EdgeListEvalDataset):
+    def __init__(self, n_min, n_max, p_min, p_max, num_samples, pyg=False, root=None, num_workers=1, seed=0):
         self.n_min = n_min
         self.n_max = n_max
         self.p_min = p_min
         self.p_max = p_max
         self.num_samples = num_samples
         self.pyg = pyg
-        self.graphs, self.labels = self.generate_dataset()
-
-    def generate_dataset(self):
-        graphs = []
-        labels = []
-        for i in range(self.num_samples):
-            n = np.random.randint(low=self.n_min, high=self.n_max)
-            p = np.random.uniform(low=self.p_min, high=self.p_max)
-            g = binomial_graph(n, p)
-            if self.pyg:
-                g = from_networkx(g)
-                g.y = p
-            graphs.append(g)
-            labels.append(p)
-        return graphs, labels
+        super().__init__(root=root, num_workers=num_workers, seed=seed)
 
-    def __len__(self):
-        return len(self.graphs)
+    def config(self):
+        return {"n_min": self.n_min, "n_max": self.n_max, "p_min": self.p_min, "p_max": self.p_max,
+                "num_samples": self.num_samples}
+
+    def sample_fns(self):
+        return [(partial(eval_binomial_graph, self.n_min, self.n_max, self.p_min, self.p_max), self.num_samples)]
 
     def __getitem__(self, idx):
-        graph = self.graphs[idx]
+        graph, label = self.graph(idx)
         if self.pyg:
-            return graph
+            g = from_networkx(graph)
+            g.y = label
+            return g
         else:
-            label = self.labels[idx]
             return graph, label
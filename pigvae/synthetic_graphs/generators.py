@@ -0,0 +1,338 @@
+import math
+from argparse import ArgumentParser
+import numpy as np
+import torch
+import networkx as nx
+from networkx.generators.random_graphs import binomial_graph, watts_strogatz_graph, newman_watts_strogatz_graph, \
+    random_regular_graph, barabasi_albert_graph
+from networkx.generators.geometric import random_geometric_graph
+
+"""
+Batched random graph generators that sample padded adjacency matrices [B, N, N] directly as torch tensors,
+following the sampling procedures of the corresponding networkx generators. Graph b has num_nodes[b] nodes,
+the remaining rows and columns are zero. Parameters can be given per graph (tensor of size B) or as scalars.
+"""
+
+
+def node_mask(num_nodes, max_num_nodes=None):
+    if max_num_nodes is None:
+        max_num_nodes = int(num_nodes.max())
+    return torch.arange(max_num_nodes, device=num_nodes.device).unsqueeze(0) < num_nodes.unsqueeze(1)
+
+
+def pair_mask(num_nodes, max_num_nodes=None):
+    mask = node_mask(num_nodes, max_num_nodes)
+    return mask.unsqueeze(1) & mask.unsqueeze(2)
+
+
+def per_graph(value, num_nodes, dtype=torch.float):
+    return torch.as_tensor(value, dtype=dtype, device=num_nodes.device).expand(num_nodes.size(0))
+
+
+def gumbel_like(x, generator=None):
+    u = torch.rand(x.shape, generator=generator, device=x.device).clamp_min(1e-20)
+    return -torch.log(-torch.log(u))
+
+
+def uniform_choice(candidates, generator=None):
+    """Picks one True entry per row of candidates [B, N] uniformly at random."""
+    r = torch.rand(candidates.shape, generator=generator, device=candidates.device)
+    return (r * candidates).argmax(1)
+
+
+def binomial_graphs(num_nodes, p, generator=None):
+    p = per_graph(p, num_nodes)
+    b, n = num_nodes.size(0), int(num_nodes.max())
+    adj = torch.rand((b, n, n), generator=generator, device=num_nodes.device) < p.view(-1, 1, 1)
+    adj = torch.triu(adj, diagonal=1)
+    adj = (adj | adj.transpose(1, 2)) & pair_mask(num_nodes)
+    return adj
+
+
+def random_geometric_graphs(num_nodes, radius, p=2, generator=None):
+    """Nodes uniform in the unit square, connected if their Minkowski p-distance is at most radius."""
+    radius, p = per_graph(radius, num_nodes), per_graph(p, num_nodes)
+    b, n = num_nodes.size(0), int(num_nodes.max())
+    pos = torch.rand((b, n, 2), generator=generator, device=num_nodes.device)
+    dist = ((pos.unsqueeze(2) - pos.unsqueeze(1)).abs() ** p.view(-1, 1, 1, 1)).sum(-1)
+    adj = dist <= (radius ** p).view(-1, 1, 1)
+    eye = torch.eye(n, dtype=torch.bool, device=num_nodes.device)
+    adj = adj & ~eye & pair_mask(num_nodes)
+    return adj
+
+
+def ring_lattice(num_nodes, k):
+    """Every node is connected to its k // 2 nearest neighbours on each side of a ring of num_nodes nodes."""
+    n = int(num_nodes.max())
+    arange = torch.arange(n, device=num_nodes.device)
+    diff = torch.remainder(arange.view(1, 1, -1) - arange.view(1, -1, 1), num_nodes.view(-1, 1, 1))
+    half = (k // 2).view(-1, 1, 1)
+    adj = (diff > 0) & ((diff <= half) | (diff >= num_nodes.view(-1, 1, 1) - half))
+    return adj & pair_mask(num_nodes)
+
+
+def _ring_lattice_shortcuts(num_nodes, k, p, rewire, generator=None):
+    """
+    Adds (and, if rewire, removes the lattice edge for) a random shortcut from u for every lattice edge (u, u + j)
+    with probability p. networkx goes through the edges one by one, here all edges of the same offset j are
+    handled at once, so the shortcut targets exclude the neighbours of u before (not during) that pass.
+    """
+    k, p = per_graph(k, num_nodes, torch.long), per_graph(p, num_nodes)
+    adj = ring_lattice(num_nodes, k)
+    b, n = adj.size(0), adj.size(1)
+    arange = torch.arange(n, device=num_nodes.device)
+    eye = torch.eye(n, dtype=torch.bool, device=num_nodes.device)
+    mask = node_mask(num_nodes)
+    for j in range(1, int(k.max()) // 2 + 1):
+        coin = torch.rand((b, n), generator=generator, device=num_nodes.device) < p.unsqueeze(1)
+        candidates = ~adj & ~eye & mask.unsqueeze(1)
+        w = uniform_choice(candidates.view(b * n, n), generator).view(b, n)
+        # like networkx: skip nodes that are already connected to every other node
+        active = mask & (j <= k // 2).unsqueeze(1) & coin & candidates.any(2)
+        shortcut = torch.zeros_like(adj).scatter_(2, w.unsqueeze(2), active.unsqueeze(2))
+        if rewire:
+            v = torch.remainder(arange.unsqueeze(0) + j, num_nodes.unsqueeze(1))
+            lattice_edge = torch.zeros_like(adj).scatter_(2, v.unsqueeze(2), active.unsqueeze(2))
+            adj &= ~(lattice_edge | lattice_edge.transpose(1, 2))
+        adj |= shortcut | shortcut.transpose(1, 2)
+    return adj
+
+
+def watts_strogatz_graphs(num_nodes, k, p, generator=None):
+    return _ring_lattice_shortcuts(num_nodes, k, p, rewire=True, generator=generator)
+
+
+def newman_watts_strogatz_graphs(num_nodes, k, p, generator=None):
+    return _ring_lattice_shortcuts(num_nodes, k, p, rewire=False, generator=generator)
+
+
+def barabasi_albert_graphs(num_nodes, m, generator=None):
+    """Preferential attachment starting from a star on m + 1 nodes, like networkx."""
+    m = per_graph(m, num_nodes, torch.long)
+    b, n = num_nodes.size(0), int(num_nodes.max())
+    arange = torch.arange(n, device=num_nodes.device)
+    batch = torch.arange(b, device=num_nodes.device)
+    star = (arange.unsqueeze(0) >= 1) & (arange.unsqueeze(0) <= m.unsqueeze(1))
+    adj = torch.zeros((b, n, n), dtype=torch.bool, device=num_nodes.device)
+    adj[:, 0] = star
+    adj[:, :, 0] = star
+    degree = adj.sum(-1).float()
+    for source in range(int(m.min()) + 1, n):
+        active = (source < num_nodes) & (source > m)
+        # m distinct targets, sampled successively with probability proportional to their degree
+        keys = torch.log(degree[:, :source]) + gumbel_like(degree[:, :source], generator)
+        targets = keys.topk(min(int(m.max()), source), dim=1)[1]
+        select = (torch.arange(targets.size(1), device=num_nodes.device) < m.unsqueeze(1)) & active.unsqueeze(1)
+        bi, ti = batch.unsqueeze(1).expand_as(targets)[select], targets[select]
+        adj[bi, source, ti] = True
+        adj[bi, ti, source] = True
+        degree = adj.sum(-1).float()
+    return adj
+
+
+def _try_random_regular(num_nodes, d, generator=None):
+    """
+    One attempt of the networkx pairing procedure for a whole batch: shuffle the free stubs, pair them up,
+    keep the pairs that form new simple edges and repeat with the rejected stubs.
+    """
+    b, n = num_nodes.size(0), int(num_nodes.max())
+    batch = torch.arange(b, device=num_nodes.device).unsqueeze(1)
+    eye = torch.eye(n, dtype=torch.bool, device=num_nodes.device)
+    stubs = d.unsqueeze(1) * node_mask(num_nodes)
+    adj = torch.zeros((b, n, n), dtype=torch.bool, device=num_nodes.device)
+    failed = torch.zeros(b, dtype=torch.bool, device=num_nodes.device)
+    while True:
+        count = stubs.sum(1)
+        num_stubs = int(count.max())
+        if num_stubs == 0:
+            break
+        # list of stub owners per graph, shuffled with the unused slots moved to the end
+        position = torch.arange(num_stubs, device=num_nodes.device).expand(b, -1)
+        owner = torch.searchsorted(stubs.cumsum(1), position.contiguous(), right=True).clamp_max(n - 1)
+        keys = torch.rand((b, num_stubs), generator=generator, device=num_nodes.device)
+        keys.masked_fill_(position >= count.unsqueeze(1), 2)
+        owner = owner.gather(1, keys.argsort(1))
+        s1, s2 = owner[:, 0::2], owner[:, 1::2]
+        lo, hi = torch.min(s1, s2), torch.max(s1, s2)
+        pair_idx = torch.arange(lo.size(1), device=num_nodes.device).expand(b, -1)
+        valid = pair_idx < (count // 2).unsqueeze(1)
+        accept = valid & (lo != hi) & ~adj[batch, lo, hi]
+        # only the first occurrence of an edge within a round is accepted
+        edge_id = torch.where(accept, lo * n + hi, torch.full_like(lo, n * n))
+        first = torch.full((b, n * n + 1), lo.size(1), dtype=torch.long, device=num_nodes.device)
+        first.scatter_reduce_(1, edge_id, pair_idx.contiguous(), reduce="amin")
+        accept &= first.gather(1, edge_id) == pair_idx
+        bi, li, hi_ = batch.expand_as(lo)[accept], lo[accept], hi[accept]
+        adj[bi, li, hi_] = True
+        adj[bi, hi_, li] = True
+        reject = (valid & ~accept).long()
+        stubs = torch.zeros_like(stubs).scatter_add_(1, lo, reject).scatter_add_(1, hi, reject)
+        free = stubs > 0
+        suitable = (free.unsqueeze(1) & free.unsqueeze(2) & ~adj & ~eye).flatten(1).any(1)
+        stuck = free.any(1) & ~suitable
+        failed |= stuck
+        stubs[stuck] = 0
+    return adj, ~failed
+
+
+def random_regular_graphs(num_nodes, d, generator=None, max_tries=100):
+    """Random stub pairing like networkx; graphs that get stuck are sampled again."""
+    d = per_graph(d, num_nodes, torch.long)
+    if ((num_nodes * d) % 2).any():
+        raise nx.NetworkXError("n * d must be even")
+    b, n = num_nodes.size(0), int(num_nodes.max())
+    adj = torch.zeros((b, n, n), dtype=torch.bool, device=num_nodes.device)
+    todo = torch.arange(b, device=num_nodes.device)
+    for _ in range(max_tries):
+        sub_adj, ok = _try_random_regular(num_nodes[todo], d[todo], generator)
+        sub_n = sub_adj.size(1)
+        adj[todo[ok], :sub_n, :sub_n] = sub_adj[ok]
+        todo = todo[~ok]
+        if len(todo) == 0:
+            return adj
+    raise nx.NetworkXError("failed to generate random regular graphs in {} tries".format(max_tries))
+
+
+class BatchedGraphGenerator(object):
+    """Batched counterpart of data.GraphGenerator for the graph types with a tensor implementation."""
+    def __init__(self):
+        self.graph_params = {
+            "binominal": {
+                "func": binomial_graphs,
+                "kwargs_float_ranges": {
+                    "p": (0.2, 0.6)
+                }
+            },
+            "newman_watts_strogatz": {
+                "func": newman_watts_strogatz_graphs,
+                "kwargs_int_ranges": {
+                    "k": (2, 6),
+                },
+                "kwargs_float_ranges": {
+                    "p": (0.2, 0.6)
+                }
+            },
+            "watts_strogatz": {
+                "func": watts_strogatz_graphs,
+                "kwargs_int_ranges": {
+                    "k": (2, 6),
+                },
+                "kwargs_float_ranges": {
+                    "p": (0.2, 0.6)
+                }
+            },
+            "random_regular": {
+                "func": random_regular_graphs,
+                "kwargs_int_ranges": {
+                    "d": (3, 6),  # n*d must be even
+                }
+            },
+            "barabasi_albert": {
+                "func": barabasi_albert_graphs,
+                "kwargs_int_ranges": {
+                    "m": (1, 6),
+                }
+            },
+            "random_geometric": {
+                "func": random_geometric_graphs,
+                "kwargs_float_ranges": {
+                    "p": (0.4, 0.5),
+                },
+                "kwargs": {
+                    "radius": 1
+                }
+            }
+        }
+        self.graph_types = list(self.graph_params.keys())
+
+    def __call__(self, num_nodes, graph_type, generator=None):
+        """Samples one graph per entry of num_nodes; returns the adjacency matrices and the actual node counts."""
+        params = self.graph_params[graph_type]
+        b = num_nodes.size(0)
+        kwargs = {}
+        if "kwargs" in params:
+            kwargs = {**params["kwargs"]}
+        if "kwargs_int_ranges" in params:
+            for key, arg in params["kwargs_int_ranges"].items():
+                kwargs[key] = torch.randint(arg[0], arg[1] + 1, (b,), generator=generator)
+        if "kwargs_float_ranges" in params:
+            for key, arg in params["kwargs_float_ranges"].items():
+                kwargs[key] = arg[0] + (arg[1] - arg[0]) * torch.rand(b, generator=generator)
+
+        # check if d * n even
+        if graph_type == "random_regular":
+            num_nodes = num_nodes - (num_nodes * kwargs["d"]) % 2
+        adj = params["func"](num_nodes, generator=generator, **kwargs)
+        return adj, num_nodes
+
+
+def degrees_and_clustering(adj, num_nodes):
+    """Degrees and local clustering coefficients of all (unpadded) nodes in a batch of adjacency matrices."""
+    adj = adj.float()
+    mask = node_mask(num_nodes, adj.size(1))
+    degree = adj.sum(-1)
+    triangles = torch.diagonal(torch.matmul(torch.matmul(adj, adj), adj), dim1=1, dim2=2)
+    clustering = triangles / (degree * (degree - 1)).clamp_min(1)
+    return degree[mask].numpy(), clustering[mask].numpy()
+
+
+def ks_statistic(a, b):
+    """Two-sample Kolmogorov-Smirnov statistic."""
+    values = np.sort(np.concatenate([a, b]))
+    cdf_a = np.searchsorted(np.sort(a), values, side="right") / len(a)
+    cdf_b = np.searchsorted(np.sort(b), values, side="right") / len(b)
+    return float(np.abs(cdf_a - cdf_b).max())
+
+
+VALIDATION_SETTINGS = [
+    ("binomial", binomial_graphs, binomial_graph, {"p": 0.3}),
+    ("watts_strogatz", watts_strogatz_graphs, watts_strogatz_graph, {"k": 4, "p": 0.3}),
+    ("newman_watts_strogatz", newman_watts_strogatz_graphs, newman_watts_strogatz_graph, {"k": 4, "p": 0.3}),
+    ("random_regular", random_regular_graphs, random_regular_graph, {"d": 3}),
+    ("barabasi_albert", barabasi_albert_graphs, barabasi_albert_graph, {"m": 2}),
+    ("random_geometric", random_geometric_graphs, random_geometric_graph, {"radius": 0.4}),
+]
+
+
+def validate(n=16, num_graphs=1000, seed=0):
+    """
+    Compares degree and clustering coefficient distributions of the batched generators with the networkx
+    generators. For equal distributions the KS statistics approach 0 as num_graphs grows
+    (roughly below 1.36 * sqrt(2 / (num_graphs * n)) at the 5% level for node-level samples).
+    """
+    torch.manual_seed(seed)
+    num_nodes = torch.full((num_graphs,), n, dtype=torch.long)
+    results = []
+    for name, batched_func, nx_func, kwargs in VALIDATION_SETTINGS:
+        adj = batched_func(num_nodes, **kwargs)
+        nx_adj = torch.stack([
+            torch.from_numpy(nx.to_numpy_array(nx_func(n=n, seed=seed + i, **kwargs))) for i in range(num_graphs)])
+        degree, clustering = degrees_and_clustering(adj, num_nodes)
+        nx_degree, nx_clustering = degrees_and_clustering(nx_adj, num_nodes)
+        results.append({
+            "graph_type": name,
+            "mean_degree": float(degree.mean()),
+            "nx_mean_degree": float(nx_degree.mean()),
+            "mean_clustering": float(clustering.mean()),
+            "nx_mean_clustering": float(nx_clustering.mean()),
+            "degree_ks": ks_statistic(degree, nx_degree),
+            "clustering_ks": ks_statistic(clustering, nx_clustering),
+        })
+    return results
+
+
+def main():
+    parser = ArgumentParser(description="Validate the batched graph generators against networkx")
+    parser.add_argument("-n", default=16, type=int)
+    parser.add_argument("--num_graphs", default=1000, type=int)
+    args = parser.parse_args()
+    print("KS 5% critical value (node level): {:.3f}".format(1.36 * math.sqrt(2 / (args.num_graphs * args.n))))
+    print("{:>22} {:>8} {:>8} {:>9} {:>9} {:>9} {:>9}".format(
+        "graph type", "deg", "nx deg", "clust", "nx clust", "deg KS", "clust KS"))
+    for r in validate(args.n, args.num_graphs):
+        print("{graph_type:>22} {mean_degree:>8.3f} {nx_mean_degree:>8.3f} {mean_clustering:>9.3f} "
+              "{nx_mean_clustering:>9.3f} {degree_ks:>9.3f} {clustering_ks:>9.3f}".format(**r))
+
+
+if __name__ == "__main__":
+    main()
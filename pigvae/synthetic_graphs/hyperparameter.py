@@ -20,8 +20,10 @@ def add_arguments(parser):
     parser.add_argument('-e', '--num_epochs', default=5000, type=int)
     parser.add_argument("--num_eval_samples", default=8192, type=int)
     parser.add_argument("--eval_freq", default=1000, type=int)
+    parser.add_argument("--profile_every_n_steps", default=0, type=int)
+    parser.add_argument("--profile_trace", default="", type=str)
     parser.add_argument("-s", "--save_dir", default=DEFAULT_SAVE_DIR, type=str)
-    parser.add_argument("--precision", default=32, type=int)
+    parser.add_argument("--precision", default="32", type=str)  # 16, 32 or bf16
     parser.add_argument('--progress_bar', dest='progress_bar', action='store_true')
     parser.set_defaults(test=False)
     parser.set_defaults(progress_bar=False)
@@ -33,8 +35,12 @@ def add_arguments(parser):
     parser.add_argument("--kld_loss_scale", default=0.001, type=float)
     parser.add_argument("--perm_loss_scale", default=0.5, type=float)
     parser.add_argument("--property_loss_scale", default=0.1, type=float)
+    parser.add_argument("--edge_loss_all_channels", dest='edge_loss_all_channels', action='store_true')
+    parser.set_defaults(edge_loss_all_channels=False)
     parser.add_argument("--vae", dest='vae', action='store_true')
     parser.set_defaults(vae=False)
+    parser.add_argument("--no_padding_mask", dest='padding_mask', action='store_false')
+    parser.set_defaults(padding_mask=True)
 
     # GENERAL GRAPH PROPERTIES
     parser.add_argument("--num_node_features", default=1, type=int)
@@ -48,6 +54,7 @@ def add_arguments(parser):
     parser.add_argument("--graph_encoder_num_heads", default=16, type=int)
     parser.add_argument("--graph_encoder_ppf_hidden_dim", default=1024, type=int)
     parser.add_argument("--graph_encoder_num_layers", default=16, type=int)
+    parser.add_argument("--graph_encoder_checkpoint_every", default=0, type=int)
 
     # GRAPH DECODER
 
@@ -58,11 +65,24 @@ def add_arguments(parser):
     parser.add_argument("--graph_decoder_ppf_hidden_dim", default=1024, type=int)
     parser.add_argument("--graph_decoder_num_layers", default=16, type=int)
     parser.add_argument("--graph_decoder_pos_emb_dim", default=64, type=int)
+    parser.add_argument("--graph_decoder_checkpoint_every", default=0, type=int)
+    parser.add_argument("--graph_decoder_packed_edges", dest='graph_decoder_packed_edges', action='store_true')
+    parser.set_defaults(graph_decoder_packed_edges=False)
 
 
+    # ATTENTION
+    parser.add_argument("--attention_chunk_size", default=0, type=int)
+    parser.add_argument("--attention_online_softmax", dest='attention_online_softmax', action='store_true')
+    parser.set_defaults(attention_online_softmax=False)
+    # skipping the attention rows of padded nodes syncs with the host once per transformer forward
+    parser.add_argument("--no_attention_skip_padded_rows", dest='attention_skip_padded_rows', action='store_false')
+    parser.set_defaults(attention_skip_padded_rows=True)
+
     # PROPERTY PREDICTOR
     parser.add_argument("--property_predictor_hidden_dim", default=256, type=int)
     parser.add_argument("--num_properties", default=1, type=int)
+    parser.add_argument("--num_nodes_mean", default=0.0, type=float)
+    parser.add_argument("--num_nodes_std", default=1.0, type=float)
 
 
     # DATA
@@ -75,6 +95,17 @@ def add_arguments(parser):
     parser.add_argument("--p_max", default=0.6, type=float)
     parser.add_argument("--m_min", default=1, type=int)
     parser.add_argument("--m_max", default=5, type=int)
+    parser.add_argument("--max_batch_cost", default=0, type=int)
+    parser.add_argument("--batch_cost", default="padded", type=str)
+    parser.add_argument("--generator", default="networkx", type=str)
+    parser.add_argument("--data_seed", default=0, type=int)
+    parser.add_argument("--sparse_batches", dest='sparse_batches', action='store_true')
+    parser.set_defaults(sparse_batches=False)
+    parser.add_argument("--cache_dir", default="", type=str)
+    parser.add_argument("--cache_size", default=1000000, type=int)
+    parser.add_argument("--cache_seed", default=0, type=int)
+    parser.add_argument("--cache_fresh_fraction", default=0.0, type=float)
+    parser.add_argument("--loader_telemetry_every_n_steps", default=0, type=int)
 
     return parser
 
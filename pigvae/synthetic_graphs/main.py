@@ -29,21 +29,7 @@ def main(hparams):
     tb_logger = TensorBoardLogger(hparams.save_dir + "/run{}/".format(hparams.id))
     critic = Critic
     model = PLGraphAE(hparams.__dict__, critic)
-    graph_kwargs = {
-        "n_min": hparams.n_min,
-        "n_max": hparams.n_max,
-        "m_min": hparams.m_min,
-        "m_max": hparams.m_max,
-        "p_min": hparams.p_min,
-        "p_max": hparams.p_max
-    }
-    datamodule = GraphDataModule(
-        graph_family=hparams.graph_family,
-        graph_kwargs=graph_kwargs,
-        batch_size=hparams.batch_size,
-        num_workers=hparams.num_workers,
-        samples_per_epoch=100000000
-    )
+    datamodule = GraphDataModule.from_hparams(hparams.__dict__, samples_per_epoch=100000000)
     my_ddp_plugin = MyDDP()
     trainer = pl.Trainer(
         gpus=hparams.gpus,
@@ -57,7 +43,7 @@ def main(hparams):
         callbacks=[lr_logger, checkpoint_callback],
         terminate_on_nan=True,
         replace_sampler_ddp=False,
-        precision=hparams.precision,
+        precision=int(hparams.precision) if hparams.precision.isdigit() else hparams.precision,
         max_epochs=hparams.num_epochs,
         reload_dataloaders_every_epoch=True,
         resume_from_checkpoint=hparams.resume_ckpt if hparams.resume_ckpt != "" else None
@@ -1,5 +1,8 @@
+import math
 import torch
-from torch.nn import BCEWithLogitsLoss, MSELoss
+from torch.nn import MSELoss
+from torch.nn.functional import binary_cross_entropy_with_logits
+from pigvae.synthetic_graphs.data import pack_edge_features
 
 
 class Critic(torch.nn.Module):
@@ -9,7 +12,11 @@ class Critic(torch.nn.Module):
         self.beta = hparams["perm_loss_scale"]
         self.gamma = hparams["property_loss_scale"]
         self.vae = hparams["vae"]
-        self.reconstruction_loss = GraphReconstructionLoss()
+        # the node count property is predicted normalized, see GraphAE.predict_num_nodes
+        self.num_nodes_mean = hparams.get("num_nodes_mean", 0.0)
+        self.num_nodes_std = hparams.get("num_nodes_std", 1.0)
+        self.reconstruction_loss = GraphReconstructionLoss(
+            all_channels=hparams.get("edge_loss_all_channels", False))
         self.perm_loss = PermutaionMatrixPenalty()
         self.property_loss = PropertyLoss()
         self.kld_loss = KLDLoss()
@@ -22,7 +29,7 @@ class Critic(torch.nn.Module):
         perm_loss = self.perm_loss(perm)
         property_loss = self.property_loss(
             input=graph_pred.properties,
-            target=graph_true.properties
+            target=(graph_true.properties - self.num_nodes_mean) / self.num_nodes_std
         )
         loss = {**recon_loss, "perm_loss": perm_loss, "property_loss": property_loss}
         loss["loss"] = loss["loss"] + self.beta * perm_loss + self.gamma * property_loss
@@ -52,20 +59,66 @@ class Critic(torch.nn.Module):
 
 
 class GraphReconstructionLoss(torch.nn.Module):
-    def __init__(self):
+    """
+    Binary cross entropy of the edge logits (distance 1 channel, or every distance channel if all_channels)
+    averaged over the pairs of real nodes. Padded pairs get weight zero instead of being gathered out, so
+    there are no data-dependent shapes and no host syncs (CUDA graphs, torch.compile).
+    """
+    def __init__(self, all_channels=False):
         super().__init__()
-        self.edge_loss = BCEWithLogitsLoss()
+        self.all_channels = all_channels
+
+    def select(self, edge_features):
+        return edge_features if self.all_channels else edge_features[..., 1:2]
+
+    def masked_bce_sum(self, edges_pred, edges_true, pair_mask):
+        """Sum of the element-wise BCE over the masked pairs and number of summed elements."""
+        edges_true = (edges_true == 1).float()
+        weight = pair_mask.unsqueeze(-1).float()
+        edge_loss = binary_cross_entropy_with_logits(
+            input=edges_pred.float(),
+            target=edges_true,
+            weight=weight,
+            reduction="sum"
+        )
+        return edge_loss, weight.sum() * edges_pred.size(-1)
 
     def forward(self, graph_true, graph_pred):
+        if getattr(graph_pred, "packed_edge_features", None) is not None:
+            return self.packed_forward(graph_true, graph_pred)
         mask = graph_true.mask
         adj_mask = mask.unsqueeze(1) * mask.unsqueeze(2)
 
-        edges_true = (graph_true.edge_features[adj_mask][:, 1] == 1).float()
-        edges_pred = graph_pred.edge_features[adj_mask][:, 1]
-        edge_loss = self.edge_loss(
-            input=edges_pred,
-            target=edges_true
+        edge_loss, num_elements = self.masked_bce_sum(
+            edges_pred=self.select(graph_pred.edge_features),
+            edges_true=self.select(graph_true.edge_features),
+            pair_mask=adj_mask
+        )
+        edge_loss = edge_loss / num_elements
+        loss = {
+            "edge_loss": edge_loss,
+            "loss": edge_loss
+        }
+        return loss
+
+    def packed_forward(self, graph_true, graph_pred):
+        """
+        Same loss as forward for upper triangle edge logits. Every pair counts twice and the diagonal,
+        whose logits are zero, adds log(2) per node and channel.
+        """
+        mask = graph_true.mask
+        pair_mask = pack_edge_features(mask.unsqueeze(1) * mask.unsqueeze(2))
+
+        edges_pred = self.select(graph_pred.packed_edge_features)
+        edge_loss, _ = self.masked_bce_sum(
+            edges_pred=edges_pred,
+            edges_true=pack_edge_features(self.select(graph_true.edge_features)),
+            pair_mask=pair_mask
         )
+        num_nodes = mask.sum(1).float()
+        num_channels = edges_pred.size(-1)
+        edge_loss = (2 * edge_loss + math.log(2) * num_channels * num_nodes.sum()) / (
+            num_channels * (num_nodes ** 2).sum())
         loss = {
             "edge_loss": edge_loss,
             "loss": edge_loss
@@ -80,8 +133,8 @@ class PropertyLoss(torch.nn.Module):
 
     def forward(self, input, target):
         loss = self.mse_loss(
-            input=input,
-            target=target
+            input=input.float(),
+            target=target.float()
         )
         return loss
 
@@ -98,8 +151,8 @@ class PermutaionMatrixPenalty(torch.nn.Module):
         return e
 
     def forward(self, perm, eps=10e-8):
-        #print(perm.shape)
-        perm = perm + eps
+        # eps and log underflow in reduced precision
+        perm = perm.float() + eps
         entropy_col = self.entropy(perm, axis=1, normalize=False)
         entropy_row = self.entropy(perm, axis=2, normalize=False)
         loss = entropy_col.mean() + entropy_row.mean()
@@ -111,6 +164,7 @@ class KLDLoss(torch.nn.Module):
         super().__init__()
 
     def forward(self, mu, logvar):
+        mu, logvar = mu.float(), logvar.float()
         loss = -0.5 * torch.sum(1 + logvar - mu.pow(2) - logvar.exp(), axis=1)
         loss = torch.mean(loss)
         return loss
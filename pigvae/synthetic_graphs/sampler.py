@@ -0,0 +1,123 @@
+import numpy as np
+import torch.distributed as dist
+from torch.utils.data import Sampler
+
+
+def draw_num_nodes(dataset, indices, rng):
+    """Node counts for a list of indices, drawn up front so that samples can be grouped by size."""
+    if hasattr(dataset, "num_nodes"):
+        # node counts are fixed by the data (e.g. cached graphs)
+        return np.array([dataset.num_nodes(idx) for idx in indices], dtype=np.int64)
+    if dataset.n_min == dataset.n_max:
+        # fixed graph size, randint would fail on the empty range [n_min, n_max)
+        return np.full(len(indices), dataset.n_min, dtype=np.int64)
+    # same bounds as sample_num_nodes: n_max is exclusive
+    return rng.randint(low=dataset.n_min, high=dataset.n_max, size=len(indices))
+
+
+class NodeCountBatchSampler(Sampler):
+    """
+    Batch sampler that groups samples of similar node count and sizes every batch so that its estimated
+    cost stays below max_cost. The attention cost grows with N^3, so cost="padded" estimates a batch as
+    batch_size * max_num_nodes^3 and cost="sum" as the sum of num_nodes^3.
+
+    Node counts are drawn up front (or read from datasets with a num_nodes method) and every index is
+    yielded as (idx, num_nodes), which the synthetic datasets use as the size of the generated graph.
+    Indices are processed in chunks of chunk_size: each chunk is sorted by node count, cut into batches and
+    the batches are dealt out round robin to the num_replicas ranks. All ranks draw the same node counts
+    (seed, epoch), so like the DistributedSampler every rank gets the same number of batches. The
+    padding_efficiency counters cover the batches yielded in the current epoch.
+    """
+    def __init__(self, dataset, max_cost, cost="padded", num_replicas=None, rank=None, shuffle=True, seed=0,
+                 chunk_size=16384, max_batch_size=None):
+        if num_replicas is None:
+            num_replicas = dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1
+        if rank is None:
+            rank = dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+        if cost not in ("padded", "sum"):
+            raise NotImplementedError
+        self.dataset = dataset
+        self.max_cost = max_cost
+        self.cost = cost
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.shuffle = shuffle
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.max_batch_size = max_batch_size
+        self.epoch = 0
+        self.num_pairs = 0
+        self.num_padded_pairs = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def rng(self):
+        # seeded with the pair, seed + epoch would give seed 1 in epoch 0 the node counts of seed 0 in epoch 1
+        return np.random.RandomState([self.seed, self.epoch])
+
+    @property
+    def padding_efficiency(self):
+        """Fraction of the node pairs in the yielded (padded) batches that belong to real graphs."""
+        return self.num_pairs / max(self.num_padded_pairs, 1)
+
+    def make_batches(self, sizes):
+        """Cuts samples, sorted by ascending node count, into consecutive batches within the cost budget."""
+        batches = []
+        start, cost = 0, 0
+        for i, n in enumerate(sizes.tolist()):
+            if self.cost == "padded":
+                new_cost = (i + 1 - start) * n ** 3
+            else:
+                new_cost = cost + n ** 3
+            full = self.max_batch_size is not None and i - start >= self.max_batch_size
+            if i > start and (new_cost > self.max_cost or full):
+                batches.append((start, i))
+                start = i
+                new_cost = n ** 3
+            cost = new_cost
+        if start < len(sizes):
+            batches.append((start, len(sizes)))
+        return batches
+
+    def iter_chunks(self, rng):
+        num_samples = len(self.dataset)
+        indices = np.zeros(0, dtype=np.int64)
+        sizes = np.zeros(0, dtype=np.int64)
+        for chunk_start in range(0, num_samples, self.chunk_size):
+            chunk = np.arange(chunk_start, min(chunk_start + self.chunk_size, num_samples))
+            if self.shuffle:
+                chunk = rng.permutation(chunk)
+            indices = np.concatenate((indices, chunk))
+            sizes = np.concatenate((sizes, draw_num_nodes(self.dataset, chunk, rng)))
+            order = np.argsort(sizes, kind="stable")
+            indices, sizes = indices[order], sizes[order]
+            batches = self.make_batches(sizes)
+            if self.shuffle:
+                batches = [batches[i] for i in rng.permutation(len(batches))]
+            # every rank gets the same number of batches, the rest is carried over to the next chunk
+            num_batches = len(batches) - len(batches) % self.num_replicas
+            yield indices, sizes, batches[:num_batches]
+            keep = np.ones(len(indices), dtype=bool)
+            for start, stop in batches[:num_batches]:
+                keep[start:stop] = False
+            indices, sizes = indices[keep], sizes[keep]
+
+    def __iter__(self):
+        self.num_pairs = 0
+        self.num_padded_pairs = 0
+        for indices, sizes, batches in self.iter_chunks(self.rng()):
+            for start, stop in batches[self.rank::self.num_replicas]:
+                self.num_pairs += int((sizes[start:stop] ** 2).sum())
+                self.num_padded_pairs += (stop - start) * int(sizes[stop - 1]) ** 2
+                yield list(zip(indices[start:stop].tolist(), sizes[start:stop].tolist()))
+
+    def __len__(self):
+        """
+        Estimated number of batches per rank, extrapolated from the batch sizes of the first chunk. The node
+        counts of the remaining chunks are only drawn while iterating, so the actual number of batches can
+        differ slightly (progress bars and epoch length based schedules are approximate).
+        """
+        indices, sizes, batches = next(self.iter_chunks(self.rng()))
+        samples_per_batch = max(sum(stop - start for start, stop in batches) / max(len(batches), 1), 1)
+        return int(len(self.dataset) / samples_per_batch) // self.num_replicas
@@ -0,0 +1,115 @@
+import time
+from argparse import ArgumentParser
+from collections import defaultdict
+import numpy as np
+from pigvae.synthetic_graphs.data import GraphDataModule, SparseGraphBatch
+from pigvae.synthetic_graphs.hyperparameter import add_arguments
+
+LOADER_STATS = ("generation_s", "shortest_paths_s", "assembly_s", "padding_ratio")
+
+
+class LoaderTelemetry(object):
+    """
+    Aggregates the loader_stats of training batches (see data.collate_with_loader_stats) and the time the
+    training loop waited for every batch, i.e. from the end of one step to the start of the next, which covers
+    fetching the batch from the DataLoader and moving it to the device. Work between steps that is not
+    loading (validation, checkpointing, a new epoch) is excluded with pause(), the wait of the next batch is
+    then not measured, or with resume(), which restarts the clock after that work.
+
+    Usage:
+        telemetry = LoaderTelemetry()
+        for batch in loader:
+            telemetry.start_step(batch)
+            ...  # training step
+            telemetry.end_step()
+        stats = telemetry.summary()
+    """
+    def __init__(self):
+        self.last_end = None
+        self.values = defaultdict(list)
+        self.worker_times = defaultdict(list)
+
+    def start_step(self, batch):
+        now = time.perf_counter()
+        if self.last_end is not None:
+            self.values["wait_s"].append(now - self.last_end)
+        stats = getattr(batch, "loader_stats", None)
+        if stats is not None:
+            for key in LOADER_STATS:
+                self.values[key].append(stats[key])
+            self.worker_times[stats["worker_id"]].append(
+                stats["generation_s"] + stats["shortest_paths_s"] + stats["assembly_s"])
+
+    def end_step(self):
+        self.last_end = time.perf_counter()
+
+    def pause(self):
+        self.last_end = None
+
+    def resume(self):
+        self.last_end = time.perf_counter()
+
+    def summary(self, reset=True):
+        """Mean of every value, percentiles of the wait and the mean batch time of every worker since the last reset."""
+        stats = {}
+        for key, values in self.values.items():
+            stats[key + "/mean"] = float(np.mean(values))
+        if len(self.values["wait_s"]) > 0:
+            stats["wait_s/p50"] = float(np.percentile(self.values["wait_s"], 50))
+            stats["wait_s/p99"] = float(np.percentile(self.values["wait_s"], 99))
+            stats["wait_s/max"] = float(np.max(self.values["wait_s"]))
+        for worker_id, times in self.worker_times.items():
+            stats["worker{}/batch_s".format(worker_id)] = float(np.mean(times))
+            stats["worker{}/batches".format(worker_id)] = len(times)
+        if reset:
+            self.values = defaultdict(list)
+            self.worker_times = defaultdict(list)
+        return stats
+
+
+def run(datamodule, num_batches, step_time=0.0, warmup=5):
+    """
+    Iterates the training DataLoader of datamodule without a model, sleeping step_time seconds per batch
+    in place of a training step. Returns the LoaderTelemetry summary and the throughput after warmup batches.
+    """
+    datamodule.prepare_data()
+    telemetry = LoaderTelemetry()
+    num_graphs, start = 0, None
+    for i, batch in enumerate(datamodule.train_dataloader()):
+        if i == warmup:
+            telemetry.summary()
+            start = time.perf_counter()
+        telemetry.start_step(batch)
+        if i >= warmup:
+            num_graphs += batch.sizes.size(0) if isinstance(batch, SparseGraphBatch) else batch.mask.size(0)
+        time.sleep(step_time)
+        telemetry.end_step()
+        if i + 1 == warmup + num_batches:
+            break
+    elapsed = time.perf_counter() - start
+    stats = telemetry.summary()
+    stats["batches_per_s"] = num_batches / elapsed
+    stats["graphs_per_s"] = num_graphs / elapsed
+    return stats
+
+
+def main():
+    parser = ArgumentParser(description="Throughput and stalls of the training DataLoader of a GraphDataModule "
+                                        "configuration, without a model")
+    parser = add_arguments(parser)
+    parser.add_argument("--num_batches", default=200, type=int)
+    parser.add_argument("--warmup_batches", default=5, type=int)
+    parser.add_argument("--step_time_ms", default=0.0, type=float, help="simulated training step time")
+    hparams = parser.parse_args()
+    datamodule = GraphDataModule.from_hparams(
+        hparams.__dict__, samples_per_epoch=(hparams.num_batches + hparams.warmup_batches) * hparams.batch_size,
+        distributed_sampler=False, loader_stats=True)
+    stats = run(datamodule, hparams.num_batches, hparams.step_time_ms / 1000, hparams.warmup_batches)
+    for key in sorted(stats):
+        # times in seconds are the *_s values, printed in ms
+        seconds = any(part.endswith("_s") and not part.endswith("per_s") for part in key.split("/"))
+        print("{:>28} {:12.3f}{}".format(key, 1000 * stats[key] if seconds else stats[key], " ms" if seconds else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 import torch
 import pytorch_lightning as pl
 from pigvae.modules import GraphAE
+from pigvae.profiling import ModuleProfiler
+from pigvae.synthetic_graphs.data import SparseGraphBatch
+from pigvae.synthetic_graphs.telemetry import LoaderTelemetry
 
 
 class PLGraphAE(pl.LightningModule):
@@ -10,6 +13,17 @@ class PLGraphAE(pl.LightningModule):
         self.save_hyperparameters(hparams)
         self.graph_ae = GraphAE(hparams)
         self.critic = critic(hparams)
+        # opt-in per module timing (and memory on CUDA) of every profile_every_n_steps-th training step
+        self.profiler = None
+        if hparams.get("profile_every_n_steps", 0) > 0:
+            self.profiler = ModuleProfiler(hparams["profile_every_n_steps"]).attach(self)
+        # data loader stalls and collate times, the batches carry loader_stats (see GraphDataModule.from_hparams)
+        self.loader_telemetry = None
+        if hparams.get("loader_telemetry_every_n_steps", 0) > 0:
+            self.loader_telemetry = LoaderTelemetry()
+        # node pairs of the real graphs and of the padded batches, summed over the training epoch
+        self.num_pairs = 0
+        self.num_padded_pairs = 0
 
     def forward(self, graph, training):
         graph_pred, perm, mu, logvar = self.graph_ae(graph, training, tau=1.0)
@@ -30,10 +44,77 @@ class PLGraphAE(pl.LightningModule):
         self.log_dict(loss)
         return loss
 
+    def on_after_batch_transfer(self, batch, dataloader_idx=0):
+        # compact edge list batches (--sparse_batches) are densified on the device
+        if isinstance(batch, SparseGraphBatch):
+            batch = batch.to_dense()
+        if self.training:
+            # before the mask is overridden below, no host sync, the sums stay on the device until the epoch ends
+            num_pairs, num_padded_pairs = self.padded_pairs(batch)
+            self.num_pairs = self.num_pairs + num_pairs
+            self.num_padded_pairs = self.num_padded_pairs + num_padded_pairs
+        if not self.hparams.get("padding_mask", True):
+            # objective of the original collate (--no_padding_mask): the mask of every node is set, padded nodes
+            # count as isolated real nodes in the attention and in the reconstruction loss
+            batch.mask = torch.ones_like(batch.mask)
+        return batch
+
+    def on_train_epoch_start(self):
+        # fresh training graphs every epoch, also if the train dataloader is not reloaded
+        datamodule = getattr(self.trainer, "datamodule", None)
+        if hasattr(datamodule, "set_epoch"):
+            datamodule.set_epoch(self.current_epoch)
+        # the first batch of an epoch waits for the epoch boundary (and a reloaded dataloader), not the loader
+        if self.loader_telemetry is not None:
+            self.loader_telemetry.pause()
+
+    def on_validation_start(self):
+        if self.loader_telemetry is not None:
+            self.loader_telemetry.pause()
+
+    def on_validation_end(self):
+        # after the checkpoint callbacks, the wait of the next training batch is measured from here
+        if self.loader_telemetry is not None:
+            self.loader_telemetry.resume()
+
+    def on_train_epoch_end(self, outputs=None):
+        # fraction of the node pairs in the padded training batches that belong to real graphs
+        if self.num_padded_pairs > 0:
+            self.log("padding_efficiency", self.num_pairs / self.num_padded_pairs)
+        self.num_pairs = 0
+        self.num_padded_pairs = 0
+
+    def on_train_batch_start(self, batch, batch_idx, dataloader_idx=0):
+        if self.loader_telemetry is not None:
+            self.loader_telemetry.start_step(batch)
+        if self.profiler is not None:
+            self.profiler.start_step(self.global_step)
+
+    def on_train_batch_end(self, outputs, batch, batch_idx, dataloader_idx=0):
+        if self.profiler is not None:
+            stats = self.profiler.end_step()
+            if stats is not None and self.logger is not None:
+                self.logger.log_metrics({"profile/" + key: value for key, value in stats.items()}, self.global_step)
+        if self.loader_telemetry is not None:
+            self.loader_telemetry.end_step()
+            if (self.global_step + 1) % self.hparams["loader_telemetry_every_n_steps"] == 0 and self.logger is not None:
+                stats = self.loader_telemetry.summary()
+                self.logger.log_metrics({"loader/" + key: value for key, value in stats.items()}, self.global_step)
+
+    def on_train_end(self):
+        if self.profiler is not None and self.hparams.get("profile_trace", "") and self.global_rank == 0:
+            self.profiler.export_chrome_trace(self.hparams["profile_trace"])
+
+    @staticmethod
+    def padded_pairs(graph):
+        num_nodes = graph.mask.sum(1).float()
+        return (num_nodes ** 2).sum(), graph.mask.size(0) * graph.mask.size(1) ** 2
+
     def validation_step(self, graph, batch_idx):
-        graph_pred, perm, mu, logvar = self(
+        # one encoder pass, decoded with the soft and the hard permutation
+        (graph_pred, perm, mu, logvar), (graph_pred_hard, perm_hard, _, _) = self.graph_ae.forward_soft_and_hard(
             graph=graph,
-            training=True,
+            tau=1.0,
         )
         metrics_soft = self.critic.evaluate(
             graph_true=graph,
@@ -43,14 +124,10 @@ class PLGraphAE(pl.LightningModule):
             logvar=logvar,
             prefix="val",
         )
-        graph_pred, perm, mu, logvar = self(
-            graph=graph,
-            training=False,
-        )
         metrics_hard = self.critic.evaluate(
             graph_true=graph,
-            graph_pred=graph_pred,
-            perm=perm,
+            graph_pred=graph_pred_hard,
+            perm=perm_hard,
             mu=mu,
             logvar=logvar,
             prefix="val_hard",
@@ -0,0 +1,30 @@
+import os
+import fcntl
+import pytest
+from pigvae.synthetic_graphs.cache import build_once
+
+
+def test_build_once_builds_on_rank_0(tmp_path):
+    path = str(tmp_path / "store")
+    built = []
+
+    def build():
+        built.append(True)
+        open(path, "w").close()
+    for rank in (0, 1, 0):
+        build_once(path, lambda: os.path.exists(path), build, rank=rank, timeout=1.0)
+    assert built == [True]
+
+
+def test_build_once_times_out_without_rank_0(tmp_path):
+    path = str(tmp_path / "store")
+    with pytest.raises(TimeoutError, match="store was not built by rank 0"):
+        build_once(path, lambda: False, None, rank=1, poll_interval=0.01, timeout=0.1)
+
+
+def test_build_once_times_out_while_rank_0_holds_the_lock(tmp_path):
+    path = str(tmp_path / "store")
+    with open(path + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        with pytest.raises(TimeoutError):
+            build_once(path, lambda: True, None, rank=1, poll_interval=0.01, timeout=0.1)
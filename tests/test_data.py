@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+import torch
+import networkx as nx
+from pigvae.synthetic_graphs.data import DenseGraphBatch, SparseGraphBatch, GraphDataModule, distance_matrix, \
+    eval_graph, sample_rng
+
+
+def floyd_warshall_edge_features(graphs, max_distance=5):
+    """One-hot clamped Floyd-Warshall distances, padded to the largest graph (unreachable and padded pairs: 0)."""
+    max_num_nodes = max(graph.number_of_nodes() for graph in graphs)
+    edge_features = torch.zeros(len(graphs), max_num_nodes, max_num_nodes, max_distance + 1)
+    for i, graph in enumerate(graphs):
+        n = graph.number_of_nodes()
+        dm = nx.floyd_warshall_numpy(graph, nodelist=range(n))
+        dm[np.isinf(dm)] = 0
+        dm = torch.from_numpy(np.clip(dm, 0, max_distance)).long()
+        padded = torch.zeros(max_num_nodes, max_num_nodes, dtype=torch.long)
+        padded[:n, :n] = dm
+        edge_features[i] = torch.nn.functional.one_hot(padded, max_distance + 1).float()
+    return edge_features
+
+
+def make_graphs():
+    disconnected = nx.disjoint_union(nx.path_graph(9), nx.cycle_graph(4))
+    return [
+        nx.path_graph(12),  # distances beyond 5 are clamped
+        disconnected,  # unreachable pairs
+        nx.barabasi_albert_graph(7, 2, seed=0),
+        nx.gnp_random_graph(15, 0.2, seed=1),
+        nx.empty_graph(3),
+    ]
+
+
+def test_collate_matches_floyd_warshall():
+    graphs = make_graphs()
+    batch = DenseGraphBatch.from_sparse_graph_list(graphs)
+    assert torch.equal(batch.edge_features, floyd_warshall_edge_features(graphs))
+    assert batch.properties.tolist() == [graph.number_of_nodes() for graph in graphs]
+
+
+def test_collate_padding():
+    graphs = make_graphs()
+    batch = DenseGraphBatch.from_sparse_graph_list(graphs)
+    num_nodes = torch.tensor([graph.number_of_nodes() for graph in graphs])
+    assert batch.mask.shape == (len(graphs), 15)
+    assert torch.equal(batch.mask.sum(1), num_nodes)
+    for i, n in enumerate(num_nodes.tolist()):
+        # padded pairs are distance 0
+        assert (batch.edge_features[i, n:, :, 0] == 1).all()
+        assert (batch.edge_features[i, :, n:, 0] == 1).all()
+
+
+def test_distance_matrix_list_matches_collate():
+    graphs = make_graphs()
+    batch = DenseGraphBatch.from_distance_matrix_list([distance_matrix(graph) for graph in graphs])
+    assert torch.equal(batch.edge_features, DenseGraphBatch.from_sparse_graph_list(graphs).edge_features)
+
+
+def test_sparse_to_dense_matches_dense():
+    graphs = make_graphs()
+    labels = list(range(len(graphs)))
+    dense = DenseGraphBatch.from_sparse_graph_list(list(zip(graphs, labels)), labels=True)
+    sparse = SparseGraphBatch.from_graph_list(list(zip(graphs, labels)), labels=True).to_dense()
+    for key in ("edge_features", "node_features", "mask", "properties", "y"):
+        assert torch.equal(getattr(sparse, key), getattr(dense, key)), key
+
+
+def test_eval_graph_retries():
+    rng = sample_rng(0, 2, 0, 0, 0)
+    g, label = eval_graph(nx.random_powerlaw_tree, {"n": 16, "tries": 1000}, 3, rng)
+    assert g.number_of_nodes() == 16 and nx.is_tree(g) and label == 3
+
+
+def test_eval_graph_gives_up():
+    def never(seed, n):
+        raise nx.NetworkXError("never")
+    with pytest.raises(nx.NetworkXError, match=r"never\(n=16\) in 5 tries"):
+        eval_graph(never, {"n": 16}, 0, sample_rng(0, 2, 0, 0, 0), max_tries=5)
+
+
+def test_datamodule_from_hparams_defaults():
+    datamodule = GraphDataModule.from_hparams({"graph_family": "binomial", "n_max": 30}, samples_per_epoch=10)
+    assert datamodule.graph_family == "binomial"
+    assert datamodule.graph_kwargs == {"n_min": 12, "n_max": 30, "m_min": 1, "m_max": 5, "p_min": 0.4, "p_max": 0.6}
+    assert (datamodule.batch_size, datamodule.seed, datamodule.sparse_batches) == (32, 0, False)
+    assert datamodule.max_batch_cost is None and datamodule.cache_dir is None and not datamodule.loader_stats
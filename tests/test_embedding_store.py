@@ -0,0 +1,48 @@
+import numpy as np
+from pigvae.embedding_store import EmbeddingStore, IVFIndex
+from pigvae.benchmarks.embedding_search import clustered_embeddings
+
+
+class BlockReads(object):
+    """Memory-mapped vectors that only allow reads of at most max_rows rows."""
+    def __init__(self, vectors, max_rows):
+        self.vectors = vectors
+        self.max_rows = max_rows
+        self.shape = vectors.shape
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def __array__(self, *args, **kwargs):
+        raise AssertionError("the whole store is loaded")
+
+    def __getitem__(self, idx):
+        out = self.vectors[idx]
+        assert len(out) <= self.max_rows
+        return out
+
+
+def make_store(path, num_vectors=5000, dim=16):
+    embeddings = clustered_embeddings(num_vectors + 50, dim, num_clusters=32)
+    store = EmbeddingStore.create(str(path), dim)
+    store.append(embeddings[50:])
+    return store, embeddings[:50]
+
+
+def test_ivf_build_reads_the_store_in_blocks(tmp_path, monkeypatch):
+    store, queries = make_store(tmp_path / "a")
+    reference = IVFIndex.build(store, num_lists=16, num_train=1000)
+    order, vectors = reference.order.copy(), np.array(reference.vectors)
+    monkeypatch.setattr(EmbeddingStore, "vectors", property(lambda self: BlockReads(self._vectors[:self.count], 1000)))
+    index = IVFIndex.build(store, num_lists=16, num_train=1000, block_size=700)
+    assert np.array_equal(index.order, order)
+    assert np.array_equal(np.array(index.vectors), vectors)
+
+
+def test_ivf_search_with_all_lists_is_exact(tmp_path):
+    store, queries = make_store(tmp_path / "b")
+    index = IVFIndex.build(store, num_lists=16, num_train=1000, block_size=700)
+    idx_exact, scores_exact = store.search(queries, k=5)
+    idx, scores = index.search(queries, k=5, nprobe=16)
+    assert np.array_equal(idx, idx_exact)
+    assert np.allclose(scores, scores_exact, atol=1e-5)
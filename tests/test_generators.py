@@ -0,0 +1,35 @@
+import torch
+import networkx as nx
+from pigvae.synthetic_graphs.generators import validate, binomial_graphs, degrees_and_clustering, ks_statistic
+from pigvae.synthetic_graphs.data import BatchedGraphDataset
+
+# KS statistics of node-level degrees and clustering coefficients for 1000 graphs with 16 nodes. The 5%
+# critical value for independent samples is ~0.015, nodes of the same graph are correlated, so the
+# threshold leaves some margin while a shifted distribution (see below) still exceeds it.
+KS_THRESHOLD = 0.04
+
+
+def test_batched_generators_match_networkx():
+    for result in validate(n=16, num_graphs=1000, seed=0):
+        assert result["degree_ks"] < KS_THRESHOLD, result
+        assert result["clustering_ks"] < KS_THRESHOLD, result
+        assert abs(result["mean_degree"] - result["nx_mean_degree"]) < 0.05 * result["nx_mean_degree"], result
+
+
+def test_ks_statistic_detects_different_distribution():
+    torch.manual_seed(0)
+    num_nodes = torch.full((1000,), 16, dtype=torch.long)
+    adj = binomial_graphs(num_nodes, 0.3)
+    nx_adj = torch.stack([torch.from_numpy(nx.to_numpy_array(nx.binomial_graph(16, 0.36, seed=i)))
+                          for i in range(1000)])
+    degree, _ = degrees_and_clustering(adj, num_nodes)
+    nx_degree, _ = degrees_and_clustering(nx_adj, num_nodes)
+    assert ks_statistic(degree, nx_degree) > KS_THRESHOLD
+
+
+def test_batched_dataset_fixed_num_nodes():
+    for graph_family in ("binomial", "barabasi_albert", "regular", "geometric", "all"):
+        dataset = BatchedGraphDataset(graph_family, batch_size=16, n_min=12, n_max=12, m_min=2, m_max=2)
+        batch = dataset[0]
+        assert (batch.mask.sum(1) == 12).all(), graph_family
+        assert batch.edge_features.shape[:3] == (16, 12, 12)
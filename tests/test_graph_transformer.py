@@ -0,0 +1,78 @@
+import torch
+from pigvae.graph_transformer import Transformer
+
+
+def make_inputs(num_nodes=(9, 5, 2), hidden_dim=16, seed=0):
+    torch.manual_seed(seed)
+    max_num_nodes = max(num_nodes)
+    node_mask = torch.arange(max_num_nodes).unsqueeze(0) < torch.tensor(num_nodes).unsqueeze(1)
+    mask = node_mask.unsqueeze(1) & node_mask.unsqueeze(2)
+    x = torch.randn(len(num_nodes), max_num_nodes, max_num_nodes, hidden_dim)
+    return x, mask
+
+
+def run(attn_chunk_size, online_softmax, x, mask, state_dict=None):
+    torch.manual_seed(0)
+    model = Transformer(hidden_dim=16, k_dim=8, v_dim=8, num_heads=2, ppf_hidden_dim=32, num_layers=2,
+                        attn_chunk_size=attn_chunk_size, online_softmax=online_softmax)
+    if state_dict is not None:
+        model.load_state_dict(state_dict)
+    # no dropout, the paths draw different dropout masks
+    model.eval()
+    x = x.clone().requires_grad_()
+    output = model(x, mask)
+    (output * mask.unsqueeze(-1)).pow(2).sum().backward()
+    grads = {name: p.grad for name, p in model.named_parameters()}
+    return model.state_dict(), output, x.grad, grads
+
+
+def test_chunked_and_online_attention_match_full_attention():
+    x, mask = make_inputs()
+    state_dict, output, x_grad, grads = run(None, False, x, mask)
+    for attn_chunk_size, online_softmax in [(4, False), (4, True), (3, True), (None, True), (1000, True)]:
+        _, output_, x_grad_, grads_ = run(attn_chunk_size, online_softmax, x, mask, state_dict)
+        config = (attn_chunk_size, online_softmax)
+        assert torch.allclose(output_, output, atol=1e-5), config
+        assert torch.allclose(x_grad_, x_grad, atol=1e-4), config
+        for name, grad in grads.items():
+            assert torch.allclose(grads_[name], grad, atol=1e-4), (config, name)
+
+
+def test_online_softmax_without_chunk_size_splits_keys():
+    x, mask = make_inputs(num_nodes=(40, 33))
+    model = Transformer(hidden_dim=16, k_dim=8, v_dim=8, num_heads=2, ppf_hidden_dim=32, num_layers=1,
+                        online_softmax=True)
+    model.eval()
+    attention = model.self_attn_layers[0].attention
+    assert attention.chunk_size is None and attention.key_chunk_size < 40
+    reference = Transformer(hidden_dim=16, k_dim=8, v_dim=8, num_heads=2, ppf_hidden_dim=32, num_layers=1)
+    reference.load_state_dict(model.state_dict())
+    reference.eval()
+    with torch.no_grad():
+        assert torch.allclose(model(x, mask), reference(x, mask), atol=1e-5)
+
+
+def test_padded_rows_skipped_or_computed():
+    # at least three nodes, in two node graphs the queries of the edge have no key and average over all rows
+    x, mask = make_inputs(num_nodes=(9, 5, 3))
+    torch.manual_seed(0)
+    model = Transformer(hidden_dim=16, k_dim=8, v_dim=8, num_heads=2, ppf_hidden_dim=32, num_layers=2).eval()
+    unskipped = Transformer(hidden_dim=16, k_dim=8, v_dim=8, num_heads=2, ppf_hidden_dim=32, num_layers=2,
+                            skip_padded_rows=False).eval()
+    unskipped.load_state_dict(model.state_dict())
+    with torch.no_grad():
+        output, output_unskipped = model(x, mask), unskipped(x, mask)
+    assert torch.allclose(output[mask], output_unskipped[mask], atol=1e-5)
+
+
+def test_unskipped_padded_rows_do_not_sync(monkeypatch):
+    x, mask = make_inputs()
+    model = Transformer(hidden_dim=16, k_dim=8, v_dim=8, num_heads=2, ppf_hidden_dim=32, num_layers=1,
+                        skip_padded_rows=False).eval()
+
+    def sync(*args):
+        raise AssertionError("device to host sync")
+    for name in ("__bool__", "item", "tolist", "cpu", "numpy"):
+        monkeypatch.setattr(torch.Tensor, name, sync)
+    with torch.no_grad():
+        model(x, mask)
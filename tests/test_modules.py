@@ -0,0 +1,212 @@
+import torch
+from pigvae.modules import GraphAE, GraphEncoder, GraphDecoder, Permuter, Permutation
+from pigvae.synthetic_graphs.metrics import Critic
+from pigvae.benchmarks.suite import model_hparams
+from pigvae.benchmarks.precision import make_batch
+from pigvae.benchmarks import encoder_input
+from pigvae.benchmarks.permuter import TopkPermuter, make_inputs, check_parity
+
+
+def make_graph_ae(hidden_dim=32, num_heads=4, num_layers=2, seed=0):
+    torch.manual_seed(seed)
+    hparams = model_hparams(hidden_dim, num_heads, num_layers)
+    return GraphAE(hparams).eval(), Critic(hparams), hparams
+
+
+def two_pass_validation(graph_ae, critic, graph):
+    """Validation step before forward_soft_and_hard: separate forward passes with soft and hard permutation."""
+    metrics = {}
+    for training, prefix in ((True, "val"), (False, "val_hard")):
+        graph_pred, perm, mu, logvar = graph_ae(graph, training=training, tau=1.0)
+        metrics.update(critic.evaluate(graph_true=graph, graph_pred=graph_pred, perm=perm, mu=mu, logvar=logvar,
+                                       prefix=prefix))
+    return metrics
+
+
+def single_pass_validation(graph_ae, critic, graph):
+    (graph_pred, perm, mu, logvar), (graph_pred_hard, perm_hard, _, _) = graph_ae.forward_soft_and_hard(
+        graph=graph, tau=1.0)
+    metrics = critic.evaluate(graph_true=graph, graph_pred=graph_pred, perm=perm, mu=mu, logvar=logvar,
+                              prefix="val")
+    metrics.update(critic.evaluate(graph_true=graph, graph_pred=graph_pred_hard, perm=perm_hard, mu=mu,
+                                   logvar=logvar, prefix="val_hard"))
+    return metrics
+
+
+def test_single_pass_validation_matches_two_passes(monkeypatch):
+    graph_ae, critic, _ = make_graph_ae()
+    graph = make_batch(batch_size=8, n_min=8, n_max=16, seed=0)
+    # the reparametrization and permuter noise are drawn once per pass in the single pass and twice in the
+    # two passes, without noise both have to give the same metrics
+    monkeypatch.setattr(torch, "randn_like", torch.zeros_like)
+    with torch.no_grad():
+        metrics_ref = two_pass_validation(graph_ae, critic, graph)
+        metrics = single_pass_validation(graph_ae, critic, graph)
+    assert metrics.keys() == metrics_ref.keys()
+    assert {"val_loss", "val_hard_loss"} <= metrics.keys()
+    for key, value in metrics_ref.items():
+        assert torch.allclose(torch.as_tensor(metrics[key]), torch.as_tensor(value), rtol=1e-4, atol=1e-5), key
+
+
+def test_single_pass_validation_soft_metrics_with_noise():
+    graph_ae, critic, _ = make_graph_ae()
+    graph = make_batch(batch_size=8, n_min=8, n_max=16, seed=0)
+    # the soft pass comes first in both, with the same seed it draws the same noise
+    with torch.no_grad():
+        torch.manual_seed(0)
+        metrics_ref = two_pass_validation(graph_ae, critic, graph)
+        torch.manual_seed(0)
+        metrics = single_pass_validation(graph_ae, critic, graph)
+    for key, value in metrics_ref.items():
+        if not key.startswith("val_hard"):
+            assert torch.allclose(torch.as_tensor(metrics[key]), torch.as_tensor(value), rtol=1e-4, atol=1e-5), key
+
+
+def concatenated_decoder_message_matrix(decoder, graph_emb, perm, num_nodes):
+    """Reference: fc_in applied to the concatenation of graph_emb and the positional embeddings of both nodes."""
+    pos_emb = decoder.posiotional_embedding(graph_emb.size(0), num_nodes)
+    if perm is not None:
+        pos_emb = torch.matmul(perm, pos_emb)
+    pos_emb_combined = torch.cat(
+        (pos_emb.unsqueeze(2).repeat(1, 1, num_nodes, 1),
+         pos_emb.unsqueeze(1).repeat_interleave(num_nodes, dim=1)),
+        dim=-1)
+    x = graph_emb.unsqueeze(1).unsqueeze(1).expand(-1, num_nodes, num_nodes, -1)
+    x = torch.cat((x, pos_emb_combined), dim=-1)
+    return decoder.layer_norm(decoder.dropout(decoder.fc_in(x)))
+
+
+def test_factorized_encoder_input_matches_concatenation():
+    torch.manual_seed(0)
+    hparams = model_hparams(32, 4, 2)
+    encoder = GraphEncoder(hparams).eval()
+    graph = encoder_input.make_batch(4, 12, hparams["num_node_features"], hparams["num_edge_features"])
+    x, edge_mask = encoder.init_message_matrix(graph.node_features, graph.edge_features, graph.mask)
+    x.pow(2).sum().backward()
+    grad = encoder.fc_in.weight.grad.clone()
+    encoder.zero_grad()
+    x_ref, edge_mask_ref = encoder_input.concatenated_message_matrix(
+        encoder, graph.node_features, graph.edge_features, graph.mask)
+    x_ref.pow(2).sum().backward()
+    assert torch.equal(edge_mask, edge_mask_ref)
+    assert torch.allclose(x, x_ref, atol=1e-5)
+    assert torch.allclose(grad, encoder.fc_in.weight.grad, atol=1e-4)
+
+
+def test_factorized_decoder_input_matches_concatenation():
+    torch.manual_seed(0)
+    hparams = model_hparams(32, 4, 2)
+    decoder = GraphDecoder(hparams).eval()
+    batch_size, num_nodes = 4, 10
+    graph_emb = torch.randn(batch_size, hparams["graph_decoder_hidden_dim"])
+    mask = torch.arange(num_nodes).unsqueeze(0) < torch.tensor([10, 7, 4, 9]).unsqueeze(1)
+    node_features = torch.randn(batch_size, num_nodes, hparams["graph_decoder_hidden_dim"])
+    permuter = Permuter(hparams)
+    perms = {"none": None, "soft": permuter(node_features, mask).matrix.detach()}
+    with torch.no_grad():
+        perms["hard"] = permuter(node_features, mask, hard=True)
+    for name, perm in perms.items():
+        decoder.zero_grad()
+        x = decoder.init_message_matrix(graph_emb, perm, num_nodes)
+        x.pow(2).sum().backward()
+        grad = decoder.fc_in.weight.grad.clone()
+        decoder.zero_grad()
+        perm_matrix = perm.matrix if isinstance(perm, Permutation) else perm
+        x_ref = concatenated_decoder_message_matrix(decoder, graph_emb, perm_matrix, num_nodes)
+        x_ref.pow(2).sum().backward()
+        assert torch.allclose(x, x_ref, atol=1e-5), name
+        assert torch.allclose(grad, decoder.fc_in.weight.grad, atol=1e-4), name
+        # cached positional projections without gradients
+        with torch.no_grad():
+            for _ in range(2):
+                assert torch.allclose(decoder.init_message_matrix(graph_emb, perm, num_nodes), x_ref, atol=1e-5), name
+
+
+def test_positional_projection_cache_per_autocast_dtype():
+    torch.manual_seed(0)
+    decoder = GraphDecoder(model_hparams(32, 4, 1)).eval()
+    with torch.no_grad():
+        with torch.autocast(device_type="cpu", dtype=torch.bfloat16):
+            pos_i_bf16, _ = decoder.positional_projection(10)
+        pos_i, _ = decoder.positional_projection(10)
+        with torch.autocast(device_type="cpu", dtype=torch.bfloat16):
+            assert decoder.positional_projection(10)[0] is pos_i_bf16
+    assert pos_i_bf16.dtype == torch.bfloat16 and pos_i.dtype == torch.float32
+    assert torch.equal(pos_i, decoder.positional_projection(10)[0].detach())
+
+
+def forbid_host_sync(monkeypatch):
+    def sync(*args, **kwargs):
+        raise AssertionError("device to host sync")
+    for name in ("__bool__", "__int__", "__float__", "item", "tolist", "cpu", "numpy"):
+        monkeypatch.setattr(torch.Tensor, name, sync)
+
+
+def make_permuter(seed=0):
+    torch.manual_seed(seed)
+    hparams = model_hparams(32, 4, 1)
+    permuter = Permuter(hparams)
+    reference = TopkPermuter(hparams)
+    reference.load_state_dict(permuter.state_dict())
+    return permuter, reference
+
+
+def test_permuter_matches_topk_reference():
+    permuter, reference = make_permuter()
+    for seed in range(3):
+        node_features, mask = make_inputs(8, 12, 32, "cpu", seed=seed)
+        check_parity(permuter, reference, node_features, mask)
+
+
+def test_index_permutation_matches_matmul():
+    permuter, _ = make_permuter()
+    for seed in range(3):
+        node_features, mask = make_inputs(8, 12, 32, "cpu", seed=seed)
+        with torch.no_grad():
+            perm = permuter(node_features, mask, hard=True)
+        assert perm.is_index
+        matrix = perm.matrix
+        assert torch.equal(matrix.sum(1), torch.ones_like(matrix.sum(1)))
+        assert torch.equal(matrix.sum(2), torch.ones_like(matrix.sum(2)))
+        x = torch.randn(8, 12, 5)
+        edges = torch.randn(8, 12, 12, 3)
+        expected_edges = torch.matmul(torch.matmul(matrix.unsqueeze(1), edges.permute(0, 3, 1, 2)),
+                                      matrix.transpose(1, 2).unsqueeze(1)).permute(0, 2, 3, 1)
+        assert torch.allclose(Permuter.permute_node_features(x, perm), torch.matmul(matrix, x))
+        assert torch.allclose(Permuter.permute_edge_features(edges, perm), expected_edges, atol=1e-6)
+        # the matrix path of the same permutation
+        assert torch.allclose(Permuter.permute_edge_features(edges, matrix), expected_edges, atol=1e-6)
+        # padded nodes keep their position
+        assert torch.equal(perm.ranks[~mask], torch.arange(12).expand(8, 12)[~mask])
+
+
+def test_straight_through_gradient():
+    permuter, _ = make_permuter()
+    node_features, mask = make_inputs(8, 12, 32, "cpu")
+    weight = torch.randn(8, 12, 12)
+    grads = {}
+    for hard in (False, True):
+        permuter.zero_grad()
+        torch.manual_seed(0)
+        perm = permuter(node_features, mask, hard=hard)
+        (perm.matrix * weight).sum().backward()
+        grads[hard] = permuter.scoring_fc.weight.grad.clone()
+        if hard:
+            # value of the hard permutation, gradient of the soft one
+            assert not perm.is_index and perm.matrix.requires_grad
+            assert torch.allclose(perm.matrix, Permuter.one_hot(perm.ranks), atol=1e-6)
+    assert grads[True].abs().sum() > 0
+    assert torch.allclose(grads[True], grads[False], atol=1e-5)
+
+
+def test_permuter_does_not_sync(monkeypatch):
+    permuter, _ = make_permuter()
+    node_features, mask = make_inputs(8, 12, 32, "cpu")
+    edges = torch.randn(8, 12, 12, 3)
+    forbid_host_sync(monkeypatch)
+    for hard in (False, True):
+        for grad in (True, False):
+            with torch.set_grad_enabled(grad):
+                perm = permuter(node_features, mask, hard=hard)
+                Permuter.permute_node_features(node_features, perm)
+                Permuter.permute_edge_features(edges, perm)
@@ -0,0 +1,24 @@
+import torch
+from pigvae.modules import GraphAE
+from pigvae.synthetic_graphs.metrics import Critic
+from pigvae.benchmarks.suite import model_hparams
+from pigvae.benchmarks.precision import make_batch, check_parity
+
+# relative difference of each loss term and minimum gradient cosine similarity to fp32
+LOSS_TOLERANCE = 0.01
+GRAD_COSINE = 0.99
+
+
+def test_bf16_autocast_matches_fp32_on_cpu():
+    for seed in range(2):
+        torch.manual_seed(seed)
+        hparams = model_hparams(32, 4, 2)
+        graph_ae, critic = GraphAE(hparams).train(), Critic(hparams)
+        graph = make_batch(batch_size=8, n_min=8, n_max=16, seed=seed)
+        parity = check_parity(graph_ae, critic, graph, torch.bfloat16)
+        grad_cosine = parity.pop("grad_cosine")
+        assert grad_cosine > GRAD_COSINE, (seed, grad_cosine)
+        for key, value in parity.items():
+            assert value < LOSS_TOLERANCE, (seed, key, value)
+        # the autocast region did run in reduced precision
+        assert parity["loss"] > 0
@@ -0,0 +1,58 @@
+import numpy as np
+from pigvae.synthetic_graphs.data import RegularGraphDataset, BarabasiAlbertGraphDataset
+from pigvae.synthetic_graphs.sampler import NodeCountBatchSampler
+
+
+def batches(sampler):
+    return [[idx for idx, _ in batch] for batch in sampler]
+
+
+def test_every_index_once_within_cost():
+    dataset = RegularGraphDataset(n_min=12, n_max=20, samples_per_epoch=1000)
+    sampler = NodeCountBatchSampler(dataset, max_cost=20 * 20 ** 3, chunk_size=256)
+    indices = []
+    for batch in sampler:
+        sizes = [n for _, n in batch]
+        assert len(batch) * max(sizes) ** 3 <= 20 * 20 ** 3
+        assert all(12 <= n < 20 for n in sizes)
+        indices.extend(idx for idx, _ in batch)
+    assert sorted(indices) == list(range(1000))
+
+
+def test_fixed_num_nodes():
+    dataset = BarabasiAlbertGraphDataset(n_min=16, n_max=16, m_min=2, m_max=2, samples_per_epoch=100)
+    sampler = NodeCountBatchSampler(dataset, max_cost=10 * 16 ** 3)
+    sizes = [n for batch in sampler for _, n in batch]
+    assert sizes == [16] * 100
+    assert sampler.padding_efficiency == 1.0
+    assert dataset[(0, 16)].number_of_nodes() == 16
+    assert dataset[0].number_of_nodes() == 16
+
+
+def test_seed_and_epoch():
+    dataset = RegularGraphDataset(n_min=12, n_max=20, samples_per_epoch=500)
+    sampler = NodeCountBatchSampler(dataset, max_cost=20 * 20 ** 3, seed=0)
+    epoch_0 = batches(sampler)
+    assert batches(sampler) == epoch_0
+    sampler.set_epoch(1)
+    epoch_1 = batches(sampler)
+    assert epoch_1 != epoch_0
+    other_seed = NodeCountBatchSampler(dataset, max_cost=20 * 20 ** 3, seed=1)
+    assert batches(other_seed) not in (epoch_0, epoch_1)
+
+
+def test_padding_efficiency_per_epoch():
+    dataset = RegularGraphDataset(n_min=12, n_max=20, samples_per_epoch=500)
+    sampler = NodeCountBatchSampler(dataset, max_cost=20 * 20 ** 3)
+    batches(sampler)
+    num_pairs, num_padded_pairs = sampler.num_pairs, sampler.num_padded_pairs
+    assert 0 < sampler.padding_efficiency <= 1
+    batches(sampler)
+    assert (sampler.num_pairs, sampler.num_padded_pairs) == (num_pairs, num_padded_pairs)
+
+
+def test_len_estimate():
+    dataset = RegularGraphDataset(n_min=12, n_max=20, samples_per_epoch=5000)
+    sampler = NodeCountBatchSampler(dataset, max_cost=20 * 20 ** 3, chunk_size=1024)
+    num_batches = len(batches(sampler))
+    assert abs(len(sampler) - num_batches) <= 0.1 * num_batches
@@ -0,0 +1,49 @@
+import torch
+from pigvae.modules import GraphAE
+from pigvae.sampling import GraphSampler
+from pigvae.benchmarks.suite import model_hparams
+
+
+def make_graph_ae(num_nodes_mean=16.0, num_nodes_std=4.0):
+    torch.manual_seed(0)
+    hparams = model_hparams(32, 4, 1)
+    hparams.update(num_nodes_mean=num_nodes_mean, num_nodes_std=num_nodes_std)
+    return GraphAE(hparams).eval()
+
+
+def test_predict_num_nodes_within_positional_encoding():
+    graph_ae = make_graph_ae()
+    max_num_nodes = graph_ae.decoder.posiotional_embedding.pos_table.size(1)
+    props = torch.tensor([-100.0, 0.0, 1.0, 1000.0])
+    assert graph_ae.predict_num_nodes(props).tolist() == [1, 16, 20, max_num_nodes]
+
+
+def test_sampler_predicts_properties_once():
+    graph_ae = make_graph_ae()
+    calls = []
+    graph_ae.property_predictor.register_forward_hook(lambda module, input, output: calls.append(len(input[0])))
+    sampler = GraphSampler(graph_ae, batch_size=8)
+    graphs = list(sampler.sample(20, torch.Generator().manual_seed(0)))
+    assert len(graphs) == 20
+    assert calls == [20]
+    assert all(1 <= graph.number_of_nodes() for graph in graphs)
+
+
+def test_sampler_matches_decode():
+    graph_ae = make_graph_ae()
+    z = torch.randn(6, graph_ae.bottle_neck_decoder.d_in)
+    sampler = GraphSampler(graph_ae, batch_size=6, output="adjacency")
+    num_nodes = sorted(len(a) for a in sampler.decode(z))
+    with torch.no_grad():
+        graph_pred = graph_ae.decode(z, None)
+    assert num_nodes == sorted(graph_pred.mask.sum(1).tolist())
+
+
+def test_sampler_yields_outside_inference_mode():
+    graph_ae = make_graph_ae()
+    sampler = GraphSampler(graph_ae, batch_size=4)
+    weight = torch.ones(1, requires_grad=True)
+    for graph in sampler.sample(8, torch.Generator().manual_seed(0)):
+        assert torch.is_grad_enabled() and not torch.is_inference_mode_enabled()
+        (weight * graph.number_of_nodes()).sum().backward()
+    assert weight.grad.item() > 0
@@ -0,0 +1,23 @@
+import torch
+from pigvae.modules import GraphAE
+from pigvae.serving import load_graph_ae
+from pigvae.benchmarks.suite import model_hparams
+
+
+class AttributeDict(dict):
+    """Stands in for Lightning's AttributeDict, a class that torch.load(weights_only=True) refuses."""
+    def __getattr__(self, key):
+        return self[key]
+
+
+def test_load_graph_ae_from_lightning_checkpoint(tmp_path):
+    torch.manual_seed(0)
+    hparams = AttributeDict(model_hparams(32, 4, 1))
+    graph_ae = GraphAE(hparams)
+    state_dict = {"graph_ae." + key: value for key, value in graph_ae.state_dict().items()}
+    state_dict["critic.dummy"] = torch.zeros(1)
+    torch.save({"hyper_parameters": hparams, "state_dict": state_dict, "epoch": 3}, tmp_path / "last.ckpt")
+    loaded = load_graph_ae(str(tmp_path / "last.ckpt"), map_location="cpu")
+    assert not loaded.training
+    for key, value in graph_ae.state_dict().items():
+        assert torch.equal(loaded.state_dict()[key], value), key
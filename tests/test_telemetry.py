@@ -0,0 +1,20 @@
+import time
+from pigvae.synthetic_graphs.telemetry import LoaderTelemetry
+
+
+def test_wait_excludes_paused_work():
+    telemetry = LoaderTelemetry()
+    telemetry.start_step(None)
+    telemetry.end_step()
+    # e.g. validation and checkpointing between two training steps
+    telemetry.pause()
+    time.sleep(0.1)
+    telemetry.resume()
+    telemetry.start_step(None)
+    telemetry.end_step()
+    # e.g. an epoch boundary, the next wait is not measured
+    telemetry.pause()
+    time.sleep(0.1)
+    telemetry.start_step(None)
+    assert len(telemetry.values["wait_s"]) == 1
+    assert telemetry.summary()["wait_s/max"] < 0.05